@@ -0,0 +1,222 @@
+"""
+Batch analysis of positions by a Spawn player. Positions are cols played
+from empty board, one per line, read from a file or stdin as a stream.
+Worker processes keep their search between positions, so tables stay warm.
+Results are written as JSONL in input order, with a bounded number of
+positions in flight:
+    python analysis.py iterative:8 positions.txt -o results.jsonl
+    cat positions.txt | python analysis.py confidence:5000 --workers 4
+"""
+import argparse
+import collections
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+from board import Board
+from game import Game
+from player import Spawn
+from tree import IterativeDeepeningTree, MonteCarloTree
+from tournament import parse_entrant
+
+
+def search_value(search, board, col):
+    """Return value of col at board from point of view of player to move,
+    after search explored board. Value is evaluation of alpha beta trees,
+    win share of Monte Carlo trees, score of solver, value of book if col
+    is col of book. None if search has none."""
+    book = getattr(search, 'book', None)
+    if book is not None:
+        entry = book.lookup(board)
+        if entry is not None and entry[0] == col:
+            return entry[1]
+    tree = getattr(search, 'tree', None)
+    if isinstance(tree, IterativeDeepeningTree):
+        symmitem = tree.table.get_symm_item(board)
+        if symmitem is not None and symmitem[1] is not None:
+            return symmitem[1][0]
+        return None
+    if isinstance(tree, MonteCarloTree):
+        # root parallel search keeps items merged from workers
+        key_items = getattr(search, 'key_items', None)
+        if key_items is None:
+            key_items = tree.children_key_items(board)
+        for key, wins, sims in key_items:
+            if key == col:
+                return wins / sims
+        return None
+    return dict(search.key_values).get(col)
+
+
+class AnalysisGame(Game):
+    """Untimed game of board alone, for strategy of a search. Players are
+    not reset, so searches keep their tables."""
+
+    def __init__(self, board):
+        self.board = board
+
+def parse_position(line):
+    """Return board after cols of line. Raise ValueError if line is not
+    cols or plays a full col or past end of game."""
+    board = Board()
+    for char in line.strip():
+        if char not in '0123456':
+            raise ValueError('not a col: {!r}'.format(char))
+        col = int(char)
+        if board.is_terminal():
+            raise ValueError('game over before col {}'.format(col))
+        if col not in board.open_keys:
+            raise ValueError('col {} is full'.format(col))
+        board.push(col)
+    if board.is_terminal():
+        raise ValueError('game over')
+    return board
+
+
+class Analyst:
+    """
+    Search of player kept between positions. Table is cleared when larger
+    than max entries, bounding memory of long runs. Positions in opening
+    book at path book are answered by it.
+    """
+
+    def __init__(self, name, strategy_args=(), stats=False,
+                 max_entries=2**20, book=None):
+        if name not in Spawn.players or name == 'user':
+            raise ValueError('unknown player: {}'.format(name))
+        self.name = name
+        self.strategy_args = tuple(strategy_args)
+        if book is not None:
+            # book imports this module
+            from book import OpeningBook
+            book = OpeningBook(book)
+        self.book = book
+        self.search = Spawn.get_search(name, None, None, book=book)
+        self.stats = self.search.enable_stats() if stats else None
+        self.max_entries = max_entries
+
+    def analyze(self, index, line):
+        """Return dict of analysis of position on line: best col, its value
+        for player to move, see search_value, strategy args such as depth,
+        and seconds. Invalid lines give error."""
+        record = {'index': index, 'moves': line.strip()}
+        try:
+            board = parse_position(line)
+        except ValueError as error:
+            record['error'] = str(error)
+            return record
+        random.seed(index)
+        if self.stats is not None:
+            self.stats.reset()
+        t0 = time.perf_counter()
+        self.search.strategy(AnalysisGame(board), self.strategy_args)
+        record['seconds'] = time.perf_counter() - t0
+        # ties center first, analysis is repeatable
+        best = min(self.search.most_valuable, key=lambda col: abs(col - 3))
+        record['best'] = best
+        record['value'] = search_value(self.search, board, best)
+        names = Spawn.strategy_args.get(self.name, ())
+        record.update(zip(names, self.strategy_args))
+        if hasattr(self.search, 'depth'):
+            # time searches complete fewer depths
+            record['depth'] = self.search.depth
+        if self.stats is not None:
+            record['stats'] = self.stats.summary()
+        self.bound()
+        return record
+
+    def close(self):
+        self.search.close()
+        if self.book is not None:
+            self.book.close()
+
+    def bound(self):
+        table = getattr(getattr(self.search, 'tree', None), 'table', None)
+        if table is not None and len(table) > self.max_entries:
+            for moves in range(43):
+                table.clear_moves(moves)
+
+
+# analyst of worker process, made by pool initializer
+worker_analyst = None
+
+def start_analyst(args, options):
+    global worker_analyst
+    worker_analyst = Analyst(*args, **options)
+
+def analyze_line(index, line):
+    return worker_analyst.analyze(index, line)
+
+def analyze_stream(lines, name, strategy_args=(), workers=1, stats=False,
+                   window=None, book=None):
+    """Yield analysis records of lines in order. Workers above 1 analyze in
+    a pool, at most window lines in flight, default 4 per worker. Book is
+    path of opening book, see Analyst. Raise ValueError if workers above 1
+    and player starts processes, see Spawn.starts_processes."""
+    if workers > 1 and Spawn.starts_processes(name, strategy_args):
+        raise ValueError('{} starts processes, analyze with 1 worker'.format(
+            name))
+    args = (name, strategy_args, stats)
+    options = {'book': book}
+    if workers <= 1:
+        analyst = Analyst(*args, **options)
+        try:
+            for index, line in enumerate(lines):
+                yield analyst.analyze(index, line)
+        finally:
+            analyst.close()
+        return
+    window = window or 4 * workers
+    with multiprocessing.Pool(workers, start_analyst,
+                              (args, options)) as pool:
+        pending = collections.deque()
+        for index, line in enumerate(lines):
+            if len(pending) >= window:
+                yield pending.popleft().get()
+            pending.append(pool.apply_async(analyze_line, (index, line)))
+        while pending:
+            yield pending.popleft().get()
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog, description=__doc__.split('\n')[1])
+    parser.add_argument('player', type=parse_entrant,
+                        help='player name and strategy args, e.g. '
+                             'iterative:8')
+    parser.add_argument('positions', nargs='?', default='-',
+                        help='file of positions, default stdin')
+    parser.add_argument('-o', '--output', default='-',
+                        help='JSONL file of results, default stdout')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='processes, 1 for players starting their own, '
+                             'e.g. lazysmp:6,2')
+    parser.add_argument('--window', type=int,
+                        help='positions in flight, default 4 per worker')
+    parser.add_argument('--stats', action='store_true',
+                        help='add search stats of each position')
+    parser.add_argument('--book', help='opening book answering positions '
+                                       'in it, see book.py')
+    args = parser.parse_args(argv)
+    name, strategy_args = args.player
+    if args.workers > 1 and Spawn.starts_processes(name, strategy_args):
+        parser.error('{} starts processes, use --workers 1'.format(name))
+    source = (sys.stdin if args.positions == '-'
+              else open(args.positions))
+    sink = sys.stdout if args.output == '-' else open(args.output, 'w')
+    try:
+        for record in analyze_stream(source, name, strategy_args,
+                                     args.workers, args.stats, args.window,
+                                     args.book):
+            sink.write(json.dumps(record) + '\n')
+            sink.flush()
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if sink is not sys.stdout:
+            sink.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,1006 @@
+"""
+Benchmarks of board and search throughput. Run all benchmarks, name some, or
+run the core suite. Results are printed, or written as JSON with environment
+info. Thresholds in a JSON file fail the run when a result misses them:
+    python benchmark.py
+    python benchmark.py push_pop win_check
+    python benchmark.py --core --json results.json --thresholds limits.json
+Thresholds map benchmark name to result name to minimum, or to dict with
+keys 'min' and/or 'max'.
+"""
+import argparse
+import gc
+import json
+import numpy as np
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from board import Board, BitBoard
+from simulation import (Simulation, Simulator, BitSimulation,
+                        HeavySimulation, BatchSimulation)
+from table import BoundedTable, SharedTable
+from tree import (IterativeDeepeningTree, UpperConfidenceBoundTree, SolverTree,
+                  LazySMPTree, TimeIterativeDeepeningTree,
+                  PoolUpperConfidenceBoundTree)
+from search import (RootParallelMonteCarloTreeSearch, LazySMPTreeSearch,
+                    MonteCarloTreeSearch)
+from clock import Clock
+from records import GameWriter, GameReader, replay
+from selfplay import SelfPlay
+from tablebase import Tablebase, build as build_tablebase, cut_games
+from book import OpeningBook, book_positions, build as build_book
+from ordering import MoveOrdering
+from player import Player, Spawn
+from game import Game, TimeGame
+
+# fixed positions as cols played from empty board
+positions = ['', '3', '33', '2433', '332244', '3322445', '33324452']
+# fixed positions for solver, from ply 12
+solver_positions = ['364206400563', '433554514064', '331026642011',
+                    '60522614200460', '636302433662', '0033010430640266',
+                    '424651044512045040', '41354362343221615610',
+                    '6311230624536630055022462362131455']
+
+
+def random_games(n, seed=0):
+    """Return list of n random games as cols played, each until end state."""
+    rng = random.Random(seed)
+    result = []
+    for _ in range(n):
+        board = Board()
+        cols = []
+        while not board.is_terminal():
+            col = rng.choice(list(board.open_keys))
+            board.push(col)
+            cols.append(col)
+        result.append(cols)
+    return result
+
+def random_boards(n, board_cls=Board, seed=0):
+    """Return list of n boards, each a nonterminal prefix of a random game."""
+    rng = random.Random(seed)
+    result = []
+    for cols in random_games(n, seed):
+        board = board_cls()
+        for col in cols[:rng.randrange(len(cols))]:
+            board.push(col)
+        result.append(board)
+    return result
+
+def board_from_cols(cols, board_cls=Board):
+    """Return board after playing cols, a str of digits."""
+    board = board_cls()
+    for col in cols:
+        board.push(int(col))
+    return board
+
+def rate(count, seconds):
+    """Return count per second."""
+    return count / seconds if seconds else float('inf')
+
+################
+## Benchmarks ##
+################
+
+def push_pop(n=2000):
+    """Push every col of random games, then pop all. Return push pop pairs
+    per second for each board class."""
+    games = random_games(n)
+    result = {}
+    for board_cls in (Board, BitBoard):
+        count = 0
+        t0 = time.perf_counter()
+        for cols in games:
+            board = board_cls()
+            for col in cols:
+                board.push(col)
+            for _ in cols:
+                board.pop()
+            count += len(cols)
+        result[board_cls.__name__] = rate(count, time.perf_counter() - t0)
+    return result
+
+def win_check(n=2000, repeat=20):
+    """Call set_winner on boards late in random games. Return checks per
+    second for each board class."""
+    games = [cols[:-1] for cols in random_games(n) if len(cols) > 8]
+    result = {}
+    for board_cls in (Board, BitBoard):
+        boards = []
+        for cols in games:
+            board = board_cls()
+            for col in cols:
+                board.push(col)
+            boards.append(board)
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            for board in boards:
+                board.set_winner()
+        seconds = time.perf_counter() - t0
+        result[board_cls.__name__] = rate(repeat * len(boards), seconds)
+    return result
+
+def playouts(n=2000):
+    """Play random games from random boards. Return playouts per second for
+    each simulation class."""
+    result = {}
+    for board_cls, simulation_cls in ((Board, Simulation),
+                                      (BitBoard, BitSimulation)):
+        boards = random_boards(n, board_cls)
+        t0 = time.perf_counter()
+        for board in boards:
+            simulation_cls(board)
+        seconds = time.perf_counter() - t0
+        result[simulation_cls.__name__] = rate(n, seconds)
+    return result
+
+def base3_values(board):
+    """Return pair of base 3 hash and symm values of board, as hashed before
+    fixed width keys."""
+    hash_value = symm_value = 0
+    for key, value in enumerate(board.values):
+        if value:
+            col, row = divmod(key, 6)
+            hash_value += value * 3**key
+            symm_value += value * 3**(6 * (6 - col) + row)
+    return hash_value, symm_value
+
+def table_lookup(n=20000, repeat=5):
+    """Fill dict with positions of random games, then look up each. Compare
+    base 3 keys probed twice, as hash and symm, with one canonical key probe.
+    Return lookups per second and bytes per entry, dict and key ints."""
+    boards = []
+    for cols in random_games(n // 20):
+        board = Board()
+        for col in cols:
+            board.push(col)
+            boards.append(Board(list(board.values), list(board.played_keys),
+                                None, None, board.hash_value,
+                                board.symm_value))
+    result = {}
+
+    base3 = [base3_values(board) for board in boards]
+    tracemalloc.start()
+    table = dict.fromkeys((hash_value for hash_value, _ in base3), 0)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    size += sum(sys.getsizeof(key) for key in table)
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for hash_value, symm_value in base3:
+            for value in (hash_value, symm_value):
+                if value in table:
+                    table[value]
+                    break
+    seconds = time.perf_counter() - t0
+    result['base3 lookups'] = rate(repeat * len(base3), seconds)
+    result['base3 bytes'] = size / len(table)
+    del table
+
+    tracemalloc.start()
+    table = dict.fromkeys((board.canonical_value for board in boards), 0)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    size += sum(sys.getsizeof(key) for key in table)
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for board in boards:
+            table.get(board.canonical_value)
+    seconds = time.perf_counter() - t0
+    result['canonical lookups'] = rate(repeat * len(boards), seconds)
+    result['canonical bytes'] = size / len(table)
+    return result
+
+def batch_playouts(n=100, games=100, iterations=200, batch=64):
+    """Play games random games from each of n random boards, one by one with
+    Simulation and all at once with BatchSimulation. Then explore with
+    UpperConfidenceBoundTree from empty board, one and batch playouts per
+    expanded leaf. Return playouts per second."""
+    boards = random_boards(n)
+    result = {}
+    t0 = time.perf_counter()
+    for board in boards:
+        for _ in range(games):
+            Simulation(board)
+    result['Simulation'] = rate(n * games, time.perf_counter() - t0)
+    t0 = time.perf_counter()
+    BatchSimulation(boards, games)
+    result['BatchSimulation'] = rate(n * games, time.perf_counter() - t0)
+    for playouts in (1, batch):
+        tree = UpperConfidenceBoundTree(playouts=playouts)
+        t0 = time.perf_counter()
+        tree.explore(Board(), iterations * batch // playouts)
+        seconds = time.perf_counter() - t0
+        name = 'tree {} per leaf'.format(playouts)
+        result[name] = rate(iterations * batch, seconds)
+    return result
+
+class CountingBoard(Board):
+    """Board counting pushes, i.e. nodes visited by search."""
+
+    nodes = 0
+
+    def push(self, col):
+        CountingBoard.nodes += 1
+        super().push(col)
+
+class ScanBoard(CountingBoard):
+    """Counting board evaluated by full scan of slices."""
+
+    def update_slice_codes(self, key, increment):
+        pass
+
+    def evaluation(self):
+        return self.scan_evaluation()
+
+def evaluation(depth=8):
+    """Iteratively deepen principal explore to depth from each fixed
+    position. Compare evaluation by full scan with incremental score. Return
+    nodes per second and seconds."""
+    result = {}
+    for board_cls in (ScanBoard, CountingBoard):
+        name = 'scan' if board_cls is ScanBoard else 'incremental'
+        CountingBoard.nodes = 0
+        t0 = time.perf_counter()
+        for cols in positions:
+            board = board_from_cols(cols, board_cls)
+            tree = IterativeDeepeningTree()
+            for d in range(1, depth+1):
+                tree.principal_explore(board, d)
+        seconds = time.perf_counter() - t0
+        result[name + ' nodes/s'] = rate(CountingBoard.nodes, seconds)
+        result[name + ' seconds'] = seconds
+    return result
+
+class CountingTree(IterativeDeepeningTree):
+    """Tree counting nodes searched, excluding pushes to order children."""
+
+    nodes = 0
+
+    def principal_cutoff_test(self, board, depth, beta, alpha=-10000):
+        CountingTree.nodes += 1
+        return super().principal_cutoff_test(board, depth, beta, alpha)
+
+    def cutoff_test(self, board, depth, beta, alpha=-10000):
+        CountingTree.nodes += 1
+        return super().cutoff_test(board, depth, beta, alpha)
+
+def move_ordering(depths=(8, 10)):
+    """Iteratively deepen principal explore to each depth from each fixed
+    position, children ordered by evaluation and by MoveOrdering. Return
+    nodes searched and seconds."""
+    result = {}
+    for depth in depths:
+        for ordering in (None, MoveOrdering()):
+            name = '{} {} '.format('evaluation' if ordering is None
+                                   else 'history', depth)
+            CountingTree.nodes = 0
+            t0 = time.perf_counter()
+            for cols in positions:
+                board = board_from_cols(cols)
+                if ordering is not None:
+                    ordering.clear()
+                tree = CountingTree(ordering=ordering)
+                for d in range(1, depth+1):
+                    tree.principal_explore(board, d)
+            result[name + 'seconds'] = time.perf_counter() - t0
+            result[name + 'nodes'] = CountingTree.nodes
+    return result
+
+def principal_variation(depths=(6, 8, 10), aspiration=30):
+    """Iteratively deepen each fixed position to max depth, plain, with pvs,
+    aspiration windows, and both. Aspiration guess is value two depths less,
+    as in IterativeDeepeningTreeSearch. Return nodes and seconds summed over
+    positions when each depth completes."""
+    modes = (('plain', {}), ('pvs', {'pvs': True}),
+             ('aspiration', {'aspiration': aspiration}),
+             ('pvs aspiration', {'pvs': True, 'aspiration': aspiration}))
+    result = {}
+    for name, kwargs in modes:
+        nodes = dict.fromkeys(depths, 0)
+        seconds = dict.fromkeys(depths, 0)
+        for cols in positions:
+            board = board_from_cols(cols)
+            tree = CountingTree(**kwargs)
+            CountingTree.nodes = 0
+            values = [None, None]
+            t0 = time.perf_counter()
+            for d in range(1, max(depths)+1):
+                values.append(tree.aspiration_explore(board, d, values[-2]))
+                if d in nodes:
+                    nodes[d] += CountingTree.nodes
+                    seconds[d] += time.perf_counter() - t0
+        for d in depths:
+            result['{} {} nodes'.format(name, d)] = nodes[d]
+            result['{} {} seconds'.format(name, d)] = seconds[d]
+    return result
+
+def bounded_table(depth=9, megabytes=(1, 16)):
+    """Iteratively deepen principal explore to depth from each fixed position
+    with SymmetryTable and BoundedTable of each size. Return seconds, table
+    megabytes, and for bounded tables fill ratio, hit rate, overwrites."""
+    def search(table):
+        tree = IterativeDeepeningTree(table=table)
+        for cols in positions:
+            board = board_from_cols(cols)
+            tree.table.clear_moves(board.moves() - 1)
+            for d in range(1, depth+1):
+                tree.principal_explore(board, d)
+
+    result = {}
+    t0 = time.perf_counter()
+    search(None)
+    result['dict seconds'] = time.perf_counter() - t0
+    # trace separately, tracing slows search
+    tracemalloc.start()
+    search(None)
+    result['dict megabytes'] = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+    for mb in megabytes:
+        name = '{}MB'.format(mb)
+        table = BoundedTable(mb)
+        t0 = time.perf_counter()
+        search(table)
+        result[name + ' seconds'] = time.perf_counter() - t0
+        stats = table.stats()
+        result[name + ' megabytes'] = 16 * table.capacity / 2**20
+        result[name + ' fill ratio'] = stats['fill_ratio']
+        result[name + ' hit rate'] = stats['hit_rate']
+        result[name + ' overwrites'] = stats['overwrites']
+    return result
+
+def solver():
+    """Solve each fixed solver position and its children with a new
+    SolverTree. Return nodes and seconds for each, and nodes per second."""
+    result = {}
+    nodes = seconds = 0
+    for cols in solver_positions:
+        board = board_from_cols(cols)
+        tree = SolverTree()
+        t0 = time.perf_counter()
+        tree.explore(board)
+        t = time.perf_counter() - t0
+        result[cols + ' nodes'] = tree.nodes
+        result[cols + ' seconds'] = t
+        nodes += tree.nodes
+        seconds += t
+    result['nodes/s'] = rate(nodes, seconds)
+    return result
+
+def root_parallel(iterations=4000, seconds=.05, games=4,
+                  workers=(1, 2, 4, 8)):
+    """Explore empty board with root parallel search over each number of
+    workers. Then play games against single process search, both limited to
+    seconds per move, colors alternating. Return playouts per second and win
+    rate, draws count half."""
+    result = {}
+    for n in workers:
+        search = RootParallelMonteCarloTreeSearch(UpperConfidenceBoundTree())
+        # warm pool before timing
+        search.explore(Board(), (n, n))
+        t0 = time.perf_counter()
+        search.explore(Board(), (iterations, n))
+        seconds_explore = time.perf_counter() - t0
+        search.close()
+        result['{} workers playouts/s'.format(n)] = rate(iterations,
+                                                         seconds_explore)
+    for n in workers:
+        if n == 1:
+            continue
+        parallel = RootParallelMonteCarloTreeSearch(UpperConfidenceBoundTree(),
+                                                    seconds)
+        single = RootParallelMonteCarloTreeSearch(UpperConfidenceBoundTree(),
+                                                  seconds)
+        players = [Player('parallel', parallel, (10**6, n)),
+                   Player('single', single, (10**6, 1))]
+        score = 0
+        for i in range(games):
+            game = Game(Board(), *players[::1 if i % 2 else -1])
+            winner = game.play()
+            if winner == 0:
+                score += .5
+            elif game.player1 is players[0] and winner == 1:
+                score += 1
+            elif game.player2 is players[0] and winner == 2:
+                score += 1
+        parallel.close()
+        result['{} workers win rate'.format(n)] = score / games
+    return result
+
+def lazy_smp(depth=8, megabytes=16, workers=(1, 2, 4, 8)):
+    """Search each fixed position to depth with Lazy SMP over each number of
+    workers, new shared table per number. Return seconds to reach depth and
+    nodes per second of all processes."""
+    result = {}
+    for n in workers:
+        search = LazySMPTreeSearch(LazySMPTree(SharedTable(megabytes)))
+        # warm pool before timing
+        search.explore(Board(), (1, n))
+        nodes = seconds = 0
+        for cols in positions:
+            board = board_from_cols(cols)
+            search.tree.table.clear_moves(board.moves() - 1)
+            t0 = time.perf_counter()
+            search.explore(board, (depth, n))
+            seconds += time.perf_counter() - t0
+            nodes += search.nodes
+        search.close()
+        result['{} workers seconds'.format(n)] = seconds
+        result['{} workers nodes/s'.format(n)] = rate(nodes, seconds)
+    return result
+
+def time_control(depth=8, iterations=5000, t=4, repeat=3):
+    """Deepen fixed positions to depth without clock, and with untimed
+    clock checked every node and every 256 nodes. Likewise explore empty
+    board without clock, and with clock every playout and every 16. Best
+    seconds of repeats. Then play time game of t seconds each, iterative
+    deepening against UCT. Return seconds, and for each player share of
+    budget used on average and most of hard budget used by one move."""
+    def deepen(check):
+        for cols in positions:
+            board = board_from_cols(cols)
+            if check is None:
+                tree = IterativeDeepeningTree()
+            else:
+                tree = TimeIterativeDeepeningTree(check_nodes=check)
+                tree.clock = Clock()
+                tree.clock.start(None, board.moves())
+            for d in range(1, depth+1):
+                tree.principal_explore(board, d)
+
+    def grow(check):
+        tree = UpperConfidenceBoundTree()
+        random.seed(0)
+        if check is None:
+            tree.explore(Board(), iterations)
+        else:
+            tree.check_playouts = check
+            tree.explore(Board(), iterations, float('inf'))
+
+    result = {}
+    for fn, prefix, checks in ((deepen, 'id', (None, 1, 256)),
+                               (grow, 'uct', (None, 1, 16))):
+        for check in checks:
+            name = 'no clock' if check is None else 'check {}'.format(check)
+            seconds = []
+            for _ in range(repeat):
+                gc.collect()
+                t0 = time.perf_counter()
+                fn(check)
+                seconds.append(time.perf_counter() - t0)
+            result['{} {} seconds'.format(prefix, name)] = min(seconds)
+    players = [Spawn.get_player('idtime', (42,)),
+               Spawn.get_player('ucttime', (10**7,))]
+    TimeGame(Board(), *players, t=t).play()
+    for player in players:
+        history = player.search.clock.history
+        used = sum(u for _, _, u in history) / sum(b for b, _, _ in history)
+        result[player.name + ' budget used'] = used
+        result[player.name + ' max hard used'] = max(u / h
+                                                     for _, h, u in history)
+    return result
+
+class KeepAllSearch(MonteCarloTreeSearch):
+    """Search keeping all table entries between moves."""
+
+    def advance(self, board):
+        pass
+
+def tree_reuse(iterations=300, games=10):
+    """Play games of UCT with fixed iterations per move, reusing its tree
+    against starting each move empty, colors alternating. Then play one game
+    of UCT against itself, pruned at each move and keeping all entries.
+    Return win rate of reuse, draws count half, mean fraction of entries
+    retained by pruning, and most entries kept between moves and peak traced
+    megabytes during game."""
+    result = {}
+    score = 0
+    retained = []
+    for i in range(games):
+        random.seed(i)
+        players = [Player('reuse', MonteCarloTreeSearch(
+                              UpperConfidenceBoundTree()), (iterations,)),
+                   Player('fresh', MonteCarloTreeSearch(
+                              UpperConfidenceBoundTree(), False),
+                          (iterations,))]
+        game = Game(Board(), *players[::1 if i % 2 else -1])
+        winner = game.play()
+        if winner == 0:
+            score += .5
+        elif [game.player1, game.player2][winner-1] is players[0]:
+            score += 1
+        retained.extend(players[0].search.retained)
+    result['reuse win rate'] = score / games
+    result['retained fraction'] = (sum(after / before for before, after
+                                       in retained if before)
+                                   / len(retained))
+    for name, search_cls in (('pruned', MonteCarloTreeSearch),
+                             ('keep all', KeepAllSearch)):
+        random.seed(0)
+        search = search_cls(UpperConfidenceBoundTree())
+        player = Player(name, search, (iterations,))
+        game = Game(Board(), player, player)
+        entries = 0
+        tracemalloc.start()
+        while not game.board.is_terminal():
+            game.take_turn()
+            entries = max(entries, len(search.tree.table))
+        result[name + ' kept entries'] = entries
+        result[name + ' megabytes'] = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+    return result
+
+def node_pool(iterations=20000):
+    """Explore empty board with UCT, nodes in SymmetryTable lists and in
+    NodePool. Return playouts per second and traced peak bytes per node,
+    i.e. megabytes per million nodes. Pool also reports bytes of its columns
+    and index."""
+    result = {}
+    for name, tree_cls in (('table', UpperConfidenceBoundTree),
+                           ('pool', PoolUpperConfidenceBoundTree)):
+        random.seed(0)
+        tree = tree_cls()
+        t0 = time.perf_counter()
+        tree.explore(Board(), iterations)
+        result[name + ' playouts/s'] = rate(iterations,
+                                            time.perf_counter() - t0)
+        # trace separately, tracing slows search
+        random.seed(0)
+        gc.collect()
+        tracemalloc.start()
+        tree = tree_cls()
+        tree.explore(Board(), iterations)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        result[name + ' bytes/node'] = peak / len(tree.table)
+        if name == 'pool':
+            result['pool column bytes/node'] = (tree.table.nbytes()
+                                                / len(tree.table))
+    return result
+
+class ScanUpperConfidenceBoundTree(UpperConfidenceBoundTree):
+    """Tree selecting by pushing each child and probing table for its
+    stats, log of parent sims per child."""
+
+    def bandit(self, board, item):
+        parent_sims = self.table[board][1]
+        key_items = self.children_key_items(board)
+        return max(key_items,
+                   key=lambda keyitem:
+                   self.upper_confidence_bound1(*keyitem[1:], parent_sims))[0]
+
+def ucb_selection(iterations=(10000, 100000), descents=20000):
+    """Explore empty board with UCT selecting by scanning children, by
+    child links, and by NodePool links, each number of iterations. Return
+    playouts per second. Then from tree of fewest iterations, time descents
+    of selection alone. Return descents per second."""
+    trees = (('scan', ScanUpperConfidenceBoundTree),
+             ('links', UpperConfidenceBoundTree),
+             ('pool', PoolUpperConfidenceBoundTree))
+    result = {}
+    for n in iterations:
+        for name, tree_cls in trees:
+            random.seed(0)
+            tree = tree_cls()
+            t0 = time.perf_counter()
+            tree.explore(Board(), n)
+            result['{} {} playouts/s'.format(name, n)] = rate(
+                n, time.perf_counter() - t0)
+    for name, tree_cls in trees:
+        random.seed(0)
+        tree = tree_cls()
+        board = Board()
+        tree.explore(board, min(iterations))
+        t0 = time.perf_counter()
+        if tree_cls is PoolUpperConfidenceBoundTree:
+            pool = tree.table
+            root = pool.find(board)
+            for _ in range(descents):
+                node = root
+                depth = 0
+                while pool.expanded[node]:
+                    col = tree.bandit(board, node)
+                    node = pool.child(board, node, col)
+                    board.push(col)
+                    depth += 1
+                for _ in range(depth):
+                    board.pop()
+        else:
+            for _ in range(descents):
+                for _ in range(tree.select(board)):
+                    board.pop()
+        result[name + ' descents/s'] = rate(descents,
+                                            time.perf_counter() - t0)
+    return result
+
+def match(players, games):
+    """Play games between pair of players made by given functions, colors
+    alternating, seeded by game. Return score of first, draws count half."""
+    score = 0
+    for i in range(games):
+        random.seed(i)
+        pair = [new_player() for new_player in players]
+        game = Game(Board(), *pair[::1 if i % 2 else -1])
+        winner = game.play()
+        if winner == 0:
+            score += .5
+        elif [game.player1, game.player2][winner-1] is pair[0]:
+            score += 1
+    return score / games
+
+def rave(iterations=300, seconds=.05, games=20):
+    """Play games of rave against confidence, equal playouts per move and
+    equal seconds per move. Return rave win rates, draws count half, and
+    playouts per second of each from empty board."""
+    result = {}
+    for name, args in (('playouts', (iterations,)),
+                       ('time', (10**6, seconds))):
+        players = (lambda: Spawn.get_player('rave', args),
+                   lambda: Spawn.get_player('confidence', args))
+        result['equal {} win rate'.format(name)] = match(players, games)
+    for name in ('rave', 'confidence'):
+        random.seed(0)
+        tree = Spawn.players[name][1]()
+        t0 = time.perf_counter()
+        tree.explore(Board(), 10 * iterations)
+        result[name + ' playouts/s'] = rate(10 * iterations,
+                                            time.perf_counter() - t0)
+    return result
+
+def heavy_playouts(n=2000, seconds=.05, games=20):
+    """Play random games from random boards with light and heavy
+    simulations. Return playouts per second. Then play games of
+    heavyconfidence against confidence at equal seconds per move. Return
+    heavy win rate, draws count half."""
+    result = {}
+    boards = random_boards(n)
+    for simulation_cls in (Simulation, BitSimulation, HeavySimulation):
+        t0 = time.perf_counter()
+        for board in boards:
+            simulation_cls(board)
+        result[simulation_cls.__name__ + ' playouts/s'] = rate(
+            n, time.perf_counter() - t0)
+    args = (10**6, seconds)
+    players = (lambda: Spawn.get_player('heavyconfidence', args),
+               lambda: Spawn.get_player('confidence', args))
+    result['equal time win rate'] = match(players, games)
+    return result
+
+def playout_engine(n=2000, repeat=5):
+    """Play random games from random boards with a new Simulation each and
+    with one reused Simulator. Return best playouts per second of repeats and
+    mean bytes traced at peak of each playout, above memory held before it."""
+    result = {}
+    boards = random_boards(n)
+    simulator = Simulator()
+    engines = (('Simulation', lambda board: Simulation(board).winner),
+               ('Simulator', simulator.run))
+    for name, run in engines:
+        best = float('inf')
+        for _ in range(repeat):
+            gc.collect()
+            t0 = time.perf_counter()
+            for board in boards:
+                run(board)
+            best = min(best, time.perf_counter() - t0)
+        result[name + ' playouts/s'] = rate(n, best)
+        tracemalloc.start()
+        peak = 0
+        for board in boards:
+            tracemalloc.reset_peak()
+            current = tracemalloc.get_traced_memory()[0]
+            run(board)
+            peak += tracemalloc.get_traced_memory()[1] - current
+        tracemalloc.stop()
+        result[name + ' bytes/playout'] = peak / n
+    return result
+
+def perft_count(board, depth):
+    """Return number of boards depth pushes from board. Terminal boards end
+    their line early and count once."""
+    if not depth or board.is_terminal():
+        return 1
+    count = 0
+    for col in list(board.open_keys):
+        board.push(col)
+        count += perft_count(board, depth-1)
+        board.pop()
+    return count
+
+def perft(depth=6):
+    """Count boards to depth from empty board by push and pop. Return count
+    and nodes per second for each board class."""
+    result = {}
+    for board_cls in (Board, BitBoard):
+        name = board_cls.__name__
+        board = board_cls()
+        t0 = time.perf_counter()
+        count = perft_count(board, depth)
+        result['{} perft({})'.format(name, depth)] = count
+        result[name + ' nodes/s'] = rate(count, time.perf_counter() - t0)
+    return result
+
+def search_speed(depth=8):
+    """Iteratively deepen principal explore to depth from each fixed
+    position, one new tree each. Return nodes per second and total seconds
+    to reach each depth."""
+    result = {}
+    CountingTree.nodes = 0
+    seconds = [0.0] * (depth+1)
+    for cols in positions:
+        board = board_from_cols(cols)
+        tree = CountingTree()
+        t0 = time.perf_counter()
+        for d in range(1, depth+1):
+            tree.principal_explore(board, d)
+            seconds[d] += time.perf_counter() - t0
+    result['nodes'] = CountingTree.nodes
+    result['nodes/s'] = rate(CountingTree.nodes, seconds[depth])
+    for d in range(1, depth+1):
+        result['seconds to depth {}'.format(d)] = seconds[d]
+    return result
+
+def uct_iterations(iterations=5000):
+    """Explore each fixed position by a new UpperConfidenceBoundTree. Return
+    iterations per second."""
+    random.seed(0)
+    t0 = time.perf_counter()
+    for cols in positions:
+        tree = UpperConfidenceBoundTree()
+        tree.explore(board_from_cols(cols), iterations)
+    seconds = time.perf_counter() - t0
+    return {'iterations/s': rate(iterations * len(positions), seconds)}
+
+def game_records(n=10**6, games=1000):
+    """Write n records of random games, cycling through given number of
+    games, then read all and replay games into boards. Return games per
+    second of each and bytes per game."""
+    result = {}
+    cols = random_games(games)
+    winners = [board_from_cols(''.join(map(str, c))).winner for c in cols]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'games.c4gr')
+        t0 = time.perf_counter()
+        with GameWriter(path) as writer:
+            players = writer.player_id('first'), writer.player_id('second')
+            for i in range(n):
+                writer.write(cols[i % games], winners[i % games], *players)
+        result['write games/s'] = rate(n, time.perf_counter() - t0)
+        result['bytes/game'] = os.path.getsize(path) / n
+        t0 = time.perf_counter()
+        with GameReader(path) as reader:
+            for record in reader:
+                pass
+        result['read games/s'] = rate(n, time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        with GameReader(path) as reader:
+            for _, record in zip(range(games), reader):
+                replay(record)
+        result['replay games/s'] = rate(games, time.perf_counter() - t0)
+    return result
+
+def self_play(games=40, depth=3, workers=(1, 2, 4)):
+    """Generate self-play positions of iterative at depth with each number
+    of workers. Return positions per second and share written after
+    dedupe."""
+    result = {}
+    for n in workers:
+        with tempfile.TemporaryDirectory() as directory:
+            counts = SelfPlay([('iterative', (depth,))], directory, games,
+                              workers=n).run()
+        name = '{} workers'.format(n)
+        result[name + ' positions/s'] = counts['positions/s']
+        result[name + ' written share'] = (counts['written']
+                                           / counts['positions'])
+    return result
+
+def endgame_tablebase(empties=10, cut=12, games=100, depth=6, n=10**5):
+    """Build tablebase of random games cut at cut empty cells, time n probes
+    of keys in it and not, then search boards of other random games cut at
+    cut to depth, and play random games from them, with and without
+    tablebase. Return build time, size, probe latency, nodes, playouts per
+    second and hit rates, out of sample."""
+    result = {}
+    cols = random_games(games)
+    # boards not of games building tablebase
+    boards = list(cut_games(random_games(games, seed=1), cut))
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'endgame.c4tb')
+        counts = build_tablebase(path, cols, empties, cut)
+        result['positions'] = counts['positions']
+        result['build seconds'] = counts['seconds']
+        result['bytes/position'] = counts['bytes'] / counts['positions']
+        with Tablebase(path) as tablebase:
+            keys = [tablebase.keys[i % len(tablebase)] for i in range(n)]
+            for name, probe_keys in (('hit', keys),
+                                     ('miss', [k + 1 for k in keys])):
+                t0 = time.perf_counter()
+                for key in probe_keys:
+                    tablebase.probe_key(key)
+                result[name + ' probe us'] = rate(
+                    10**6 * (time.perf_counter() - t0), n)
+            for name, base in (('without', None), ('with', tablebase)):
+                name += ' tablebase '
+                tablebase.probes = tablebase.hits = 0
+                CountingTree.nodes = 0
+                t0 = time.perf_counter()
+                for board in boards:
+                    tree = CountingTree(tablebase=base)
+                    for d in range(1, depth+1):
+                        tree.principal_explore(board, d)
+                result[name + 'nodes'] = CountingTree.nodes
+                result[name + 'search seconds'] = time.perf_counter() - t0
+                if base is not None:
+                    result['search hit rate'] = tablebase.summary()[
+                        'hit rate']
+                tablebase.probes = tablebase.hits = 0
+                simulator = Simulator()
+                t0 = time.perf_counter()
+                for board in boards * 20:
+                    simulator.run(board, base)
+                result[name + 'playouts/s'] = rate(
+                    20 * len(boards), time.perf_counter() - t0)
+                if base is not None:
+                    result['playout hit rate'] = tablebase.summary()[
+                        'hit rate']
+    return result
+
+def opening_book(plies=2, depth=6, n=10**5):
+    """Build book of boards up to plies by iterative at depth, time n
+    lookups of boards in it and past it, then time moves of iterative at
+    depth from each board of book, with and without book. Return build time,
+    size, lookup latency and seconds of moves."""
+    result = {}
+    lines = book_positions(plies)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'opening.c4ob')
+        counts = build_book(path, plies, 'iterative', (depth,))
+        result['positions'] = counts['positions']
+        result['build seconds'] = counts['seconds']
+        result['bytes'] = counts['bytes']
+        with OpeningBook(path) as book:
+            for name, cols in (('hit', lines[-1]),
+                               ('miss', lines[-1] + '33')):
+                board = board_from_cols(cols)
+                t0 = time.perf_counter()
+                for _ in range(n):
+                    book.lookup(board)
+                result[name + ' lookup us'] = rate(
+                    10**6 * (time.perf_counter() - t0), n)
+            for name, base in (('without', None), ('with', book)):
+                t0 = time.perf_counter()
+                for cols in lines:
+                    player = Spawn.get_player('iterative', (depth,),
+                                              book=base)
+                    player.move(Game(board_from_cols(cols)))
+                result[name + ' book move seconds'] = (time.perf_counter()
+                                                       - t0)
+    return result
+
+# map benchmark name (str) to function returning dict of rates
+benchmarks = {}
+benchmarks['push_pop'] = push_pop
+benchmarks['win_check'] = win_check
+benchmarks['playouts'] = playouts
+benchmarks['table_lookup'] = table_lookup
+benchmarks['evaluation'] = evaluation
+benchmarks['batch_playouts'] = batch_playouts
+benchmarks['move_ordering'] = move_ordering
+benchmarks['principal_variation'] = principal_variation
+benchmarks['bounded_table'] = bounded_table
+benchmarks['solver'] = solver
+benchmarks['root_parallel'] = root_parallel
+benchmarks['lazy_smp'] = lazy_smp
+benchmarks['time_control'] = time_control
+benchmarks['tree_reuse'] = tree_reuse
+benchmarks['node_pool'] = node_pool
+benchmarks['ucb_selection'] = ucb_selection
+benchmarks['rave'] = rave
+benchmarks['heavy_playouts'] = heavy_playouts
+benchmarks['playout_engine'] = playout_engine
+benchmarks['perft'] = perft
+benchmarks['search_speed'] = search_speed
+benchmarks['uct_iterations'] = uct_iterations
+benchmarks['game_records'] = game_records
+benchmarks['self_play'] = self_play
+benchmarks['endgame_tablebase'] = endgame_tablebase
+benchmarks['opening_book'] = opening_book
+
+# benchmarks comparable across versions, fast enough to run on each change
+core = ['perft', 'playouts', 'search_speed', 'uct_iterations']
+
+
+def report(name, result):
+    print(name)
+    width = max(24, *(len(key) for key in result))
+    for key, value in result.items():
+        precision = 2 if abs(value) < 100 and type(value) is float else 0
+        print('    {:<{}} {:>14,.{}f}'.format(key, width, value, precision))
+
+def environment():
+    """Return dict describing machine, interpreter and code benchmarked."""
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+    return {'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'cpus': os.cpu_count(),
+            'commit': commit or None,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S%z')}
+
+def check(results, thresholds):
+    """Return list of str, one per result outside its threshold. Missing
+    results fail."""
+    failures = []
+    for name, limits in thresholds.items():
+        for key, limit in limits.items():
+            if not isinstance(limit, dict):
+                limit = {'min': limit}
+            value = results.get(name, {}).get(key)
+            if value is None:
+                failures.append('{} {}: missing'.format(name, key))
+                continue
+            if 'min' in limit and value < limit['min']:
+                failures.append('{} {}: {} below {}'.format(
+                    name, key, value, limit['min']))
+            if 'max' in limit and value > limit['max']:
+                failures.append('{} {}: {} above {}'.format(
+                    name, key, value, limit['max']))
+    return failures
+
+def run(names, thresholds=None, quiet=False):
+    """Run benchmarks of names, report each unless quiet. Return dict of
+    environment, results by name and failures of thresholds, see check."""
+    results = {}
+    for name in names:
+        results[name] = benchmarks[name]()
+        if not quiet:
+            report(name, results[name])
+    failures = check(results, thresholds) if thresholds else []
+    return {'environment': environment(), 'results': results,
+            'failures': failures}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('names', nargs='*', metavar='name',
+                        help='benchmarks, default all')
+    parser.add_argument('--core', action='store_true',
+                        help='run core suite: ' + ' '.join(core))
+    parser.add_argument('--json', metavar='PATH',
+                        help='write results as JSON, - for stdout')
+    parser.add_argument('--thresholds', metavar='PATH',
+                        help='JSON file of limits, exit 1 if any missed')
+    args = parser.parse_args()
+    for name in args.names:
+        if name not in benchmarks:
+            parser.error('unknown benchmark: {}'.format(name))
+    names = args.names or (core if args.core else list(benchmarks))
+    thresholds = None
+    if args.thresholds:
+        with open(args.thresholds) as f:
+            thresholds = json.load(f)
+    output = run(names, thresholds, quiet=args.json == '-')
+    if args.json == '-':
+        json.dump(output, sys.stdout, indent=2)
+        print()
+    elif args.json:
+        with open(args.json, 'w') as f:
+            json.dump(output, f, indent=2)
+    failures = output['failures']
+    for failure in failures:
+        print('FAIL', failure, file=sys.stderr)
+    sys.exit(1 if failures else 0)
@@ -14,6 +14,14 @@ class Board:
     winner_slices = [[] for _ in range(42)]
     # map key index to radial slices with center at position
     winner_slices_last_key = [[] for _ in range(42)]
+    # map key index to indices of slices containing that position
+    key_slice_indices = [[] for _ in range(42)]
+
+    # slice code is 5 * count of player 1 + count of player 2
+    # map code to value of slice for player 1, see evaluation
+    code_values = [0]*25
+    # map code increment to list mapping code to change in value
+    code_diffs = {}
 
     def __init__(self, values=None, played_keys=None, open_keys=None,
                  winner=None, hash_value=0, symm_value=0):
@@ -23,7 +31,8 @@ class Board:
         or played by player 2. All keys decompose to played and open. Winner
         is None during play; 0, 1, or 2 at end of play. Hash value is unique
         to current state of board. Symm value is hash value for symmetric board
-        i.e. reflected left right.
+        i.e. reflected left right. Canonical value is min of both, equal for
+        board and its reflection.
         """
         if values is None:
             values = [0]*42
@@ -37,6 +46,19 @@ class Board:
         self.winner = winner
         self.hash_value = hash_value
         self.symm_value = symm_value
+        self.canonical_value = min(hash_value, symm_value)
+        self.set_slice_codes()
+
+    def set_slice_codes(self):
+        """Set code of each slice and score, sum of slice values for player
+        1. Both updated incrementally by push and pop."""
+        values = self.values
+        self.slice_codes = [0]*len(self.slices)
+        self.score = 0
+        for i, s in enumerate(self.slices):
+            code = sum(5 if values[k] == 1 else 1 for k in s if values[k])
+            self.slice_codes[i] = code
+            self.score += self.code_values[code]
 
     ## State methods ##
 
@@ -65,6 +87,28 @@ class Board:
         """Return True if winner exists."""
         return self.winner is not None
 
+    def bitboards(self):
+        """Return pair of bitboards: current player mask and occupied mask.
+        Key in col, row sets bit 7 * col + row. Top bit of each col is never
+        set."""
+        position = mask = 0
+        turn = self.turn()
+        for key in self.played_keys:
+            bit = 1 << (key + key // 6)
+            mask |= bit
+            if self.values[key] == turn:
+                position |= bit
+        return position, mask
+
+    @classmethod
+    def from_board(cls, board):
+        """Return new board of this class with same played keys as given
+        board."""
+        result = cls()
+        for key in board.played_keys:
+            result.push(key // 6)
+        return result
+
     ## Play methods ###
 
     def push(self, col):
@@ -76,21 +120,30 @@ class Board:
         assert self.values[key] == 0
         self.values[key] = self.turn()
         # turn is function of number of moves i.e. len of played_keys
-        self.hash_value += HashBoard.hash_item(key, self.turn())
+        h = self.hash_value = self.hash_value + HashBoard.hash_item(
+            key, self.turn())
         symm_key = 6 * (6 - col) + key % 6
-        self.symm_value += HashBoard.hash_item(symm_key, self.turn())
+        s = self.symm_value = self.symm_value + HashBoard.hash_item(
+            symm_key, self.turn())
+        self.canonical_value = h if h < s else s
         self.played_keys.append(key)
+        self.update_slice_codes(key, 5 if self.values[key] == 1 else 1)
         self.set_winner()
 
     def pop(self):
         """Undo play of last key. Update attributes."""
         last_key = self.played_keys.pop()
+        self.update_slice_codes(last_key,
+                                -5 if self.values[last_key] == 1 else -1)
         self.values[last_key] = 0
         self.winner = None
-        self.hash_value -= HashBoard.hash_item(last_key, self.turn())
+        h = self.hash_value = self.hash_value - HashBoard.hash_item(
+            last_key, self.turn())
         last_col, last_row = divmod(last_key, 6)
         symm_key = 6 * (6 - last_col) + last_row
-        self.symm_value -= HashBoard.hash_item(symm_key, self.turn())
+        s = self.symm_value = self.symm_value - HashBoard.hash_item(
+            symm_key, self.turn())
+        self.canonical_value = h if h < s else s
         try:
             self.open_keys[last_col].append(last_key)
         except KeyError:
@@ -123,6 +176,17 @@ class Board:
         if self.moves() == 42:
             self.winner = 0
 
+    def update_slice_codes(self, key, increment):
+        """Add increment to code of slices containing key. Update score."""
+        codes = self.slice_codes
+        diffs = self.code_diffs[increment]
+        score = self.score
+        for i in self.key_slice_indices[key]:
+            code = codes[i]
+            score += diffs[code]
+            codes[i] = code + increment
+        self.score = score
+
     ## Tree methods ##
 
     def utility(self):
@@ -137,7 +201,12 @@ class Board:
             + 100 * diff of num of 3 of 4-in-a-rows
             +  10 * diff of num of 2 of 4-in-a-rows
             +   1 * diff of num of 1 of 4-in-a-rows.
+        Score kept by push and pop, so O(1).
         """
+        return self.score if len(self.played_keys) % 2 == 0 else -self.score
+
+    def scan_evaluation(self):
+        """Return evaluation by counting values of every slice."""
         diff = [0]*4
         for s in self.slices:
             counter = [0]*3
@@ -240,6 +309,16 @@ class Board:
         """Return reflection of given col over vertical axis."""
         return 6 - col
 
+    def is_canonical(self):
+        """Return True if board hashes to canonical value, i.e. board is not
+        reflection of stored board in symmetry table."""
+        return self.hash_value == self.canonical_value
+
+    def canonical_col(self, col):
+        """Return col relative to canonical board. Reflection is own inverse,
+        so also maps canonical col back to board."""
+        return col if self.hash_value == self.canonical_value else 6 - col
+
     def key_to_col(self, key):
         return key // 6
 
@@ -272,18 +351,33 @@ for s in slices:
         for x in t:
             Board.winner_slices[x].append(t)
 
+Board.key_slice_indices = [[] for _ in range(42)]
+for i, s in enumerate(Board.slices):
+    for x in s:
+        Board.key_slice_indices[x].append(i)
+
+for code in range(25):
+    count1, count2 = divmod(code, 5)
+    if count1 and not count2:
+        Board.code_values[code] = 10**(count1-1)
+    elif count2 and not count1:
+        Board.code_values[code] = -10**(count2-1)
+for increment in (5, 1, -5, -1):
+    Board.code_diffs[increment] = [
+        Board.code_values[code+increment] - Board.code_values[code]
+        if 0 <= code+increment < 25 else 0 for code in range(25)]
+
 class HashBoard:
 
-    # map k to [3**k, 3**k+1, 3**k+2] for 0 <= k < len(values)
+    # map key to [0, 2 * bit, bit], bit is 1 << (7 * col + row) as in BitBoard.
+    # Hash is mask of played keys plus mask of player one keys. Each col with
+    # n played keys sums to less than 2 ** (n + 1), so no carry between cols
+    # and hash is unique, fixed width, less than 2 ** 49.
     table = [[0]*3 for _ in range(42)]
 
-    m = 1
     for i in range(42):
-        c = m
-        for j in range(1, 3):
-            table[i][j] = c
-            c += m
-        m = c
+        table[i][1] = 2 << (i + i // 6)
+        table[i][2] = 1 << (i + i // 6)
 
     @classmethod
     def hash(cls, board):
@@ -292,7 +386,7 @@ class HashBoard:
 
     @classmethod
     def hash_values(cls, values):
-        """Hash values as base 3 integer. Return hash value."""
+        """Hash values as sum of items. Return hash value."""
         return sum(cls.hash_item(key, values[key]) for key in range(42))
 
     @classmethod
@@ -300,3 +394,198 @@ class HashBoard:
         """Use table to hash key value pair. Total hash is linear
         combination."""
         return cls.table[key][turn]
+
+class BitBoard(Board):
+
+    # 6  13 20 27 34 41 48
+    # 5  12 19 26 33 40 47
+    # 4  11 18 25 32 39 46
+    # 3  10 17 24 31 38 45
+    # 2  9  16 23 30 37 44
+    # 1  8  15 22 29 36 43
+    # 0  7  14 21 28 35 42
+
+    # bit of lowest key in each col
+    bottom_mask = sum(1 << 7*col for col in range(7))
+    # bits of all keys, top row of bits is buffer for shifts
+    board_mask = bottom_mask * 63
+    # vertical, horizontal, diagonal down and up shifts, each with bits of
+    # first keys of 4-in-a-row slices in that direction
+    directions = []
+
+    def __init__(self, position=0, mask=0, played_keys=None, open_keys=None,
+                 winner=None, hash_value=0, symm_value=0):
+        """
+        Board stored as two bitboards. Position has bits of current player,
+        mask has bits of both players. Keys, open keys, winner and hash values
+        same as Board. Key 6 * col + row maps to bit 7 * col + row.
+        """
+        if played_keys is None:
+            played_keys = []
+            open_keys = {i:[j for j in range(6*(i+1)-1, 6*i-1, -1)]
+                         for i in range(7)}
+            winner = None
+        self.position = position
+        self.mask = mask
+        self.played_keys = played_keys
+        self.open_keys = open_keys
+        self.winner = winner
+        self.hash_value = hash_value
+        self.symm_value = symm_value
+        self.canonical_value = min(hash_value, symm_value)
+
+    @property
+    def values(self):
+        """Return values list as in Board. Computed from bitboards."""
+        result = [0]*42
+        turn = self.turn()
+        for key in self.played_keys:
+            bit = 1 << (key + key // 6)
+            result[key] = turn if self.position & bit else 3 - turn
+        return result
+
+    def bitboards(self):
+        return self.position, self.mask
+
+    ## Play methods ###
+
+    def push(self, col):
+        """Assert col is open, play bottom most key in col. Switch position
+        to opponent bits. Update attributes."""
+        key = self.open_keys[col].pop()
+        if not self.open_keys[col]:
+            del self.open_keys[col]
+        turn = self.turn()
+        h = self.hash_value = self.hash_value + HashBoard.hash_item(key, turn)
+        symm_key = 6 * (6 - col) + key % 6
+        s = self.symm_value = self.symm_value + HashBoard.hash_item(
+            symm_key, turn)
+        self.canonical_value = h if h < s else s
+        self.position ^= self.mask
+        self.mask |= 1 << (key + col)
+        self.played_keys.append(key)
+        self.set_winner()
+
+    def pop(self):
+        """Undo play of last key. Update attributes."""
+        last_key = self.played_keys.pop()
+        last_col, last_row = divmod(last_key, 6)
+        self.mask ^= 1 << (last_key + last_col)
+        self.position ^= self.mask
+        self.winner = None
+        turn = self.turn()
+        h = self.hash_value = self.hash_value - HashBoard.hash_item(
+            last_key, turn)
+        symm_key = 6 * (6 - last_col) + last_row
+        s = self.symm_value = self.symm_value - HashBoard.hash_item(
+            symm_key, turn)
+        self.canonical_value = h if h < s else s
+        try:
+            self.open_keys[last_col].append(last_key)
+        except KeyError:
+            self.open_keys[last_col] = [last_key]
+
+    def set_winner(self):
+        """Check if board at end state. Bits of player that last played are
+        shifted onto themselves in each direction, a 4-in-a-row leaves a bit
+        after two shifts. Set winner to player or 0 if draw."""
+        if len(self.played_keys) < 7:
+            return
+        if self.alignment(self.position ^ self.mask):
+            self.winner = self.other()
+        elif len(self.played_keys) == 42:
+            self.winner = 0
+
+    ## Tree methods ##
+
+    def evaluation(self):
+        """Return evaluation as in Board, counted from bitboards. Push and
+        pop keep no slice codes, so playouts and solver pay nothing for
+        it."""
+        position = self.position
+        opponent = position ^ self.mask
+        return (self.slice_value(position, opponent)
+                - self.slice_value(opponent, position))
+
+    @classmethod
+    def slice_value(cls, position, opponent):
+        """Return sum over slices with no bits of opponent of 10 to the
+        number of bits of position less one. Counts of slices are added
+        bitwise, in bits of first keys of slices."""
+        result = 0
+        for d, starts in cls.directions:
+            free = starts & ~(opponent | opponent >> d | opponent >> 2*d
+                              | opponent >> 3*d)
+            x0 = position & free
+            x1 = (position >> d) & free
+            x2 = (position >> 2*d) & free
+            x3 = (position >> 3*d) & free
+            # count is s0 + 2 * s1 + 4 * s2
+            a = x0 ^ x1
+            b = x2 ^ x3
+            c = x0 & x1
+            e = x2 & x3
+            f = a & b
+            s0 = a ^ b
+            s1 = c ^ e ^ f
+            s2 = (c & e) | (f & (c | e))
+            result += ((s0 & ~(s1 | s2)).bit_count()
+                       + 10 * (s1 & ~s0).bit_count()
+                       + 100 * (s0 & s1).bit_count()
+                       + 1000 * s2.bit_count())
+        return result
+
+    @staticmethod
+    def threats(position, mask):
+        """Return bits of open keys completing 4-in-a-row for position."""
+        # vertical
+        r = (position << 1) & (position << 2) & (position << 3)
+        # horizontal
+        p = (position << 7) & (position << 14)
+        r |= p & (position << 21)
+        r |= p & (position >> 7)
+        p = (position >> 7) & (position >> 14)
+        r |= p & (position << 7)
+        r |= p & (position >> 21)
+        # diagonal down
+        p = (position << 6) & (position << 12)
+        r |= p & (position << 18)
+        r |= p & (position >> 6)
+        p = (position >> 6) & (position >> 12)
+        r |= p & (position << 6)
+        r |= p & (position >> 18)
+        # diagonal up
+        p = (position << 8) & (position << 16)
+        r |= p & (position << 24)
+        r |= p & (position >> 8)
+        p = (position >> 8) & (position >> 16)
+        r |= p & (position << 8)
+        r |= p & (position >> 24)
+        return r & (BitBoard.board_mask ^ mask)
+
+    @staticmethod
+    def alignment(bits):
+        """Return True if bits contain 4-in-a-row."""
+        # vertical
+        m = bits & (bits >> 1)
+        if m & (m >> 2):
+            return True
+        # horizontal
+        m = bits & (bits >> 7)
+        if m & (m >> 14):
+            return True
+        # diagonal down
+        m = bits & (bits >> 6)
+        if m & (m >> 12):
+            return True
+        # diagonal up
+        m = bits & (bits >> 8)
+        if m & (m >> 16):
+            return True
+        return False
+
+for d in (1, 7, 6, 8):
+    BitBoard.directions.append((d, BitBoard.board_mask
+                                & (BitBoard.board_mask >> d)
+                                & (BitBoard.board_mask >> 2*d)
+                                & (BitBoard.board_mask >> 3*d)))
@@ -0,0 +1,109 @@
+"""
+Opening book of best cols of distinct boards up to a number of plies,
+mirror boards collapsed to one canonical key. Each board is analyzed by a
+Spawn player of integer values, alpha beta or solver, in worker processes.
+Book is a sorted file of canonical key, canonical best col and value,
+memory mapped and consulted by searches before searching, see book_move:
+    python book.py opening.c4ob --plies 4 --player iterative:8
+    python book.py opening.c4ob --plies 6 --player pvsiterative:10 \\
+        --workers 4
+"""
+import argparse
+import json
+import os
+import time
+
+from analysis import analyze_stream, parse_position
+from board import Board
+from tablebase import SortedFile
+from tournament import parse_entrant
+
+
+class OpeningBook(SortedFile):
+    """
+    Best col and its value for player to move of boards up to plies moves.
+    Cols are stored relative to canonical board. Probes and hits are
+    counted.
+    """
+
+    magic = b'C4OB'
+    # best canonical col, value
+    fields = ('b', 'h')
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.plies = self.param
+        self.cols, self.values = self.columns
+        self.probes = self.hits = 0
+
+    def lookup(self, board):
+        """Return best col of board and its value, None if board has more
+        moves than plies or is not in book."""
+        if board.moves() > self.plies:
+            return None
+        self.probes += 1
+        i = self.index(board.canonical_value)
+        if i is None:
+            return None
+        self.hits += 1
+        return board.canonical_col(self.cols[i]), self.values[i]
+
+    def summary(self):
+        return {'probes': self.probes, 'hits': self.hits,
+                'hit rate': self.hits / self.probes if self.probes else 0.0}
+
+
+def book_positions(plies):
+    """Return list of cols, as str, of one board of each canonical key up
+    to plies moves, in order of moves."""
+    result = ['']
+    frontier = ['']
+    keys = {Board().canonical_value}
+    for _ in range(plies):
+        level = []
+        for line in frontier:
+            board = parse_position(line)
+            for col in list(board.open_keys):
+                board.push(col)
+                if (board.canonical_value not in keys
+                        and not board.is_terminal()):
+                    keys.add(board.canonical_value)
+                    level.append(line + str(col))
+                board.pop()
+        result.extend(level)
+        frontier = level
+    return result
+
+def build(path, plies, name='iterative', strategy_args=(8,), workers=1):
+    """Analyze boards up to plies by player and write book. Return dict of
+    positions, seconds and bytes of file. Raise ValueError if player values
+    are not ints."""
+    t0 = time.perf_counter()
+    records = {}
+    for record in analyze_stream(book_positions(plies), name, strategy_args,
+                                 workers):
+        if type(record['value']) is not int:
+            raise ValueError('values of {} are not ints'.format(name))
+        board = parse_position(record['moves'])
+        records[board.canonical_value] = (board.canonical_col(record['best']),
+                                          record['value'])
+    OpeningBook.write(path, plies, records)
+    return {'positions': len(records),
+            'seconds': time.perf_counter() - t0,
+            'bytes': os.path.getsize(path)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('path', help='book file to write')
+    parser.add_argument('--plies', type=int, default=4,
+                        help='moves of boards in book')
+    parser.add_argument('--player', type=parse_entrant,
+                        default=('iterative', (8,)),
+                        help='player name and strategy args, e.g. '
+                             'iterative:8')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+    name, strategy_args = args.player
+    print(json.dumps(build(args.path, args.plies, name, strategy_args,
+                           args.workers)))
@@ -0,0 +1,57 @@
+import time
+
+class Clock:
+    """
+    Allocate time of each move from remaining time of player and number of
+    moves played. Budget is remaining time shared among own moves expected
+    to be left. Searches start no new iteration after soft deadline, the end
+    of budget, and abort after hard deadline, a multiple of budget capped by
+    share of remaining time. Untimed games have no deadlines.
+    """
+
+    def __init__(self, min_moves=4, hard_ratio=3, max_share=.5, margin=.05):
+        """Expect at least min_moves own moves left. Keep margin seconds of
+        remaining time unused, for overhead outside search."""
+        self.min_moves = min_moves
+        self.hard_ratio = hard_ratio
+        self.max_share = max_share
+        self.margin = margin
+        self.start_time = 0
+        self.budget = self.hard_budget = float('inf')
+        self.soft_deadline = self.hard_deadline = float('inf')
+        # list of tuples: budget, hard budget, seconds used
+        self.history = []
+
+    def start(self, remaining, moves):
+        """Start clock of move given remaining seconds, None if untimed, and
+        number of moves played on board."""
+        self.start_time = time.perf_counter()
+        if remaining is None:
+            self.budget = self.hard_budget = float('inf')
+        else:
+            usable = max(remaining - self.margin, 0)
+            own_moves = max(self.min_moves, (43 - moves) // 2)
+            self.budget = usable / own_moves
+            self.hard_budget = min(self.hard_ratio * self.budget,
+                                   self.max_share * usable)
+        self.soft_deadline = self.start_time + self.budget
+        self.hard_deadline = self.start_time + self.hard_budget
+
+    def stop(self):
+        """Record and return seconds used by move."""
+        used = self.elapsed()
+        self.history.append((self.budget, self.hard_budget, used))
+        return used
+
+    def elapsed(self):
+        return time.perf_counter() - self.start_time
+
+    def fits(self, seconds):
+        """Return True if seconds more end before hard deadline."""
+        return time.perf_counter() + seconds < self.hard_deadline
+
+    def soft_expired(self):
+        return time.perf_counter() > self.soft_deadline
+
+    def hard_expired(self):
+        return time.perf_counter() > self.hard_deadline
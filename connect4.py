@@ -1,6 +1,16 @@
+"""
+Play Connect Four interactively, or analyze positions in batch:
+    python connect4.py
+    python connect4.py analyze iterative:8 positions.txt -o results.jsonl
+"""
+import sys
 
 from game import InteractiveGame
 
 
 if __name__ == '__main__':
-    I = InteractiveGame()
+    if sys.argv[1:2] == ['analyze']:
+        from analysis import main
+        main(sys.argv[2:], 'connect4.py analyze')
+    else:
+        I = InteractiveGame()
@@ -49,8 +49,11 @@ def mean(data):
 class SearchAnalysis:
 
     def __init__(self, name, strategy_args=(), board=None, played_keys=None,
-                 search_cls=None, tree=None, ):
+                 search_cls=None, tree=None, stats=False):
+        """Stats counts work of explore in search.stats."""
         self.search = Spawn.get_search(name, search_cls, tree)
+        if stats:
+            self.search.enable_stats()
         if board is None:
             board = Board()
             if played_keys:
@@ -61,6 +64,15 @@ class SearchAnalysis:
         self.search.explore(self.board, strategy_args)
         self.search.evaluate(self.board)
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.search.close()
+
     def suggest(self):
         return random.choice(self.get_most_valuable())
 
@@ -94,6 +106,10 @@ class Game:
         self.player1.reset(self)
         self.player2.reset(self)
 
+    def current_time(self):
+        """Return remaining play time for current player, None if untimed."""
+        return None
+
     def current_player(self):
         """Player1 plays when turn is 1. Player2 plays when turn is 2. Return
         player for current turn."""
@@ -107,8 +123,9 @@ class Game:
         self.player1.advance(self)
         self.player2.advance(self)
 
-    def play(self):
-        """Take turns until end state. Return winner: 0, 1, or 2."""
+    def play(self, writer=None):
+        """Take turns until end state. Return winner: 0, 1, or 2. Writer, a
+        GameWriter, appends record of game."""
         # print(self.player1, self.player2)
         # print(self.board)
         # print()
@@ -117,8 +134,16 @@ class Game:
             # print(self.board)
             # print()
         # print(self.board.winner)
+        if writer is not None:
+            writer.write_game(self)
         return self.board.winner
 
+    def close(self):
+        """Release processes and memory of searches of players. Players
+        kept for other games are closed by their owner instead."""
+        self.player1.close()
+        self.player2.close()
+
 class InteractiveGame(Game):
 
     def __init__(self, board=None):
@@ -166,19 +191,21 @@ class InteractiveGame(Game):
 
     def print_strategy_analysis(self, name, strategy_args, query):
         if query == 'stats':
-            key_vals = self.get_player_stats(name, strategy_args)
-            print(*key_vals, sep='\n')
+            with SearchAnalysis(name, strategy_args, self.board,
+                                stats=True) as sa:
+                print(*sa.get_norm_key_values(), sep='\n')
+                print(sa.search.stats)
         else:
             key = self.get_player_suggestion(name, strategy_args)
             print('How about {}.'.format(key))
 
     def get_player_stats(self, name, strategy_args):
-        sa = SearchAnalysis(name, strategy_args, self.board)
-        return sa.get_norm_key_values()
+        with SearchAnalysis(name, strategy_args, self.board) as sa:
+            return sa.get_norm_key_values()
 
     def get_player_suggestion(self, name, strategy_args):
-        sa = SearchAnalysis(name, strategy_args, self.board)
-        return sa.suggest()
+        with SearchAnalysis(name, strategy_args, self.board) as sa:
+            return sa.suggest()
 
 class TimeGame(Game):
 
@@ -227,6 +254,8 @@ class Competition:
             result2[r] += 1
             r = -1 if r == 2 else r
             print(i, -r)
+        player1.close()
+        player2.close()
         result = [result1[0] + result2[0], result1[1]+result2[2], result1[2]+result2[1]]
         return result
 
@@ -245,6 +274,7 @@ class Competition:
             G = Game(player1=Spawn.get_player(name1, strat1),
                      player2=Spawn.get_player(name2, strat2))
             r = G.play()
+            G.close()
             if r:
                 off.append(G.board.played_keys)
             result[r] += 1
@@ -0,0 +1,49 @@
+class MoveOrdering:
+    """
+    Order open cols of board for alpha beta search from search history
+    alone, without pushing children or probing table. Hash move first, then
+    killer moves of ply, then cols by history of their open key for player
+    to move, ties center first. Searches report moves causing cutoffs.
+    """
+
+    # static fallback, center cols take part in most slices
+    center_order = (3, 2, 4, 1, 5, 0, 6)
+
+    def __init__(self, killers=2):
+        """Keep given number of killer moves per ply."""
+        self.num_killers = killers
+        self.center_rank = [self.center_order.index(col) for col in range(7)]
+        self.clear()
+
+    def clear(self):
+        """Forget killers and history."""
+        # map ply to cols causing latest cutoffs, most recent first
+        self.killers = [[] for _ in range(43)]
+        # map player number to list mapping key to history score
+        self.history = [[0]*42 for _ in range(3)]
+
+    def order(self, board, hash_move=None):
+        """Return list of open cols of board, most promising first."""
+        open_keys = board.open_keys
+        history = self.history[board.turn()]
+        center_rank = self.center_rank
+        cols = sorted(open_keys, key=lambda col: (-history[open_keys[col][-1]],
+                                                  center_rank[col]))
+        for col in reversed(self.killers[board.moves()]):
+            if col in open_keys:
+                cols.remove(col)
+                cols.insert(0, col)
+        if hash_move is not None and hash_move in open_keys:
+            cols.remove(hash_move)
+            cols.insert(0, hash_move)
+        return cols
+
+    def cutoff(self, board, col, depth):
+        """Record col caused beta cutoff at board searched to depth. Col is
+        open, i.e. child already popped."""
+        killers = self.killers[board.moves()]
+        if col in killers:
+            killers.remove(col)
+        killers.insert(0, col)
+        del killers[self.num_killers:]
+        self.history[board.turn()][board.open_keys[col][-1]] += depth * depth
@@ -1,5 +1,8 @@
-from search import Search, RandomSearch, TreeSearch, IterativeDeepeningTreeSearch, TimeIterativeDeepeningTreeSearch, MonteCarloTreeSearch, TimeMonteCarloTreeSearch
-from tree import IterativeDeepeningTree, TimeIterativeDeepeningTree, MonteCarloTree, UpperConfidenceBoundTree
+from search import Search, RandomSearch, TreeSearch, IterativeDeepeningTreeSearch, TimeIterativeDeepeningTreeSearch, MonteCarloTreeSearch, TimeMonteCarloTreeSearch, SolverTreeSearch, RootParallelMonteCarloTreeSearch, LazySMPTreeSearch
+from tree import IterativeDeepeningTree, TimeIterativeDeepeningTree, MonteCarloTree, UpperConfidenceBoundTree, SolverTree, LazySMPTree, PoolUpperConfidenceBoundTree, RaveUpperConfidenceBoundTree
+from board import BitBoard
+from table import BoundedTable, SharedTable
+from ordering import MoveOrdering
 
 class Player:
     """
@@ -23,6 +26,10 @@ class Player:
     def move(self, game):
         return self.search.strategy(game, self.strategy_args)
 
+    def close(self):
+        """Release processes and memory of search, see Search.close."""
+        self.search.close()
+
     def __repr__(self):
         return self.name
 
@@ -37,14 +44,20 @@ class Spawn:
     strategy_args = {}
 
     @classmethod
-    def get_player(cls, name, strategy_args=(), search_cls=None, tree=None):
+    def get_player(cls, name, strategy_args=(), search_cls=None, tree=None,
+                   tablebase=None, book=None):
         """Return instance of player."""
-        search = cls.get_search(name, search_cls, tree)
+        search = cls.get_search(name, search_cls, tree, tablebase, book)
         return Player(name, search, strategy_args)
 
     @classmethod
-    def get_search(cls, name, search_cls, tree):
-        """Return search instance from tree instance."""
+    def get_search(cls, name, search_cls, tree, tablebase=None, book=None):
+        """Return search instance from tree instance. Tablebase is probed by
+        alpha beta and Monte Carlo trees, see Tablebase. None by default:
+        tablebase covers only boards reached from games it was built from,
+        see tablebase.py, and probes of other boards are overhead. Book is
+        consulted by tree searches before searching, see OpeningBook, and
+        ignored by random and user searches."""
         if not search_cls:
             if name in cls.players:
                 search_cls, tree = cls.players[name]
@@ -52,7 +65,22 @@ class Spawn:
                 search_cls, tree = cls.players['user']
         if callable(tree):
             tree = tree()
-        return search_cls(tree)
+        if tablebase is not None:
+            if not hasattr(tree, 'tablebase'):
+                raise ValueError('{} does not probe tablebase'.format(name))
+            tree.tablebase = tablebase
+        search = search_cls(tree)
+        if book is not None:
+            search.book = book
+        return search
+
+    @classmethod
+    def starts_processes(cls, name, strategy_args):
+        """Return True if player of name starts a process pool of its own
+        with strategy args, e.g. lazysmp and rootparallel with workers
+        above 1. Pool workers are daemonic and cannot play such players."""
+        names = cls.strategy_args.get(name, ())
+        return dict(zip(names, strategy_args)).get('workers', 1) > 1
 
 class UserInput:
 
@@ -96,6 +124,16 @@ class UserInput:
                     print(' '*4 + 'Enter a positive integer.')
                 except ValueError:
                     print(' '*4 + 'Enter an integer i.e. 100.')
+        if arg == 'workers':
+            while True:
+                print(' '*4 + 'How many worker processes?')
+                try:
+                    workers = int(input('    --> '))
+                    if workers > 0:
+                        return workers
+                    print(' '*4 + 'Enter a positive integer.')
+                except ValueError:
+                    print(' '*4 + 'Enter an integer i.e. 4.')
         if arg == 'depth':
             while True:
                 print('    How many moves deep?')
@@ -156,6 +194,32 @@ Spawn.players['iterative'] = (IterativeDeepeningTreeSearch,
                               IterativeDeepeningTree)
 Spawn.strategy_args['iterative'] = ('depth',)
 
+Spawn.players['bititerative'] = (IterativeDeepeningTreeSearch,
+                                 lambda: IterativeDeepeningTree(BitBoard))
+Spawn.strategy_args['bititerative'] = ('depth',)
+
+Spawn.players['bounditerative'] = (IterativeDeepeningTreeSearch,
+                                   lambda: IterativeDeepeningTree(
+                                       table=BoundedTable(64)))
+Spawn.strategy_args['bounditerative'] = ('depth',)
+
+Spawn.players['orderediterative'] = (IterativeDeepeningTreeSearch,
+                                     lambda: IterativeDeepeningTree(
+                                         ordering=MoveOrdering()))
+Spawn.strategy_args['orderediterative'] = ('depth',)
+
+Spawn.players['pvsiterative'] = (IterativeDeepeningTreeSearch,
+                                 lambda: IterativeDeepeningTree(
+                                     pvs=True, aspiration=30))
+Spawn.strategy_args['pvsiterative'] = ('depth',)
+
+Spawn.players['solver'] = (SolverTreeSearch, SolverTree)
+Spawn.strategy_args['solver'] = ()
+
+Spawn.players['lazysmp'] = (LazySMPTreeSearch,
+                            lambda: LazySMPTree(SharedTable(64)))
+Spawn.strategy_args['lazysmp'] = ('depth', 'workers')
+
 Spawn.players['idtime'] = (TimeIterativeDeepeningTreeSearch,
                            TimeIterativeDeepeningTree)
 Spawn.strategy_args['idtime'] = ('depth',)
@@ -167,6 +231,32 @@ Spawn.strategy_args['montecarlo'] = ('iterations',)
 Spawn.players['confidence'] = (MonteCarloTreeSearch, UpperConfidenceBoundTree)
 Spawn.strategy_args['confidence'] = ('iterations',)
 
+Spawn.players['bitconfidence'] = (MonteCarloTreeSearch,
+                                  lambda: UpperConfidenceBoundTree(
+                                      board_cls=BitBoard))
+Spawn.strategy_args['bitconfidence'] = ('iterations',)
+
+Spawn.players['heavyconfidence'] = (MonteCarloTreeSearch,
+                                    lambda: UpperConfidenceBoundTree(
+                                        heavy=True))
+Spawn.strategy_args['heavyconfidence'] = ('iterations',)
+
+Spawn.players['rave'] = (MonteCarloTreeSearch, RaveUpperConfidenceBoundTree)
+Spawn.strategy_args['rave'] = ('iterations',)
+
+Spawn.players['poolconfidence'] = (MonteCarloTreeSearch,
+                                   PoolUpperConfidenceBoundTree)
+Spawn.strategy_args['poolconfidence'] = ('iterations',)
+
+Spawn.players['batchconfidence'] = (MonteCarloTreeSearch,
+                                    lambda: UpperConfidenceBoundTree(
+                                        playouts=64))
+Spawn.strategy_args['batchconfidence'] = ('iterations',)
+
+Spawn.players['rootparallel'] = (RootParallelMonteCarloTreeSearch,
+                                 UpperConfidenceBoundTree)
+Spawn.strategy_args['rootparallel'] = ('iterations', 'workers')
+
 Spawn.players['ucttime'] = (TimeMonteCarloTreeSearch,
                             UpperConfidenceBoundTree)
 Spawn.strategy_args['ucttime'] = ('iterations',)
@@ -0,0 +1,195 @@
+"""
+Binary game records. File is magic and version, then length prefixed
+records. Byte of length counts bytes after it. Game record is fixed header
+of result, player ids and number of moves, then cols played, two per byte,
+first col in low nibble:
+    <B length> <B result> <H player1> <H player2> <B moves> <cols>
+Result 255 marks record naming a player id instead, written before first
+game of player, name at most 252 bytes:
+    <B length> <B 255> <H id> <utf-8 name>
+"""
+from collections import namedtuple
+import mmap
+import os
+import struct
+
+from board import Board
+
+magic = b'C4GR'
+version = 1
+name_result = 255
+# length byte counts result, id and name
+max_name_bytes = 255 - 3
+
+header = struct.Struct('<BBHHB')
+name_header = struct.Struct('<BBH')
+
+GameRecord = namedtuple('GameRecord', 'result player1 player2 cols')
+
+# map byte to pair of cols, low nibble first
+nibble_pairs = [(byte & 15, byte >> 4) for byte in range(256)]
+
+
+def pack_cols(cols):
+    """Return bytes of cols, two per byte. Odd count pads last high nibble
+    with 0."""
+    data = bytes(cols)
+    # cols fit a nibble, so shifting odd cols as one int never carries
+    return (int.from_bytes(data[0::2], 'little')
+            | int.from_bytes(data[1::2], 'little') << 4).to_bytes(
+                (len(data) + 1) // 2, 'little')
+
+def unpack_cols(data, moves):
+    """Inverse of pack_cols."""
+    cols = []
+    for byte in data:
+        cols.extend(nibble_pairs[byte])
+    del cols[moves:]
+    return cols
+
+def board_cols(board):
+    """Return list of cols played on board, in order."""
+    return [key // 6 for key in board.played_keys]
+
+
+class GameWriter:
+    """
+    Append records to file, buffered in memory up to buffer_size bytes.
+    Players are ids, or names given ids on first use, see player_id. Partial
+    record of an interrupted writer is truncated before appending. Use as
+    context manager, or close.
+    """
+
+    def __init__(self, path, buffer_size=2**16):
+        # map player name to id, ids of names in file are kept
+        self.ids = {}
+        if os.path.exists(path) and os.path.getsize(path):
+            with GameReader(path) as reader:
+                for _ in reader:
+                    pass
+            self.ids = {name: i for i, name in reader.names.items()}
+            if reader.end < os.path.getsize(path):
+                os.truncate(path, reader.end)
+        self.file = open(path, 'ab')
+        if not self.file.tell():
+            self.file.write(magic + bytes((version,)))
+        self.buffer = bytearray()
+        self.buffer_size = buffer_size
+        self.count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def player_id(self, name):
+        """Return id of player name, writing name record if new. Raise
+        ValueError if name is longer than max_name_bytes encoded."""
+        player_id = self.ids.get(name)
+        if player_id is None:
+            data = name.encode()
+            if len(data) > max_name_bytes:
+                raise ValueError('name longer than {} bytes: {!r}'.format(
+                    max_name_bytes, name))
+            player_id = self.ids[name] = max(self.ids.values(), default=-1) + 1
+            self.buffer += name_header.pack(3 + len(data), name_result,
+                                            player_id)
+            self.buffer += data
+        return player_id
+
+    def write(self, cols, result, player1=0, player2=0):
+        """Append game of cols played, result 0 for draw else winner, and
+        player ids."""
+        moves = len(cols)
+        self.buffer += header.pack(6 + (moves + 1) // 2, result, player1,
+                                   player2, moves)
+        self.buffer += pack_cols(cols)
+        self.count += 1
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def write_board(self, board, player1=0, player2=0):
+        """Append game of terminal board."""
+        self.write(board_cols(board), board.winner, player1, player2)
+
+    def write_game(self, game):
+        """Append played game, players named by their names."""
+        self.write_board(game.board, self.player_id(str(game.player1)),
+                         self.player_id(str(game.player2)))
+
+    def flush(self):
+        self.file.write(self.buffer)
+        self.buffer.clear()
+        self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+
+class GameReader:
+    """
+    Iterate game records of file, memory mapped. Names of player ids are
+    collected in names while iterating, and end is offset after last
+    complete record. Empty file has no records. Use as context manager, or
+    close.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        # map player id to name
+        self.names = {}
+        self.end = 0
+        if not os.fstat(self.file.fileno()).st_size:
+            # empty files cannot be mapped
+            self.map = b''
+            return
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:4] != magic:
+            self.close()
+            raise ValueError('{} is not a game record file'.format(path))
+        if self.map[4] != version:
+            self.close()
+            raise ValueError('unknown version {}'.format(self.map[4]))
+        self.end = len(magic) + 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __iter__(self):
+        data = self.map
+        end = len(data)
+        offset = self.end = min(end, len(magic) + 1)
+        unpack_from = header.unpack_from
+        while offset < end:
+            length = data[offset]
+            if offset + 1 + length > end:
+                # partial record of interrupted writer
+                return
+            if data[offset+1] == name_result:
+                player_id = name_header.unpack_from(data, offset)[2]
+                name = data[offset+4:offset+1+length]
+                self.names[player_id] = name.decode()
+            else:
+                _, result, player1, player2, moves = unpack_from(data, offset)
+                cols = unpack_cols(data[offset+7:offset+1+length], moves)
+                yield GameRecord(result, player1, player2, cols)
+            offset = self.end = offset + 1 + length
+
+    def close(self):
+        if isinstance(self.map, mmap.mmap) and not self.map.closed:
+            self.map.close()
+        self.file.close()
+
+
+def replay(record, board_cls=Board):
+    """Return board after cols of record."""
+    board = board_cls()
+    for col in record.cols:
+        board.push(col)
+    return board
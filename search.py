@@ -1,11 +1,23 @@
+import multiprocessing
+import numpy as np
+import pickle
 import random
 
+from clock import Clock
+from simulation import BatchSimulation
+from stats import SearchStats
+from tree import LazySMPTree, SearchStopped
+
 class Search:
     """Analyze board for best positions to play."""
 
     def __init__(self, args=()):
         self.key_values = []
         self.most_valuable = []
+        # SearchStats of explore if enabled, else None
+        self.stats = None
+        # OpeningBook consulted before searching, see book_move
+        self.book = None
 
     def strategy(self, game, args=()):
         """Return open key for player to play in game."""
@@ -36,6 +48,37 @@ class Search:
     def explore(self, *args):
         """Explore state space as necessary."""
 
+    def enable_stats(self):
+        """Count work of searches from now on. Return SearchStats."""
+        if self.stats is None:
+            self.stats = SearchStats()
+        return self.stats
+
+    def disable_stats(self):
+        self.stats = None
+
+    def close(self):
+        """Release processes and shared memory of search, if any. Search is
+        not used after. Use search as context manager, or close."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def book_move(self, board):
+        """Return col of book for board, None if no book or board is not
+        in it. Most valuable keys are then col alone."""
+        if self.book is None:
+            return None
+        entry = self.book.lookup(board)
+        if entry is None:
+            return None
+        self.most_valuable = [entry[0]]
+        self.key_values = []
+        return entry[0]
+
 class RandomSearch(Search):
 
     def strategy(self, game, args=()):
@@ -56,11 +99,12 @@ class TreeSearch(Search):
 
     def explore(self, board, args):
         """Explore state space as necessary."""
-        self.tree.explore(board, *args)
+        self.tree.explore(self.tree.get_board(board), *args)
 
     def strategy(self, game, args):
-        self.tree.explore(game.board, *args)
-        self.evaluate(game.board)
+        board = self.tree.get_board(game.board)
+        self.tree.explore(board, *args)
+        self.evaluate(board)
         return random.choice(self.most_valuable)
 
     def reset(self, board):
@@ -68,38 +112,194 @@ class TreeSearch(Search):
         for i in range(board.moves()):
             self.tree.table.clear_moves(i)
 
-    # def advance(self, board):
-        # if board.moves():
-            # self.tree.table.clear_moves(board.moves()-1)
+    def advance(self, board):
+        """Free table entries of boards before given board, none are
+        reachable."""
+        for i in range(board.moves()):
+            self.tree.table.clear_moves(i)
 
     def evaluate(self, board):
         self.most_valuable = self.tree.most_valuable(board)
 
+    def enable_stats(self):
+        """Count work of tree from now on, see SearchStats."""
+        if self.stats is None:
+            super().enable_stats().attach(self.tree)
+        return self.stats
+
+    def disable_stats(self):
+        if self.stats is not None:
+            self.stats.detach()
+        super().disable_stats()
+
 class IterativeDeepeningTreeSearch(TreeSearch):
 
     def explore(self, board, args):
+        board = self.tree.get_board(board)
+        # evaluations of odd and even depths differ by a tempo, so guess
+        # value of each depth from the depth two less
+        values = [None, None]
         for depth in range(1, args[0]+1):
-            self.tree.principal_explore(board, depth)
+            values.append(self.tree.aspiration_explore(board, depth,
+                                                       values[-2]))
 
     def strategy(self, game, args):
-        for depth in range(1, args[0]+1):
-            self.tree.principal_explore(game.board, depth)
-        self.evaluate(game.board)
+        col = self.book_move(game.board)
+        if col is not None:
+            return col
+        board = self.tree.get_board(game.board)
+        self.explore(board, args)
+        self.evaluate(board)
         return random.choice(self.most_valuable)
 
 class TimeIterativeDeepeningTreeSearch(IterativeDeepeningTreeSearch):
+    """
+    Deepen until max depth or clock deadlines of game time. Tree is a
+    TimeIterativeDeepeningTree sharing clock of search. Most valuable keys
+    are those of last completed depth.
+    """
+
+    # estimate of time of next depth over time of last depth
+    growth = 2
+
+    def __init__(self, tree_inst, clock=None):
+        super().__init__(tree_inst)
+        self.clock = Clock() if clock is None else clock
+        self.tree.clock = self.clock
+        self.depth = 0
 
     def strategy(self, game, args):
-        alarm = time.time() + game.current_time() / 2 - 1
-        max_depth = args[0]+1
-        for depth in range(1, max_depth):
-            if time.time() > alarm:
-                break
-            self.tree.principal_explore(alarm, game.board, depth)
-        self.evaluate(game.board)
+        col = self.book_move(game.board)
+        if col is not None:
+            return col
+        board = self.tree.get_board(game.board)
+        self.clock.start(game.current_time(), board.moves())
+        moves = board.moves()
+        # any key until depth 1 completes
+        self.most_valuable = list(board.open_keys)
+        self.depth = 0
+        values = [None, None]
+        try:
+            for depth in range(1, args[0]+1):
+                start = self.clock.elapsed()
+                values.append(self.tree.aspiration_explore(board, depth,
+                                                           values[-2]))
+                self.evaluate(board)
+                self.depth = depth
+                # next depth takes about branching factor times longer
+                spent = self.clock.elapsed() - start
+                if (self.clock.soft_expired()
+                        or not self.clock.fits(self.growth * spent)):
+                    break
+        except SearchStopped:
+            while board.moves() > moves:
+                board.pop()
+        self.clock.stop()
+        return random.choice(self.most_valuable)
+
+# tree of worker process, attached to shared table by pool initializer
+worker_tree = None
+
+def attach_tree(tree):
+    """Keep unpickled tree, its table attached to shared memory."""
+    global worker_tree
+    worker_tree = tree
+
+def lazy_explore(board, depth, seed, offset):
+    """Iteratively deepen worker tree from board until depth plus offset or
+    stopped. Helpers of odd offset search one ply deeper. Return nodes."""
+    random.seed(seed)
+    tree = worker_tree
+    tree.nodes = 0
+    try:
+        for d in range(1 + offset, depth + offset + 1):
+            tree.principal_explore(board, d)
+    except SearchStopped:
+        pass
+    return tree.nodes
+
+class LazySMPTreeSearch(IterativeDeepeningTreeSearch):
+    """
+    Lazy SMP: main search and helper processes iteratively deepen same board
+    over one SharedTable, no other communication. Main search runs in this
+    process and its completed iterations decide the key. Helpers stop when
+    main search completes. Tree instance is LazySMPTree on a SharedTable.
+    """
+
+    def __init__(self, tree_inst):
+        super().__init__(tree_inst)
+        self.pool = None
+        self.workers = 0
+        self.nodes = 0
+
+    def explore(self, board, args):
+        depth, workers = args
+        board = self.tree.get_board(board)
+        table = self.tree.table
+        if workers > 1 and self.workers != workers:
+            self.stop_helpers()
+            helper = LazySMPTree(table, self.tree.board_cls, noise=2)
+            helper.tablebase = self.tree.tablebase
+            self.pool = multiprocessing.Pool(workers - 1, attach_tree,
+                                             (helper,))
+            self.workers = workers
+        table.stopped = False
+        results = [self.pool.apply_async(lazy_explore,
+                                         (board, depth,
+                                          random.getrandbits(32), i % 2))
+                   for i in range(1, workers)]
+        self.tree.nodes = 0
+        values = [None, None]
+        for d in range(1, depth+1):
+            values.append(self.tree.aspiration_explore(board, d, values[-2]))
+        table.stopped = True
+        self.nodes = self.tree.nodes + sum(result.get() for result in results)
+
+    def strategy(self, game, args):
+        col = self.book_move(game.board)
+        if col is not None:
+            return col
+        self.explore(game.board, args)
+        self.evaluate(self.tree.get_board(game.board))
         return random.choice(self.most_valuable)
 
+    def stop_helpers(self):
+        """Stop helper processes."""
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
+            self.workers = 0
+
+    def close(self):
+        """Stop helper processes, close and unlink shared table."""
+        self.stop_helpers()
+        self.tree.table.close()
+
 class MonteCarloTreeSearch(TreeSearch):
+    """
+    Keep statistics of played board and its descendants between moves if
+    reuse, free all other table entries. Else start each move with empty
+    table.
+    """
+
+    def __init__(self, tree_inst, reuse=True):
+        super().__init__(tree_inst)
+        self.reuse = reuse
+        # list of tuples: table entries before and after each advance
+        self.retained = []
+
+    def advance(self, board):
+        if not self.reuse:
+            self.tree.table = self.tree.table_cls()
+            return
+        board = self.tree.get_board(board)
+        self.retained.append(self.tree.prune(board))
+
+    def strategy(self, game, args):
+        col = self.book_move(game.board)
+        if col is not None:
+            return col
+        return super().strategy(game, args)
 
     def evaluate(self, board):
         self.key_values = self.tree.children_key_values(board)
@@ -107,18 +307,118 @@ class MonteCarloTreeSearch(TreeSearch):
 
     def get_norm_key_values(self, board):
         return [(key, self.tree.norm_value(board, value)) for key, value
-                in sorted(self.children_key_values, key=lambda item: item[0])]
+                in sorted(self.key_values, key=lambda item: item[0])]
 
-class TimeMonteCarloTreeSearch(MonteCarloTreeSearch):
+def grow_tree(tree, board, iterations, seconds, seed):
+    """Explore board with tree in worker process, seeded apart from other
+    workers. Return key, wins, sims of root children."""
+    random.seed(seed)
+    BatchSimulation.rng = np.random.default_rng(seed)
+    tree.explore(board, iterations, seconds)
+    return tree.children_key_items(board)
+
+class RootParallelMonteCarloTreeSearch(MonteCarloTreeSearch):
+    """
+    Grow independent trees from same board in worker processes, each with a
+    share of iterations. Sum root children statistics to choose a key. Tree
+    instance is template sent to workers, its table stays empty.
+    """
+
+    def __init__(self, tree_inst, seconds=None):
+        """Seconds limits time of each worker, iterations are then a cap."""
+        super().__init__(tree_inst)
+        self.seconds = seconds
+        self.pool = None
+        self.workers = 0
+        self.key_items = []
+
+    def explore(self, board, args):
+        iterations, workers = args
+        board = self.tree.get_board(board)
+        share = -(-iterations // workers)
+        if workers == 1:
+            # grow copy of template, as sent to a worker, and keep random
+            # state of this process as workers do
+            tree = pickle.loads(pickle.dumps(self.tree))
+            seed = random.getrandbits(32)
+            state, rng = random.getstate(), BatchSimulation.rng
+            try:
+                self.key_items = grow_tree(tree, board, share, self.seconds,
+                                           seed)
+            finally:
+                random.setstate(state)
+                BatchSimulation.rng = rng
+            return
+        if self.workers != workers:
+            self.close()
+            self.pool = multiprocessing.Pool(workers)
+            self.workers = workers
+        results = [self.pool.apply_async(grow_tree,
+                                         (self.tree, board, share,
+                                          self.seconds,
+                                          random.getrandbits(32)))
+                   for _ in range(workers)]
+        merged = {}
+        for result in results:
+            for key, wins, sims in result.get():
+                item = merged.setdefault(key, [0, 0])
+                item[0] += wins
+                item[1] += sims
+        self.key_items = [(key, wins, sims)
+                          for key, (wins, sims) in sorted(merged.items())]
 
     def strategy(self, game, args):
-        alarm = time.time() + game.current_time() / 2 - 1
-        if board not in self.tree.table:
-            self.tree.add_child(game.board)
-        iterations = args[0]
-        for _ in range(iterations):
-            self.tree.playout(game.board)
-            if time.time() > alarm:
-                break
+        col = self.book_move(game.board)
+        if col is not None:
+            return col
+        self.explore(game.board, args)
         self.evaluate(game.board)
         return random.choice(self.most_valuable)
+
+    def evaluate(self, board):
+        self.key_values = self.tree.items_key_values(self.key_items)
+        self.most_valuable = self.tree.most_valuable(board, self.key_values)
+
+    def enable_stats(self):
+        """Tree is a template sent to workers, leave it uninstrumented."""
+        return Search.enable_stats(self)
+
+    def get_norm_key_values(self, board):
+        """Return key values as share of all sims of children."""
+        total = sum(sims for _, _, sims in self.key_items)
+        return [(key, 100 * sims / total) for key, _, sims in self.key_items]
+
+    def close(self):
+        """Stop worker processes."""
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
+            self.workers = 0
+
+class SolverTreeSearch(TreeSearch):
+
+    def evaluate(self, board):
+        self.key_values = self.tree.children_key_values(board)
+        self.most_valuable = self.tree.most_valuable(board, self.key_values)
+
+    def get_norm_key_values(self, board):
+        return [(key, self.tree.norm_value(board, value))
+                for key, value in self.key_values]
+
+class TimeMonteCarloTreeSearch(MonteCarloTreeSearch):
+    """Run iterations of playouts until budget of clock is spent."""
+
+    def __init__(self, tree_inst, clock=None):
+        super().__init__(tree_inst)
+        self.clock = Clock() if clock is None else clock
+
+    def strategy(self, game, args):
+        col = self.book_move(game.board)
+        if col is not None:
+            return col
+        board = self.tree.get_board(game.board)
+        self.clock.start(game.current_time(), board.moves())
+        self.tree.explore(board, args[0], self.clock.budget)
+        self.clock.stop()
+        self.evaluate(board)
+        return random.choice(self.most_valuable)
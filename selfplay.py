@@ -0,0 +1,233 @@
+"""
+Self-play data of Spawn players. Worker processes play games and put the
+positions searched, with value of search, col played and final result, on
+a bounded queue. This process drains the queue into sharded JSONL files,
+skipping canonical keys already written, remembered in fixed memory.
+Workers block only while the queue is full, so a slow disk bounds memory
+instead of growing it.
+    python selfplay.py data iterative:6 --games 1000 --workers 4
+    python selfplay.py data confidence:2000 iterative:6 --shards 16
+"""
+import argparse
+from array import array
+import json
+import multiprocessing
+import numpy as np
+import os
+import queue
+import random
+import time
+
+from analysis import search_value
+from board import Board
+from book import OpeningBook
+from game import Game
+from player import Spawn
+from records import board_cols
+from tournament import entrant_label, parse_entrant
+
+
+class SelfPlayGame(Game):
+    """Game keeping positions searched by players: cols played, canonical
+    key, turn, value of chosen col for player to move, and col."""
+
+    def __init__(self, board=None, player1=None, player2=None):
+        super().__init__(board, player1, player2)
+        self.positions = []
+
+    def take_turn(self):
+        player = self.current_player()
+        key = player.move(self)
+        board = self.board
+        self.positions.append(
+            (''.join(map(str, board_cols(board))), board.canonical_value,
+             board.turn(), search_value(player.search, board, key), key))
+        board.push(key)
+        self.player1.advance(self)
+        self.player2.advance(self)
+
+def play_positions(entrants, random_plies, seed, book=None):
+    """Play game of entrants, first random_plies cols random, seeded, then
+    cols of opening book at path book while in it. Return list of position
+    dicts, result 1 if player to move won, -1 if lost, 0 for draw."""
+    random.seed(seed)
+    np.random.seed(seed % 2**32)
+    board = Board()
+    for _ in range(random_plies):
+        board.push(random.choice(list(board.open_keys)))
+        if board.is_terminal():
+            return []
+    if book is not None:
+        book = OpeningBook(book)
+    # players alternate colors between games
+    players = [Spawn.get_player(*entrant, book=book) for entrant in entrants]
+    if seed % 2:
+        players.reverse()
+    game = SelfPlayGame(board, *players)
+    try:
+        winner = game.play()
+    finally:
+        game.close()
+        if book is not None:
+            book.close()
+    return [{'moves': moves, 'key': key, 'value': value, 'move': col,
+             'result': 0 if not winner else 1 if winner == turn else -1}
+            for moves, key, turn, value, col in game.positions]
+
+
+# queue and config of worker process, set by pool initializer
+worker_queue = None
+worker_config = None
+
+def start_worker(positions_queue, config):
+    global worker_queue, worker_config
+    worker_queue = positions_queue
+    worker_config = config
+
+def play_worker_game(index):
+    """Play game of index, put its positions on queue. Return number of
+    positions."""
+    entrants, random_plies, seed, book = worker_config
+    positions = play_positions(entrants, random_plies, seed + index, book)
+    worker_queue.put(positions)
+    return len(positions)
+
+
+class SelfPlay:
+    """
+    Play games of two entrants, or one entrant against itself, and write
+    positions to shards of directory. Shard of position is hash of its
+    canonical key modulo shards, see mix. Keys written are kept in a filter
+    of fixed size, see seen, so the first of duplicates is kept while its
+    key is not evicted.
+    """
+
+    def __init__(self, entrants, directory, games, workers=1, shards=8,
+                 queue_size=64, random_plies=4, seed=0, max_keys=2**20,
+                 book=None):
+        """Entrants are tuples of name and strategy args. Queue size bounds
+        games played but not yet written, max keys the keys remembered, 8
+        bytes each. Book is path of opening book consulted by players.
+        Players starting processes play with 1 worker only, see
+        Spawn.starts_processes."""
+        for name, _ in entrants:
+            if name not in Spawn.players or name == 'user':
+                raise ValueError('unknown player: {}'.format(name))
+        if len(entrants) == 1:
+            entrants = entrants * 2
+        self.entrants = [(name, tuple(args)) for name, args in entrants]
+        self.directory = directory
+        self.games = games
+        self.workers = workers
+        for name, args in self.entrants:
+            if workers > 1 and Spawn.starts_processes(name, args):
+                raise ValueError('{} starts processes, play with 1 worker'
+                                 .format(entrant_label((name, args))))
+        self.shards = shards
+        self.queue_size = queue_size
+        self.random_plies = random_plies
+        self.seed = seed
+        self.book = book
+        # canonical keys written plus one, zero is an empty slot
+        self.keys = array('q', [0]) * max(1, max_keys)
+        self.positions = self.written = 0
+
+    def run(self):
+        """Play and write all games. Return dict of counts and rates."""
+        os.makedirs(self.directory, exist_ok=True)
+        files = [open(os.path.join(self.directory,
+                                   'positions-{:03d}.jsonl'.format(i)), 'w')
+                 for i in range(self.shards)]
+        t0 = time.perf_counter()
+        try:
+            for positions in self.play():
+                self.write(files, positions)
+        finally:
+            for f in files:
+                f.close()
+        seconds = time.perf_counter() - t0
+        return {'games': self.games, 'positions': self.positions,
+                'written': self.written, 'seconds': seconds,
+                'positions/s': self.positions / seconds}
+
+    def play(self):
+        """Yield positions of each game, as games finish."""
+        config = (self.entrants, self.random_plies, self.seed, self.book)
+        if self.workers <= 1:
+            for index in range(self.games):
+                yield play_positions(self.entrants, self.random_plies,
+                                     self.seed + index, self.book)
+            return
+        positions_queue = multiprocessing.Queue(self.queue_size)
+        with multiprocessing.Pool(self.workers, start_worker,
+                                  (positions_queue, config)) as pool:
+            result = pool.map_async(play_worker_game, range(self.games),
+                                    chunksize=1)
+            received = 0
+            while received < self.games:
+                try:
+                    positions = positions_queue.get(timeout=.1)
+                except queue.Empty:
+                    if result.ready():
+                        # raise error of worker, else puts are in flight
+                        result.get()
+                    continue
+                received += 1
+                yield positions
+
+    @staticmethod
+    def mix(key):
+        """Return hash of canonical key. Low bits of keys are occupancy of
+        col 0, multiply by golden ratio to spread."""
+        return (key * 0x9e3779b97f4a7c15) >> 40
+
+    def seen(self, key):
+        """Return whether key was written, else remember it. Key hashes to
+        one slot, always replaced, so a key evicted by another may be
+        written again."""
+        i = self.mix(key) % len(self.keys)
+        if self.keys[i] == key + 1:
+            return True
+        self.keys[i] = key + 1
+        return False
+
+    def write(self, files, positions):
+        for position in positions:
+            self.positions += 1
+            key = position['key']
+            if self.seen(key):
+                continue
+            shard = self.mix(key) % self.shards
+            files[shard].write(json.dumps(position) + '\n')
+            self.written += 1
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('directory', help='directory of shards')
+    parser.add_argument('entrants', nargs='+', type=parse_entrant,
+                        help='one or two players, e.g. iterative:6')
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--shards', type=int, default=8)
+    parser.add_argument('--queue', type=int, default=64,
+                        help='games played but not yet written')
+    parser.add_argument('--random-plies', type=int, default=4,
+                        help='random cols opening each game')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-keys', type=int, default=2**20,
+                        help='keys remembered to skip duplicates')
+    parser.add_argument('--book', help='opening book consulted by players, '
+                                       'see book.py')
+    args = parser.parse_args()
+    if len(args.entrants) > 2:
+        parser.error('one or two entrants')
+    try:
+        self_play = SelfPlay(args.entrants, args.directory, args.games,
+                             args.workers, args.shards, args.queue,
+                             args.random_plies, args.seed, args.max_keys,
+                             args.book)
+    except ValueError as error:
+        parser.error(str(error))
+    result = self_play.run()
+    print(json.dumps(result))
@@ -1,4 +1,5 @@
-from board import Board
+from board import Board, BitBoard, HashBoard
+import numpy as np
 import random
 
 class Simulation:
@@ -48,3 +49,226 @@ class Simulation:
                 self.winner = turn
                 return True
         return False
+
+class Simulator(Simulation):
+    """
+    Reusable random playout engine, owned by a tree. Buffers are allocated
+    once and reset from board in place by run. Open cols are a flat array,
+    a full col is swap removed as in pop_unstable.
+    """
+
+    def __init__(self):
+        self.values = [0]*42
+        # first n items are open cols
+        self.cols = [0]*7
+        # map col to its lowest open key
+        self.next_keys = [0]*7
+        self.winner = None
+
+    def run(self, board, tablebase=None):
+        """Play random game from board. Return winner: 0, 1, or 2. Game
+        with tablebase ends at first board in it, winner by its result."""
+        # while loops, slice assignment and dict iteration allocate
+        values = self.values
+        board_values = board.values
+        key = 0
+        while key < 42:
+            values[key] = board_values[key]
+            key += 1
+        cols = self.cols
+        next_keys = self.next_keys
+        open_keys = board.open_keys
+        n = col = 0
+        while col < 7:
+            if col in open_keys:
+                cols[n] = col
+                next_keys[col] = open_keys[col][-1]
+                n += 1
+            col += 1
+        rand = random.random
+        moves = board.moves()
+        turn = 1 + moves % 2
+        # moves of first board probed
+        stop = 42
+        if tablebase is not None:
+            stop = max(moves, 42 - tablebase.empties)
+        while True:
+            while moves < stop:
+                i = int(rand() * n)
+                col = cols[i]
+                key = next_keys[col]
+                if key % 6 == 5:
+                    n -= 1
+                    cols[i] = cols[n]
+                else:
+                    next_keys[col] = key + 1
+                values[key] = turn
+                if moves > 5 and self.calc_winner(key, turn):
+                    return turn
+                moves += 1
+                turn = 3 - turn
+            if stop == 42:
+                break
+            stop = 42
+            result = tablebase.probe_key(self.canonical_value())
+            if result is not None:
+                return 0 if not result else turn if result > 0 else 3 - turn
+        self.winner = 0
+        return 0
+
+    def canonical_value(self):
+        """Return canonical hash of values, as Board.canonical_value."""
+        values = self.values
+        table = HashBoard.table
+        h = s = key = 0
+        while key < 42:
+            value = values[key]
+            if value:
+                h += table[key][value]
+                # key of col reflected
+                s += table[36 - key + 2 * (key % 6)][value]
+            key += 1
+        return h if h < s else s
+
+class BitSimulation(Simulation):
+
+    alignment = staticmethod(BitBoard.alignment)
+
+    def __init__(self, board):
+        """Play random game from board on bitboards. Board may be Board or
+        BitBoard."""
+        position, mask = board.bitboards()
+        moves = board.moves()
+        open_keys = list(list(v) for v in board.open_keys.values())
+        self.winner = None
+        self.play(position, mask, moves, open_keys)
+
+    def play(self, position, mask, moves, open_keys):
+        turn = 1 + moves % 2
+        for i in range(moves, 42):
+            key = self.get_random_open_key(open_keys)
+            position ^= mask
+            mask |= 1 << (key + key // 6)
+            # position ^ mask are bits of player that just played
+            if i > 5 and self.alignment(position ^ mask):
+                self.winner = turn
+                return
+            turn = 3 - turn
+        self.winner = 0
+
+class HeavySimulation(BitSimulation):
+    """
+    Play game from board on bitboards by tactics: take immediate win, else
+    block immediate win of opponent, else random move not under an opponent
+    win. Threat masks of open keys completing 4-in-a-row are kept for both
+    players, only mover's recomputed after each move. Every win is taken as
+    a threat, so moves need no alignment check.
+    """
+
+    threats = staticmethod(BitBoard.threats)
+    bottom_mask = BitBoard.bottom_mask
+    board_mask = BitBoard.board_mask
+
+    def __init__(self, board):
+        """Board may be Board or BitBoard."""
+        position, mask = board.bitboards()
+        self.winner = None
+        self.play(position, mask, board.moves())
+
+    def play(self, position, mask, moves):
+        threats = self.threats
+        rand = random.random
+        bottom_mask = self.bottom_mask
+        board_mask = self.board_mask
+        # bits and threats of player to move, then of opponent
+        bits, other = position, position ^ mask
+        wins, other_wins = threats(bits, mask), threats(other, mask)
+        turn = 1 + moves % 2
+        for _ in range(moves, 42):
+            possible = (mask + bottom_mask) & board_mask
+            if possible & wins:
+                self.winner = turn
+                return
+            move = possible & other_wins
+            if not move:
+                # keys directly below opponent wins hand them over
+                move = possible & ~(other_wins >> 1) or possible
+            if move & (move - 1):
+                choices = []
+                while move:
+                    bit = move & -move
+                    choices.append(bit)
+                    move ^= bit
+                move = choices[int(rand() * len(choices))]
+            bits |= move
+            mask |= move
+            wins = threats(bits, mask)
+            bits, other = other, bits
+            wins, other_wins = other_wins, wins
+            turn = 3 - turn
+        self.winner = 0
+
+class BatchSimulation:
+
+    rng = np.random.default_rng()
+
+    def __init__(self, boards, n=1000):
+        """Play n random games from each board simultaneously as arrays of
+        bitboards. Boards is a board or list of boards. Set counts, array of
+        number of draws, player 1 wins, player 2 wins for each board."""
+        if isinstance(boards, Board):
+            boards = [boards]
+        games = len(boards) * n
+        # bits of player 1 and player 2, laid out as in BitBoard
+        self.bits = np.zeros((2, games), dtype=np.int64)
+        self.heights = np.zeros((games, 7), dtype=np.int64)
+        self.moves = np.zeros(games, dtype=np.int64)
+        self.winner = np.full(games, -1, dtype=np.int64)
+        for i, board in enumerate(boards):
+            games = slice(i*n, (i+1)*n)
+            position, mask = board.bitboards()
+            other = position ^ mask
+            if board.turn() == 2:
+                position, other = other, position
+            self.bits[0, games] = position
+            self.bits[1, games] = other
+            self.heights[games] = [6 - len(board.open_keys.get(col, ()))
+                                   for col in range(7)]
+            self.moves[games] = board.moves()
+            if board.winner is not None:
+                self.winner[games] = board.winner
+        self.play()
+        self.counts = np.stack([(self.winner == w).reshape(-1, n).sum(1)
+                                for w in range(3)], axis=1)
+
+    def play(self):
+        """Play a random open key in every unfinished game until all end."""
+        active = np.flatnonzero(self.winner < 0)
+        while active.size:
+            heights = self.heights[active]
+            # uniform choice of open col as argmax of random floats
+            r = self.rng.random(heights.shape)
+            r[heights == 6] = -1
+            cols = r.argmax(1)
+            rows = heights[np.arange(active.size), cols]
+            moves = self.moves[active]
+            players = moves % 2
+            bits = self.bits[players, active] | (1 << (7*cols + rows))
+            self.bits[players, active] = bits
+            self.heights[active, cols] += 1
+            self.moves[active] = moves + 1
+
+            won = self.alignment(bits)
+            self.winner[active[won]] = players[won] + 1
+            drawn = ~won & (moves == 41)
+            self.winner[active[drawn]] = 0
+            active = active[~(won | drawn)]
+
+    @staticmethod
+    def alignment(bits):
+        """Return bool array, True where bits contain 4-in-a-row."""
+        result = np.zeros(bits.shape, dtype=bool)
+        for shift in (1, 7, 6, 8):
+            m = bits & (bits >> shift)
+            result |= (m & (m >> 2*shift)) != 0
+        return result
@@ -0,0 +1,271 @@
+from math import exp, log
+import time
+
+class CountingTable:
+    """Proxy of table counting probes, hits, stores and overwrites in stats.
+    Overwrites are stores replacing item of another board, counted by
+    bounded tables, so none for unbounded tables. Other attributes are those
+    of table."""
+
+    def __init__(self, table, stats):
+        object.__setattr__(self, 'table', table)
+        object.__setattr__(self, 'stats', stats)
+
+    def __getattr__(self, name):
+        if name in ('table', 'stats'):
+            # unpickling, before __init__ state is set
+            raise AttributeError(name)
+        return getattr(self.table, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.table, name, value)
+
+    def __len__(self):
+        return len(self.table)
+
+    def __contains__(self, board):
+        return board in self.table
+
+    def __getitem__(self, board):
+        self.stats.probes += 1
+        item = self.table[board]
+        if item is not None:
+            self.stats.hits += 1
+        return item
+
+    def get_symm_item(self, board):
+        self.stats.probes += 1
+        symmitem = self.table.get_symm_item(board)
+        if symmitem is not None and symmitem[1] is not None:
+            self.stats.hits += 1
+        return symmitem
+
+    def __setitem__(self, board, item):
+        self.stats.stores += 1
+        table = self.table
+        overwrites = getattr(table, 'overwrites', 0)
+        table[board] = item
+        self.stats.overwrites += getattr(table, 'overwrites', 0) - overwrites
+
+    def __delitem__(self, board):
+        del self.table[board]
+
+
+class SearchStats:
+    """
+    Work done by a tree, counted by wrapping its methods on the instance.
+    Trees carry no counters, so disabled stats cost nothing. Alpha beta
+    trees count nodes, table use, beta cutoffs and iterations; Monte Carlo
+    trees count playouts, their depth and time of each phase; solver counts
+    nodes and cutoffs. Instrumented trees are not sent to other processes.
+    """
+
+    # counters summed by add, in order printed
+    fields = ('nodes', 'probes', 'hits', 'stores', 'overwrites', 'cutoffs',
+              'first_cutoffs', 'iterations', 'iteration_seconds',
+              'branching_logs', 'branchings', 'playouts', 'playout_depths',
+              'explore_seconds', 'expand_seconds', 'simulate_seconds',
+              'backprop_seconds')
+
+    def __init__(self):
+        self.tree = None
+        # names of wrapped methods of tree
+        self.wrapped = []
+        self.reset()
+
+    def __getstate__(self):
+        """Pickle counters only, e.g. with table of a helper process."""
+        state = dict(self.__dict__)
+        state['tree'] = None
+        state['wrapped'] = []
+        return state
+
+    def reset(self):
+        for field in self.fields:
+            setattr(self, field, 0)
+        # depth and nodes of last iteration, for branching factor
+        self.last_iteration = (None, 0)
+
+    def counters(self):
+        """Return dict mapping field to count."""
+        return {field: getattr(self, field) for field in self.fields}
+
+    def add(self, counters):
+        """Add counters of another stats, e.g. of another move or game."""
+        for field in self.fields:
+            setattr(self, field, getattr(self, field) + counters.get(field, 0))
+
+    def attach(self, tree):
+        """Instrument tree. Methods tree lacks are not wrapped."""
+        self.detach()
+        self.tree = tree
+        tree.table = CountingTable(tree.table, self)
+        if hasattr(tree, 'cutoff_test'):
+            self.wrap('cutoff_test', self.count_node)
+            self.wrap('principal_cutoff_test', self.count_node)
+            self.wrap('child_explore', self.count_cutoff)
+            self.wrap('principal_explore', self.count_principal_cutoff)
+            self.wrap('aspiration_explore', self.count_iteration)
+        elif hasattr(tree, 'playout'):
+            self.wrap('explore', self.timed('explore_seconds'))
+            self.wrap('expand', self.timed('expand_seconds'))
+            self.wrap('simulate', self.timed('simulate_seconds'))
+            self.wrap('simulate_counts', self.timed('simulate_seconds'))
+            for name in ('back_propogate', 'back_propogate_counts',
+                         'back_propogate_amaf'):
+                self.wrap(name, self.count_playout)
+            self.wrap('back_propogate_path', self.count_path)
+        elif hasattr(tree, 'negamax'):
+            self.wrap('negamax', self.count_negamax)
+
+    def detach(self):
+        """Restore methods and table of instrumented tree."""
+        if self.tree is None:
+            return
+        for name in self.wrapped:
+            del self.tree.__dict__[name]
+        self.wrapped = []
+        if isinstance(self.tree.table, CountingTable):
+            self.tree.table = self.tree.table.table
+        self.tree = None
+
+    def wrap(self, name, wrapper):
+        method = getattr(self.tree, name, None)
+        if method is not None:
+            setattr(self.tree, name, wrapper(method))
+            self.wrapped.append(name)
+
+    def count_node(self, method):
+        def wrapper(*args):
+            self.nodes += 1
+            return method(*args)
+        return wrapper
+
+    def count_cutoff(self, method):
+        def wrapper(board, depth, alpha, beta, scout):
+            value = method(board, depth, alpha, beta, scout)
+            if value >= beta:
+                self.cutoffs += 1
+                # first child is never scouted
+                if not scout:
+                    self.first_cutoffs += 1
+            return value
+        return wrapper
+
+    def count_principal_cutoff(self, method):
+        # nesting of principal explore, 0 outside root
+        level = [0]
+        def wrapper(board, depth, alpha=-10000, beta=10000):
+            level[0] += 1
+            try:
+                value = method(board, depth, alpha, beta)
+            finally:
+                level[0] -= 1
+            # principal child is first child, parent beta is -alpha
+            if level[0] and value <= alpha:
+                self.cutoffs += 1
+                self.first_cutoffs += 1
+            return value
+        return wrapper
+
+    def count_iteration(self, method):
+        def wrapper(board, depth, guess=None):
+            nodes = self.nodes
+            t0 = time.perf_counter()
+            value = method(board, depth, guess)
+            self.iteration_seconds += time.perf_counter() - t0
+            self.iterations += 1
+            nodes = self.nodes - nodes
+            last_depth, last_nodes = self.last_iteration
+            if last_depth == depth - 1 and last_nodes and nodes:
+                self.branching_logs += log(nodes / last_nodes)
+                self.branchings += 1
+            self.last_iteration = (depth, nodes)
+            return value
+        return wrapper
+
+    def timed(self, field):
+        def decorator(method):
+            def wrapper(*args):
+                t0 = time.perf_counter()
+                result = method(*args)
+                setattr(self, field, getattr(self, field)
+                        + time.perf_counter() - t0)
+                return result
+            return wrapper
+        return decorator
+
+    def count_playout(self, method):
+        def wrapper(board, depth, *args):
+            self.playouts += 1
+            self.playout_depths += depth
+            t0 = time.perf_counter()
+            method(board, depth, *args)
+            self.backprop_seconds += time.perf_counter() - t0
+        return wrapper
+
+    def count_path(self, method):
+        def wrapper(board, path, counts):
+            self.playouts += 1
+            self.playout_depths += len(path) - 1
+            t0 = time.perf_counter()
+            method(board, path, counts)
+            self.backprop_seconds += time.perf_counter() - t0
+        return wrapper
+
+    def count_negamax(self, method):
+        def wrapper(position, mask, moves, alpha, beta):
+            self.nodes += 1
+            score = method(position, mask, moves, alpha, beta)
+            if score >= beta:
+                self.cutoffs += 1
+            return score
+        return wrapper
+
+    def summary(self):
+        """Return dict of nonzero counters and rates derived from them."""
+        result = {}
+        if self.nodes:
+            result['nodes'] = self.nodes
+        if self.probes:
+            result['table probes'] = self.probes
+            result['table hits'] = self.hits
+            result['table hit rate'] = self.hits / self.probes
+            result['table stores'] = self.stores
+            result['table overwrites'] = self.overwrites
+        if self.cutoffs:
+            result['beta cutoffs'] = self.cutoffs
+            if self.first_cutoffs:
+                result['first move cutoff rate'] = (self.first_cutoffs
+                                                    / self.cutoffs)
+        if self.iterations:
+            result['iterations'] = self.iterations
+            result['seconds per iteration'] = (self.iteration_seconds
+                                               / self.iterations)
+            result['nodes/s'] = self.nodes / self.iteration_seconds
+        if self.branchings:
+            result['effective branching factor'] = exp(self.branching_logs
+                                                       / self.branchings)
+        if self.playouts:
+            result['playouts'] = self.playouts
+            result['average depth'] = self.playout_depths / self.playouts
+            others = (self.expand_seconds + self.simulate_seconds
+                      + self.backprop_seconds)
+            seconds = {'selection': self.explore_seconds - others,
+                       'expansion': self.expand_seconds,
+                       'simulation': self.simulate_seconds,
+                       'backprop': self.backprop_seconds}
+            for phase, t in seconds.items():
+                result[phase + ' seconds'] = t
+            if self.explore_seconds:
+                result['playouts/s'] = self.playouts / self.explore_seconds
+        return result
+
+    def __str__(self):
+        lines = []
+        for name, value in self.summary().items():
+            if type(value) is float:
+                lines.append('{:<28} {:>14,.3f}'.format(name, value))
+            else:
+                lines.append('{:<28} {:>14,}'.format(name, value))
+        return '\n'.join(lines)
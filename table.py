@@ -1,3 +1,7 @@
+from array import array
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+
 class TranspositionTable:
     """
     Use board hash value as unique key. Along with board number moves,
@@ -32,34 +36,402 @@ class TranspositionTable:
 
 class SymmetryTable(TranspositionTable):
     """
-    Use board hash value as unique key. Along with board number moves,
+    Use board canonical value as unique key. Along with board number moves,
     table efficiently maps boards to items of interest. Transpositions and
     symmetries collide in table. This saves computation and memory. Trees may
     store essential node data, while children relationships, symmetric moves
-    are computed during search.
+    are computed during search. Items are stored relative to canonical board,
+    see Board.canonical_col.
     """
 
     def __getitem__(self, board):
-        for value in (board.hash_value, board.symm_value):
-            if value in self.table[board.moves()]:
-                return self.table[board.moves()][value]
-        return None
+        return self.table[board.moves()].get(board.canonical_value)
+
+    def __setitem__(self, board, item):
+        self.table[board.moves()][board.canonical_value] = item
 
     def __delitem__(self, board):
-        for value in (board.hash_value, board.symm_value):
-            if value in self.table[board.moves()]:
-                del self.table[board.moves()][value]
-                return
+        self.table[board.moves()].pop(board.canonical_value, None)
 
     def __contains__(self, board):
-        return any(value in self.table[board.moves()]
-                   for value in (board.hash_value, board.symm_value))
+        return board.canonical_value in self.table[board.moves()]
 
     def get_symm_item(self, board):
         """Return value of stored board and permutation mapping stored board
         to given board."""
-        if board.hash_value in self.table[board.moves()]:
-            return (False, self.table[board.moves()][board.hash_value])
-        if board.symm_value in self.table[board.moves()]:
-            return (True, self.table[board.moves()][board.symm_value])
+        item = self.table[board.moves()].get(board.canonical_value)
+        if item is None:
+            return None
+        return (board.hash_value != board.canonical_value, item)
+
+    def retain(self, moves, values):
+        """Keep only entries of boards with given number of moves whose
+        canonical values are in given set."""
+        layer = self.table[moves]
+        if len(values) < len(layer):
+            self.table[moves] = {value: layer[value] for value in values
+                                 if value in layer}
+
+    def retain_items(self, moves, ids):
+        """Keep only entries of boards with given number of moves whose
+        items have ids in given set."""
+        layer = self.table[moves]
+        if len(ids) < len(layer):
+            self.table[moves] = {value: item for value, item in layer.items()
+                                 if id(item) in ids}
+
+class BoundedTable:
+    """
+    Symmetry table of fixed capacity for IterativeDeepeningTree items:
+    (value, exact_flag, depth, best, e_val). Items are packed in one int64
+    with board number moves and stored in preallocated arrays of keys and
+    data. Board canonical value hashes to a bucket of two slots. First slot
+    keeps deepest item, second slot is always replaced. Items of boards with
+    fewer moves than a cleared number of moves are stale and replaced first.
+    Key is stored xor data, so a slot torn by concurrent writes fails to
+    match, see SharedTable.
+    """
+
+    # bit offsets of fields packed in data, zero data is an empty slot
+    # value: 16 bits, flag: 2, depth: 6, best: 3, e_val: 20, moves: 6
+    value_offset = 1 << 15
+    e_val_offset = 1 << 19
+
+    def __init__(self, megabytes=64):
+        """Allocate slots filling given megabytes, 16 bytes each."""
+        self.buckets = max(1, megabytes * 2**20 // 32)
+        self.capacity = 2 * self.buckets
+        self.keys = array('q', [0]) * self.capacity
+        self.data = array('q', [0]) * self.capacity
+        self.min_moves = 0
+        self.filled = 0
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.overwrites = 0
+
+    def __len__(self):
+        """Return number of occupied slots."""
+        return self.filled
+
+    def bucket(self, key):
+        """Return index of first slot of bucket for key. Keys of nearby
+        positions differ by few bits, multiply by golden ratio to spread."""
+        return 2 * (((key * 0x9e3779b97f4a7c15) >> 40) % self.buckets)
+
+    def slot(self, board):
+        """Return index of slot holding board and its data, or None."""
+        key = board.canonical_value
+        i = self.bucket(key)
+        data = self.data[i]
+        if data and self.keys[i] ^ data == key:
+            return i, data
+        i += 1
+        data = self.data[i]
+        if data and self.keys[i] ^ data == key:
+            return i, data
         return None
+
+    def __getitem__(self, board):
+        self.probes += 1
+        slot = self.slot(board)
+        if slot is None:
+            return None
+        self.hits += 1
+        return self.unpack(slot[1])
+
+    def __setitem__(self, board, item):
+        data = self.pack(item, board.moves())
+        key = board.canonical_value
+        i = self.bucket(key)
+        keys = self.keys
+        old = self.data[i]
+        if not (old and keys[i] ^ old == key):
+            other = self.data[i+1]
+            if other and keys[i+1] ^ other == key:
+                i += 1
+            elif (old and not self.is_stale(old)
+                  and (old >> 18) & 63 > item[2]):
+                i += 1
+        old = self.data[i]
+        if not old:
+            self.filled += 1
+        elif keys[i] ^ old != key and not self.is_stale(old):
+            self.overwrites += 1
+        self.stores += 1
+        keys[i] = key ^ data
+        self.data[i] = data
+
+    def __delitem__(self, board):
+        slot = self.slot(board)
+        if slot is not None:
+            self.data[slot[0]] = 0
+            self.filled -= 1
+
+    def __contains__(self, board):
+        return self.slot(board) is not None
+
+    def get_symm_item(self, board):
+        """Return value of stored board and permutation mapping stored board
+        to given board."""
+        item = self[board]
+        if item is None:
+            return None
+        return (board.hash_value != board.canonical_value, item)
+
+    def clear_moves(self, moves):
+        """Mark items of boards with at most given number of moves stale."""
+        self.min_moves = max(self.min_moves, moves + 1)
+
+    def is_stale(self, data):
+        """Return True if data of board with fewer moves than min moves."""
+        return data >> 47 < self.min_moves
+
+    def pack(self, item, moves):
+        """Return item and moves packed as int."""
+        value, exact_flag, depth, best, e_val = item
+        return (value + self.value_offset
+                | int(exact_flag) << 16
+                | depth << 18
+                | (7 if best is None else best) << 24
+                | (0 if e_val is None else e_val + self.e_val_offset) << 27
+                | moves << 47)
+
+    def unpack(self, data):
+        """Return item from packed int."""
+        best = (data >> 24) & 7
+        e_val = (data >> 27) & 0xfffff
+        return ((data & 0xffff) - self.value_offset,
+                (data >> 16) & 3,
+                (data >> 18) & 63,
+                None if best == 7 else best,
+                e_val - self.e_val_offset if e_val else None)
+
+    def stats(self):
+        """Return dict of fill ratio, hit rate and store counts."""
+        return {'capacity': self.capacity,
+                'filled': self.filled,
+                'fill_ratio': self.filled / self.capacity,
+                'probes': self.probes,
+                'hits': self.hits,
+                'hit_rate': self.hits / self.probes if self.probes else 0,
+                'stores': self.stores,
+                'overwrites': self.overwrites}
+
+class SharedTable(BoundedTable):
+    """
+    Bounded table in shared memory, read and written by search processes
+    without locks. Memory holds header, keys, then data. Header holds min
+    moves and a stop flag for searches. Pickled tables attach to same memory.
+    Counts of probes, hits, stores are kept per process.
+    """
+
+    header = 8
+
+    def __init__(self, megabytes=64, name=None):
+        """Create shared memory, or attach to memory of given name."""
+        self.megabytes = megabytes
+        self.buckets = max(1, megabytes * 2**20 // 32)
+        self.capacity = 2 * self.buckets
+        size = 8 * (self.header + 2*self.capacity)
+        if name is None:
+            self.memory = shared_memory.SharedMemory(create=True, size=size)
+            self.owner = True
+        else:
+            self.memory = shared_memory.SharedMemory(name)
+            # creator alone unlinks memory, stop tracker unlinking at exit
+            resource_tracker.unregister(self.memory._name, 'shared_memory')
+            self.owner = False
+        self.view = view = self.memory.buf.cast('q')
+        self.head = view[:self.header]
+        self.keys = view[self.header:self.header+self.capacity]
+        self.data = view[self.header+self.capacity:]
+        self.filled = 0
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.overwrites = 0
+
+    def __getstate__(self):
+        return {'megabytes': self.megabytes, 'name': self.memory.name}
+
+    def __setstate__(self, state):
+        self.__init__(state['megabytes'], state['name'])
+
+    def __len__(self):
+        """Return number of occupied slots of all processes."""
+        return int(np.count_nonzero(np.asarray(self.data)))
+
+    @property
+    def min_moves(self):
+        return self.head[0]
+
+    @min_moves.setter
+    def min_moves(self, moves):
+        self.head[0] = moves
+
+    @property
+    def stopped(self):
+        """True if searches sharing table should stop."""
+        return bool(self.head[1])
+
+    @stopped.setter
+    def stopped(self, stopped):
+        self.head[1] = int(stopped)
+
+    def stats(self):
+        result = super().stats()
+        result['filled'] = len(self)
+        result['fill_ratio'] = result['filled'] / self.capacity
+        return result
+
+    def close(self):
+        """Release views and memory. Creator also unlinks memory. Closing
+        again does nothing."""
+        if self.memory.buf is None:
+            return
+        self.head.release()
+        self.keys.release()
+        self.data.release()
+        self.view.release()
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+class NodePool:
+    """
+    Monte Carlo tree nodes in parallel array columns: wins, sims, expanded
+    flag, moves of board, and seven child node indices per node, by col of
+    canonical board.
+    Child is unlinked if -1, col is full if -2. Canonical values of nodes
+    are indexed by open addressing, so a node costs tens of bytes, no Python
+    objects.
+    """
+
+    unlinked = -1
+    full = -2
+
+    def __init__(self, capacity=2**16):
+        """Reserve index for capacity nodes, index grows as needed."""
+        # float64 wins count half wins of draws exactly past 2**24 sims
+        self.wins = array('d')
+        self.sims = array('i')
+        self.expanded = array('b')
+        self.moves = array('b')
+        self.children = array('i')
+        self.values = array('q')
+        self.size = 1 << max(4, (2 * capacity - 1).bit_length())
+        self.slots = array('i', [-1]) * self.size
+
+    def __len__(self):
+        return len(self.sims)
+
+    def __contains__(self, board):
+        return self.find(board) >= 0
+
+    def slot(self, value):
+        """Return index of slot holding node of canonical value, or of
+        empty slot where it belongs."""
+        mask = self.size - 1
+        i = ((value * 0x9e3779b97f4a7c15) >> 40) & mask
+        slots = self.slots
+        values = self.values
+        while slots[i] >= 0 and values[slots[i]] != value:
+            i = (i + 1) & mask
+        return i
+
+    def find(self, board):
+        """Return index of node of board, -1 if none."""
+        return self.slots[self.slot(board.canonical_value)]
+
+    def add(self, board):
+        """Add node of board, children unlinked. Return its index."""
+        node = len(self.sims)
+        if 2 * (node + 1) > self.size:
+            self.resize(2 * self.size)
+        value = board.canonical_value
+        self.slots[self.slot(value)] = node
+        self.values.append(value)
+        self.wins.append(0)
+        self.sims.append(0)
+        self.expanded.append(0)
+        self.moves.append(board.moves())
+        symm = board.hash_value != value
+        open_keys = board.open_keys
+        self.children.extend(
+            self.unlinked if (6 - col if symm else col) in open_keys
+            else self.full for col in range(7))
+        return node
+
+    def clear_moves(self, moves):
+        """Free nodes of boards of moves, see keep."""
+        if moves not in self.moves:
+            return
+        self.keep([node for node, node_moves in enumerate(self.moves)
+                   if node_moves != moves])
+
+    def resize(self, size):
+        self.size = size
+        self.slots = array('i', [-1]) * size
+        for node, value in enumerate(self.values):
+            self.slots[self.slot(value)] = node
+
+    def child(self, board, node, col):
+        """Return index of child of node at col of board, -1 if unlinked."""
+        if board.hash_value != board.canonical_value:
+            col = 6 - col
+        return self.children[7 * node + col]
+
+    def link(self, board, node, col, child):
+        """Link child of node at col of board."""
+        if board.hash_value != board.canonical_value:
+            col = 6 - col
+        self.children[7 * node + col] = child
+
+    def retain(self, root):
+        """Keep root node and nodes reachable from it, renumbered from 0.
+        Return new index of root."""
+        children = self.children
+        order = [root]
+        reached = {root}
+        for node in order:
+            for child in children[7*node:7*node+7]:
+                if child >= 0 and child not in reached:
+                    reached.add(child)
+                    order.append(child)
+        self.keep(order)
+        return 0
+
+    def keep(self, order):
+        """Keep nodes of order, renumbered by position in order, free all
+        others. Links to freed nodes are unlinked, and their parents no
+        longer expanded, so expand links them again."""
+        renumber = array('i', [-1]) * len(self.sims)
+        for new, node in enumerate(order):
+            renumber[node] = new
+        old_children = self.children
+        children = array('i')
+        expanded = array('b')
+        for node in order:
+            flag = self.expanded[node]
+            for child in old_children[7*node:7*node+7]:
+                if child >= 0:
+                    child = renumber[child]
+                    if child < 0:
+                        flag = 0
+                children.append(child)
+            expanded.append(flag)
+        self.wins = array('d', (self.wins[node] for node in order))
+        self.sims = array('i', (self.sims[node] for node in order))
+        self.moves = array('b', (self.moves[node] for node in order))
+        self.values = array('q', (self.values[node] for node in order))
+        self.children = children
+        self.expanded = expanded
+        self.resize(self.size)
+
+    def nbytes(self):
+        """Return bytes of all columns and index."""
+        return sum(column.itemsize * len(column)
+                   for column in (self.wins, self.sims, self.expanded,
+                                  self.moves, self.children, self.values,
+                                  self.slots))
@@ -0,0 +1,277 @@
+"""
+Endgame tablebase of exact results of late positions. Positions with at
+most a number of empty cells are enumerated from roots, games cut where
+that many cells or more are left, one position per canonical key. Results are
+solved backward from the last ply, each from results of its children, and
+written to a sorted file probed by binary search of its memory map:
+    python tablebase.py endgame.c4tb --empties 10 --games 500
+    python tablebase.py endgame.c4tb --empties 12 --records games.c4gr
+    python tablebase.py endgame.c4tb --empties 10 --cut 13 --games 50
+    python tablebase.py endgame.c4tb --empties 10 \\
+        --root 30140553604102345643560430354666
+Only boards reached from the games are covered. Boards of other games are
+rarely in the file, about none of random games, so probes of searches of
+those cost a binary search each for nothing. Build from records of games
+of the openings played, or from the root of the game searched.
+"""
+import argparse
+from array import array
+from bisect import bisect_left
+import json
+import mmap
+import os
+import random
+import struct
+import sys
+import time
+
+from board import Board, BitBoard
+from records import GameReader
+
+header = struct.Struct('<4sBBHQ')
+
+
+class SortedFile:
+    """
+    Memory mapped file of sorted canonical keys, each with a record of
+    fixed fields. File is header of magic, version, param and count, then
+    keys as little endian unsigned 64 bit ints, then a column of each field,
+    padded to 8 bytes. Use as context manager, or close.
+    """
+
+    magic = b'C4SF'
+    version = 1
+    # array typecodes of fields of records
+    fields = ('b',)
+
+    def __init__(self, path):
+        if sys.byteorder != 'little':
+            raise ValueError('file is little endian, host is not')
+        self.path = path
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.map) < header.size:
+            self.close()
+            raise ValueError('{} is truncated'.format(path))
+        magic, version, self.param, _, count = header.unpack_from(self.map)
+        if magic != self.magic:
+            self.close()
+            raise ValueError('{} is not a {} file'.format(
+                path, type(self).__name__))
+        if version != self.version:
+            self.close()
+            raise ValueError('unknown version {}'.format(version))
+        sizes = [8 * count] + [array(code).itemsize * count
+                               for code in self.fields]
+        if len(self.map) < header.size + sum(s + -s % 8 for s in sizes):
+            self.close()
+            raise ValueError('{} is truncated'.format(path))
+        # views of map, released by close
+        self.view = memoryview(self.map)
+        self.columns = []
+        offset = header.size
+        for code, size in zip(('Q',) + self.fields, sizes):
+            self.columns.append(self.view[offset:offset+size].cast(code))
+            offset += size + -size % 8
+        self.keys = self.columns.pop(0)
+
+    @classmethod
+    def write(cls, path, param, records):
+        """Write dict mapping key to tuple of fields of record."""
+        if sys.byteorder != 'little':
+            raise ValueError('file is little endian, host is not')
+        keys = sorted(records)
+        with open(path, 'wb') as f:
+            f.write(header.pack(cls.magic, cls.version, param, 0, len(keys)))
+            f.write(array('Q', keys).tobytes())
+            for i, code in enumerate(cls.fields):
+                data = array(code, [records[key][i] for key in keys])
+                data = data.tobytes()
+                f.write(data + bytes(-len(data) % 8))
+
+    def __getstate__(self):
+        """Pickle path only, e.g. with tree sent to a worker process."""
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def index(self, key):
+        """Return index of key, None if key is not in file."""
+        keys = self.keys
+        i = bisect_left(keys, key)
+        if i < len(keys) and keys[i] == key:
+            return i
+        return None
+
+    def get(self, key):
+        """Return tuple of fields of record of key, None if not in file."""
+        i = self.index(key)
+        if i is None:
+            return None
+        return tuple(column[i] for column in self.columns)
+
+    def close(self):
+        for view in getattr(self, 'columns', []) + [
+                getattr(self, 'keys', None), getattr(self, 'view', None)]:
+            if view is not None:
+                view.release()
+        if not self.map.closed:
+            self.map.close()
+        self.file.close()
+
+
+class Tablebase(SortedFile):
+    """
+    Exact results of positions with at most empties empty cells, from
+    point of view of player to move: 1 win, 0 draw, -1 loss. Probes and
+    hits are counted.
+    """
+
+    magic = b'C4TB'
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.empties = self.param
+        self.values = self.columns[0]
+        self.probes = self.hits = 0
+
+    def probe(self, board):
+        """Return result of board, None if board has more empty cells or
+        is not in file."""
+        if 42 - board.moves() > self.empties:
+            return None
+        return self.probe_key(board.canonical_value)
+
+    def probe_key(self, key):
+        """Return result of canonical key, None if not in file."""
+        self.probes += 1
+        i = self.index(key)
+        if i is None:
+            return None
+        self.hits += 1
+        return self.values[i]
+
+    def summary(self):
+        return {'probes': self.probes, 'hits': self.hits,
+                'hit rate': self.hits / self.probes if self.probes else 0.0}
+
+
+def enumerate_positions(board, levels):
+    """Add board and boards reached from it to levels, list mapping number
+    of moves to dict. Dict maps canonical key to result if terminal, else
+    to list of canonical keys of children."""
+    level = levels[board.moves()]
+    key = board.canonical_value
+    if key in level:
+        return
+    if board.is_terminal():
+        # player to move lost, or board is full
+        level[key] = -1 if board.winner else 0
+        return
+    children = level[key] = []
+    for col in list(board.open_keys):
+        board.push(col)
+        children.append(board.canonical_value)
+        enumerate_positions(board, levels)
+        board.pop()
+
+def descend(board, empties, levels):
+    """Enumerate boards with empties empty cells reached from board, see
+    enumerate_positions."""
+    if 42 - board.moves() <= empties:
+        enumerate_positions(board, levels)
+        return
+    if board.is_terminal():
+        return
+    for col in list(board.open_keys):
+        board.push(col)
+        descend(board, empties, levels)
+        board.pop()
+
+def solve_endgames(roots, empties):
+    """Return dict mapping canonical key of each board with at most empties
+    empty cells reached from roots to its result for player to move."""
+    levels = [{} for _ in range(43)]
+    for root in roots:
+        descend(BitBoard.from_board(root), empties, levels)
+    results = {}
+    # children are one ply later, so solved first
+    for moves in range(42, -1, -1):
+        for key, children in levels[moves].items():
+            if type(children) is int:
+                results[key] = children
+            else:
+                results[key] = max(-results[child] for child in children)
+    return results
+
+def cut_games(games, empties):
+    """Yield board of each game of cols after its first 42 - empties cols.
+    Games ending earlier are skipped."""
+    for cols in games:
+        if len(cols) < 42 - empties:
+            continue
+        board = Board()
+        for col in cols[:42-empties]:
+            board.push(col)
+        if not board.is_terminal():
+            yield board
+
+def random_games(games, seed=0):
+    """Yield cols of random games, seeded."""
+    rand = random.Random(seed)
+    for _ in range(games):
+        board = BitBoard()
+        while not board.is_terminal():
+            board.push(rand.choice(list(board.open_keys)))
+        yield [key // 6 for key in board.played_keys]
+
+def build(path, games, empties, cut=None):
+    """Solve boards reached from games of cols cut at cut empty cells,
+    default empties, and write tablebase. Return dict of positions, seconds
+    and bytes of file."""
+    t0 = time.perf_counter()
+    roots = cut_games(games, empties if cut is None else cut)
+    results = solve_endgames(roots, empties)
+    Tablebase.write(path, empties,
+                    {key: (value,) for key, value in results.items()})
+    return {'positions': len(results),
+            'seconds': time.perf_counter() - t0,
+            'bytes': os.path.getsize(path)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('path', help='tablebase file to write')
+    parser.add_argument('--empties', type=int, default=10,
+                        help='empty cells of positions')
+    parser.add_argument('--games', type=int, default=100,
+                        help='random games cut at empties')
+    parser.add_argument('--cut', type=int,
+                        help='empty cells of games cut, default empties, '
+                             'more covers boards before')
+    parser.add_argument('--records', help='game record file of games, '
+                                          'instead of random games')
+    parser.add_argument('--root', help='cols of one board, all boards '
+                                       'reached from it, instead of games')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    cut = args.cut
+    if args.root is not None:
+        games = [[int(col) for col in args.root]]
+        cut = 42 - len(args.root)
+    elif args.records:
+        with GameReader(args.records) as reader:
+            games = [record.cols for record in reader]
+    else:
+        games = random_games(args.games, args.seed)
+    print(json.dumps(build(args.path, games, args.empties, cut)))
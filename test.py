@@ -1,3 +1,40 @@
+import json
+import numpy as np
+import os
+import pickle
+import random
+import tempfile
+import unittest
+import unittest.mock
+
+from board import Board, BitBoard, HashBoard
+from simulation import (Simulation, Simulator, BitSimulation,
+                        HeavySimulation, BatchSimulation)
+from table import BoundedTable, SharedTable, NodePool, SymmetryTable
+from tree import (IterativeDeepeningTree, UpperConfidenceBoundTree, SolverTree,
+                  LazySMPTree, TimeIterativeDeepeningTree,
+                  PoolUpperConfidenceBoundTree, RaveUpperConfidenceBoundTree)
+from search import (RootParallelMonteCarloTreeSearch, LazySMPTreeSearch,
+                    TimeIterativeDeepeningTreeSearch, TimeMonteCarloTreeSearch,
+                    MonteCarloTreeSearch, IterativeDeepeningTreeSearch)
+from ordering import MoveOrdering
+from clock import Clock
+from game import Game, TimeGame, SearchAnalysis
+from player import Player, Spawn
+from stats import SearchStats
+from analysis import (Analyst, parse_position, analyze_stream,
+                      main as analysis_main)
+from selfplay import SelfPlay
+from tablebase import (SortedFile, Tablebase, build, cut_games,
+                       random_games)
+from book import OpeningBook, book_positions, build as build_book
+from records import (GameWriter, GameReader, pack_cols, unpack_cols,
+                     replay)
+from tournament import (Tournament, parse_entrant, entrant_label,
+                        opening_suite, elo, sprt)
+from benchmark import (benchmarks, check, perft, run, search_speed,
+                       uct_iterations)
+
 # class TestBoard(unittest.TestCase):
 #
 #     @classmethod
@@ -265,3 +302,1157 @@
 #
 # if __name__ == '__main__':
 #     unittest.main()
+
+
+def random_cols(rng, board=None):
+    """Return cols of random game played on copy of board until end state."""
+    board = Board() if board is None else Board.from_board(board)
+    cols = []
+    while not board.is_terminal():
+        col = rng.choice(list(board.open_keys))
+        board.push(col)
+        cols.append(col)
+    return cols
+
+class TestBitBoard(unittest.TestCase):
+
+    def test_push_pop(self):
+        rng = random.Random(1)
+        for _ in range(200):
+            board = Board()
+            bitboard = BitBoard()
+            for col in random_cols(rng):
+                board.push(col)
+                bitboard.push(col)
+                self.assertEqual(bitboard.winner, board.winner)
+                self.assertEqual(bitboard.values, board.values)
+                self.assertEqual(bitboard.hash_value, board.hash_value)
+                self.assertEqual(bitboard.symm_value, board.symm_value)
+                self.assertEqual(bitboard.bitboards(), board.bitboards())
+                self.assertEqual(bitboard.evaluation(), board.evaluation())
+            while board.played_keys:
+                board.pop()
+                bitboard.pop()
+                self.assertEqual(bitboard.values, board.values)
+                self.assertEqual(bitboard.hash_value, board.hash_value)
+                self.assertEqual(bitboard.open_keys, board.open_keys)
+            self.assertEqual(bitboard.bitboards(), (0, 0))
+
+    def test_simulation(self):
+        rng = random.Random(2)
+        for _ in range(50):
+            board = BitBoard()
+            for col in random_cols(rng)[:rng.randrange(30)]:
+                board.push(col)
+            for simulation_cls in (Simulation, BitSimulation):
+                self.assertIn(simulation_cls(board).winner, (0, 1, 2))
+
+class TestHashBoard(unittest.TestCase):
+
+    def test_hash_values(self):
+        rng = random.Random(3)
+        seen = {}
+        for _ in range(200):
+            board = Board()
+            mirror = Board()
+            for col in random_cols(rng):
+                board.push(col)
+                mirror.push(board.symm_col(col))
+                self.assertEqual(board.hash_value, HashBoard.hash(board))
+                self.assertLess(board.hash_value, 1 << 49)
+                self.assertEqual(board.symm_value, mirror.hash_value)
+                self.assertEqual(board.canonical_value,
+                                 mirror.canonical_value)
+                values = seen.setdefault(board.hash_value, list(board.values))
+                self.assertEqual(values, board.values)
+
+class TestEvaluation(unittest.TestCase):
+
+    def test_incremental(self):
+        rng = random.Random(4)
+        for _ in range(200):
+            board = Board()
+            bitboard = BitBoard()
+            for col in random_cols(rng):
+                board.push(col)
+                bitboard.push(col)
+                self.assertEqual(board.evaluation(), board.scan_evaluation())
+                self.assertEqual(bitboard.evaluation(), board.evaluation())
+                if rng.random() < .2:
+                    board.pop()
+                    bitboard.pop()
+                    self.assertEqual(board.evaluation(),
+                                     board.scan_evaluation())
+                    self.assertEqual(bitboard.evaluation(),
+                                     board.evaluation())
+                    board.push(col)
+                    bitboard.push(col)
+            copy = Board(list(board.values), list(board.played_keys))
+            self.assertEqual(copy.evaluation(), board.scan_evaluation())
+
+class TestBatchSimulation(unittest.TestCase):
+
+    def test_alignment(self):
+        rng = random.Random(5)
+        for _ in range(50):
+            board = BitBoard()
+            for col in random_cols(rng):
+                board.push(col)
+                bits = board.position ^ board.mask
+                won = BatchSimulation.alignment(np.array([bits]))[0]
+                self.assertEqual(won, BitBoard.alignment(bits))
+
+    def test_counts(self):
+        rng = random.Random(6)
+        boards = []
+        for _ in range(20):
+            board = Board()
+            for col in random_cols(rng)[:rng.randrange(1, 42)]:
+                board.push(col)
+            boards.append(board)
+        counts = BatchSimulation(boards, 30).counts
+        self.assertEqual(counts.shape, (20, 3))
+        for board, count in zip(boards, counts):
+            self.assertEqual(count.sum(), 30)
+            if board.is_terminal():
+                self.assertEqual(count[board.winner], 30)
+
+class TestBoundedTable(unittest.TestCase):
+
+    def test_items(self):
+        table = BoundedTable(1)
+        board = Board()
+        for col in (3, 2, 4, 4):
+            board.push(col)
+        for item in ((-10000, True, 42, None, None), (57, False, 3, 6, -120),
+                     (0, 2, 0, None, 4)):
+            table[board] = item
+            self.assertIn(board, table)
+            self.assertEqual(table[board], item)
+            self.assertEqual(table.get_symm_item(board), (True, item))
+        del table[board]
+        self.assertNotIn(board, table)
+        self.assertEqual(len(table), 0)
+
+    def test_search(self):
+        board = Board()
+        for col in (3, 3, 2, 4):
+            board.push(col)
+        values = []
+        for table in (None, BoundedTable(1)):
+            tree = IterativeDeepeningTree(table=table)
+            for depth in range(1, 7):
+                value = tree.principal_explore(board, depth)
+            values.append(value)
+        self.assertEqual(values[0], values[1])
+        stats = table.stats()
+        self.assertLessEqual(stats['filled'], stats['capacity'])
+        self.assertGreater(stats['hits'], 0)
+
+    def test_root_evicted(self):
+        board = Board()
+        for col in (3, 3, 2, 4):
+            board.push(col)
+        search = Spawn.get_search('bounditerative', None, None)
+        tree = search.tree
+        search.explore(board, (6,))
+        best = tree.most_valuable(board)
+        del tree.table[board]
+        self.assertIsNone(tree.table.get_symm_item(board))
+        self.assertEqual(tree.most_valuable(board), best)
+        # without kept root, best col of children
+        tree.root = None
+        self.assertIn(tree.most_valuable(board)[0], board.open_keys)
+
+class TestSolverTree(unittest.TestCase):
+
+    # cols played and score for current player
+    positions = [('1141465142351133000452254232560240330', -1),
+                 ('6311230624536630055022462362131455', 1),
+                 ('12052305013656112043356360161305644522', 0),
+                 ('54103562445044620455205216262110306', -1)]
+
+    def test_solve(self):
+        tree = SolverTree()
+        for cols, score in self.positions:
+            board = BitBoard()
+            for col in cols:
+                board.push(int(col))
+            position, mask = board.bitboards()
+            self.assertEqual(tree.solve(position, mask, board.moves()), score)
+
+    def test_bounds(self):
+        # few slots, bounds replaced by colliding keys, scores still exact
+        tree = SolverTree(max_bounds=7)
+        for cols, score in self.positions:
+            board = BitBoard()
+            for col in cols:
+                board.push(int(col))
+            position, mask = board.bitboards()
+            self.assertEqual(tree.solve(position, mask, board.moves()), score)
+        self.assertEqual(len(tree.keys), 7)
+        self.assertEqual(len(tree.bounds), 7)
+
+    def test_explore(self):
+        for exact_children in (False, True):
+            tree = SolverTree(exact_children)
+            board = Board()
+            for col in '6311230624536630055022462362131455':
+                board.push(int(col))
+            tree.explore(board)
+            key_values = tree.children_key_values(board)
+            self.assertEqual(max(value for _, value in key_values), 1)
+            for key in tree.most_valuable(board):
+                board.push(key)
+                position, mask = board.bitboards()
+                score = tree.solve(position, mask, board.moves())
+                self.assertEqual(-score, 1)
+                board.pop()
+
+class TestRootParallel(unittest.TestCase):
+
+    def test_merge(self):
+        search = RootParallelMonteCarloTreeSearch(UpperConfidenceBoundTree())
+        board = Board()
+        board.push(3)
+        try:
+            search.explore(board, (400, 2))
+        finally:
+            search.close()
+        search.evaluate(board)
+        # mirror children of symmetric board share sims, counted twice
+        sims = sum(sims for _, _, sims in search.key_items)
+        self.assertGreaterEqual(sims, 400 - 2)
+        self.assertEqual(sorted(key for key, _ in search.key_values),
+                         list(range(7)))
+        self.assertEqual(len(search.tree.table), 0)
+
+    def test_one_worker(self):
+        search = RootParallelMonteCarloTreeSearch(UpperConfidenceBoundTree())
+        board = Board()
+        random.seed(5)
+        rng = BatchSimulation.rng
+        search.explore(board, (200, 1))
+        self.assertEqual(len(search.tree.table), 0)
+        self.assertIs(BatchSimulation.rng, rng)
+        # only seed of worker drawn from random state of process
+        state = random.getstate()
+        random.seed(5)
+        random.getrandbits(32)
+        self.assertEqual(random.getstate(), state)
+        self.assertGreaterEqual(sum(sims for _, _, sims in search.key_items),
+                                200)
+
+class TestLazySMP(unittest.TestCase):
+
+    def test_attach(self):
+        table = SharedTable(1)
+        try:
+            board = Board()
+            board.push(3)
+            table[board] = (5, True, 4, 3, 2)
+            table.clear_moves(0)
+            other = pickle.loads(pickle.dumps(table))
+            self.assertEqual(other[board], (5, True, 4, 3, 2))
+            self.assertEqual(other.min_moves, 1)
+            other.stopped = True
+            self.assertTrue(table.stopped)
+            other.close()
+        finally:
+            table.close()
+
+    def test_search(self):
+        # helpers share table, only block of col 0 avoids loss
+        board = Board()
+        for col in (0, 6, 0, 6, 0):
+            board.push(col)
+        search = LazySMPTreeSearch(LazySMPTree(SharedTable(1)))
+        try:
+            search.explore(board, (6, 3))
+        finally:
+            search.stop_helpers()
+            search.evaluate(board)
+            search.close()
+        self.assertEqual(search.most_valuable, [0])
+        self.assertGreater(search.nodes, search.tree.nodes)
+        # shared memory is unlinked, closing again does nothing
+        with self.assertRaises(FileNotFoundError):
+            SharedTable(1, search.tree.table.memory.name)
+        search.close()
+
+    def test_player(self):
+        board = Board()
+        for col in (0, 6, 0, 6, 0):
+            board.push(col)
+        player = Spawn.get_player('lazysmp', (2, 2))
+        with SearchAnalysis('lazysmp', (2, 2), board) as analysis:
+            name = analysis.search.tree.table.memory.name
+        self.assertIsNone(analysis.search.pool)
+        with self.assertRaises(FileNotFoundError):
+            SharedTable(1, name)
+        game = Game(board, player, Spawn.get_player('random'))
+        game.play()
+        game.close()
+        with self.assertRaises(FileNotFoundError):
+            SharedTable(1, player.search.tree.table.memory.name)
+
+class TestMoveOrdering(unittest.TestCase):
+
+    def test_order(self):
+        ordering = MoveOrdering()
+        board = Board()
+        board.push(3)
+        self.assertEqual(ordering.order(board), [3, 2, 4, 1, 5, 0, 6])
+        ordering.cutoff(board, 0, 2)
+        ordering.cutoff(board, 6, 1)
+        self.assertEqual(ordering.order(board)[:3], [6, 0, 3])
+        self.assertEqual(ordering.order(board, 5)[:3], [5, 6, 0])
+        board.push(3)
+        self.assertEqual(ordering.order(board)[:2], [3, 2])
+
+    def test_tactics(self):
+        # block col 0, win in col 6
+        tree = IterativeDeepeningTree(ordering=MoveOrdering())
+        for cols, best in (('06060', 0), ('0606165', 6)):
+            board = Board()
+            for col in cols:
+                board.push(int(col))
+            for depth in range(1, 5):
+                tree.principal_explore(board, depth)
+            self.assertEqual(tree.most_valuable(board), [best])
+
+    def test_table(self):
+        # ordering stores no entries of children cut off unsearched
+        board = Board()
+        board.push(3)
+        sizes = []
+        for ordering in (None, MoveOrdering()):
+            tree = IterativeDeepeningTree(ordering=ordering)
+            for depth in range(1, 5):
+                tree.principal_explore(board, depth)
+            sizes.append(len(tree.table))
+        self.assertLess(sizes[1], sizes[0])
+
+class TestPrincipalVariation(unittest.TestCase):
+
+    def test_value(self):
+        # windows change nodes searched, not value of root
+        rng = random.Random(2)
+        for _ in range(10):
+            board = Board()
+            for col in random_cols(rng)[:rng.randrange(16)]:
+                board.push(col)
+            if board.is_terminal():
+                continue
+            values = []
+            for kwargs in ({}, {'pvs': True}, {'pvs': True, 'aspiration': 5}):
+                tree = IterativeDeepeningTree(**kwargs)
+                guesses = [None, None]
+                for depth in range(1, 7):
+                    guesses.append(tree.aspiration_explore(board, depth,
+                                                           guesses[-2]))
+                values.append(guesses[-1])
+            self.assertEqual(values[0], values[1])
+            self.assertEqual(values[0], values[2])
+
+    def test_upper_bound(self):
+        # fail low stores upper bound, not exact value
+        board = Board()
+        board.push(3)
+        tree = IterativeDeepeningTree()
+        value = tree.principal_explore(board, 3)
+        tree = IterativeDeepeningTree()
+        self.assertLessEqual(tree.explore(board, 3, value + 1, value + 2),
+                             value)
+        self.assertEqual(tree.table[board][1], tree.upper)
+        self.assertEqual(tree.explore(board, 3), value)
+
+class TestTimeControl(unittest.TestCase):
+
+    def test_clock(self):
+        clock = Clock(margin=0)
+        clock.start(21, 0)
+        self.assertAlmostEqual(clock.budget, 1)
+        self.assertAlmostEqual(clock.hard_budget, 3)
+        clock.start(8, 40)
+        self.assertAlmostEqual(clock.budget, 2)
+        self.assertAlmostEqual(clock.hard_budget, 4)
+        clock.start(None, 0)
+        self.assertFalse(clock.hard_expired())
+
+    def test_hard_deadline(self):
+        # iteration cut off, board restored, key of completed depth kept
+        tree = TimeIterativeDeepeningTree(check_nodes=16)
+        search = TimeIterativeDeepeningTreeSearch(tree,
+                                                  Clock(hard_ratio=.001))
+        game = TimeGame(Board(), t=2)
+        key = search.strategy(game, (42,))
+        self.assertIn(key, game.board.open_keys)
+        self.assertEqual(game.board.moves(), 0)
+        self.assertLess(search.depth, 42)
+        _, hard_budget, used = search.clock.history[-1]
+        self.assertLess(used, hard_budget + .05)
+
+    def test_game(self):
+        players = [Player('idtime',
+                          TimeIterativeDeepeningTreeSearch(
+                              TimeIterativeDeepeningTree()), (42,)),
+                   Player('ucttime',
+                          TimeMonteCarloTreeSearch(UpperConfidenceBoundTree()),
+                          (10**6,))]
+        game = TimeGame(Board(), *players, t=.5)
+        self.assertIn(game.play(), (0, 1, 2))
+        self.assertGreater(game.time1, 0)
+        self.assertGreater(game.time2, 0)
+        # untimed game searches to given bounds
+        game = Game(Board(), *players)
+        players[0].strategy_args = (2,)
+        players[1].strategy_args = (50,)
+        self.assertIn(game.play(), (0, 1, 2))
+
+class TestTreeReuse(unittest.TestCase):
+
+    def test_prune(self):
+        random.seed(0)
+        search = MonteCarloTreeSearch(UpperConfidenceBoundTree())
+        tree = search.tree
+        board = Board()
+        tree.explore(board, 500)
+        board.push(3)
+        item = list(tree.table[board])
+        search.advance(board)
+        before, after = search.retained[-1]
+        self.assertLess(after, before)
+        self.assertEqual(tree.table[board][:2], item[:2])
+        self.assertEqual(len(tree.table.table[0]), 0)
+        # entries are exactly board and items linked from it
+        reached = [set() for _ in range(43)]
+        tree.reach(tree.table[board], 1, reached)
+        self.assertEqual(after, sum(map(len, reached)))
+        # kept items link only kept items, search continues on them
+        ids = set().union(*reached)
+        for layer in tree.table.table:
+            for entry in layer.values():
+                self.assertIn(id(entry), ids)
+                for child in entry[4]:
+                    if child is not None:
+                        self.assertIn(id(child), ids)
+        tree.explore(board, 100)
+        self.assertEqual(tree.table[board][1], item[1] + 100)
+        # board without entry frees table
+        for col in (0, 0, 6, 6, 0, 6, 1, 1):
+            board.push(col)
+        search.advance(board)
+        self.assertEqual(len(tree.table), 0)
+class TestNodePool(unittest.TestCase):
+
+    def test_index(self):
+        pool = NodePool(4)
+        rng = random.Random(3)
+        boards = []
+        for cols in (random_cols(rng) for _ in range(20)):
+            board = Board()
+            for col in cols:
+                board.push(col)
+                if pool.find(board) < 0:
+                    pool.add(board)
+                    boards.append(Board.from_board(board))
+        self.assertEqual(len(pool), len(boards))
+        for node, board in enumerate(boards):
+            self.assertEqual(pool.find(board), node)
+        # mirror board finds same node, children by its own cols
+        board = Board()
+        board.push(0)
+        node = pool.add(board) if pool.find(board) < 0 else pool.find(board)
+        pool.link(board, node, 1, 5)
+        mirror = Board()
+        mirror.push(6)
+        self.assertEqual(pool.find(mirror), node)
+        self.assertEqual(pool.child(mirror, node, 5), 5)
+
+    def test_tree(self):
+        random.seed(4)
+        tree = PoolUpperConfidenceBoundTree()
+        board = Board()
+        tree.explore(board, 2000)
+        pool = tree.table
+        self.assertEqual(pool.sims[pool.find(board)], 2000)
+        self.assertEqual(board.moves(), 0)
+        # expanded nodes link all open children
+        for node in range(len(pool)):
+            if pool.expanded[node]:
+                self.assertNotIn(-1, pool.children[7*node:7*node+7])
+        board.push(3)
+        child = pool.sims[pool.find(board)]
+        before, after = tree.prune(board)
+        self.assertLess(after, before)
+        self.assertEqual(tree.table.find(board), 0)
+        self.assertEqual(tree.table.sims[0], child)
+
+    def test_clear_moves(self):
+        random.seed(5)
+        tree = PoolUpperConfidenceBoundTree()
+        board = Board()
+        tree.explore(board, 1000)
+        pool = tree.table
+        before = len(pool)
+        pool.clear_moves(1)
+        self.assertLess(len(pool), before)
+        self.assertNotIn(1, pool.moves)
+        self.assertEqual(pool.find(board), 0)
+        self.assertEqual(pool.sims[0], 1000)
+        # root no longer expanded, links its children again
+        self.assertEqual(pool.expanded[0], 0)
+        tree.explore(board, 200)
+        self.assertEqual(pool.sims[pool.find(board)], 1200)
+        for node in range(len(pool)):
+            if pool.expanded[node]:
+                self.assertNotIn(-1, pool.children[7*node:7*node+7])
+
+    def test_analyst(self):
+        analyst = Analyst('poolconfidence', (200,), max_entries=100)
+        try:
+            analyst.analyze(0, '33')
+            self.assertLessEqual(len(analyst.search.tree.table), 100)
+        finally:
+            analyst.close()
+
+    def test_wins(self):
+        pool = NodePool(4)
+        node = pool.add(Board())
+        pool.wins[node] = 2**24
+        pool.wins[node] += 0.5
+        self.assertEqual(pool.wins[node], 2**24 + 0.5)
+
+class TestChildLinks(unittest.TestCase):
+
+    def test_bandit(self):
+        # linked child stats select as children found in table
+        random.seed(5)
+        tree = UpperConfidenceBoundTree()
+        board = Board()
+        tree.explore(board, 3000)
+        for _ in range(200):
+            depth = 0
+            item = tree.table[board]
+            while item[2]:
+                parent_sims = item[1]
+                expected = max(tree.children_key_items(board),
+                               key=lambda keyitem:
+                               tree.upper_confidence_bound1(*keyitem[1:],
+                                                            parent_sims))[0]
+                key = tree.bandit(board, item)
+                self.assertEqual(key, expected)
+                board.push(random.choice(list(board.open_keys)))
+                depth += 1
+                item = tree.table[board]
+                if item is None:
+                    break
+            for _ in range(depth):
+                board.pop()
+
+class TestRave(unittest.TestCase):
+
+    def test_amaf(self):
+        random.seed(6)
+        tree = RaveUpperConfidenceBoundTree()
+        board = Board()
+        board.push(2)
+        # stats by key of canonical board, here board itself
+        self.assertEqual(board.hash_value, board.canonical_value)
+        tree.explore(board, 1000)
+        self.assertEqual(board.played_keys, [12])
+        item = tree.table[board]
+        self.assertEqual(item[1], 1000)
+        # player to move plays some key of each col in nearly all playouts
+        amaf_sims = item[6]
+        self.assertTrue(all(sims <= 1000 for sims in amaf_sims))
+        self.assertEqual(amaf_sims[12], 0)
+        self.assertGreater(amaf_sims[18], 400)
+        for key, child in enumerate(item[4]):
+            # child played by key in tree, counted in its amaf stats
+            self.assertGreaterEqual(amaf_sims[6*key + (key == 2)],
+                                    child[1])
+
+class TestHeavySimulation(unittest.TestCase):
+
+    def test_threats(self):
+        rng = random.Random(7)
+        for _ in range(100):
+            board = BitBoard()
+            for col in random_cols(rng)[:-1][:rng.randrange(30)]:
+                board.push(col)
+            position, mask = board.bitboards()
+            threats = BitBoard.threats(position, mask)
+            for col in range(7):
+                for row in range(6):
+                    bit = 1 << (7 * col + row)
+                    expected = (not mask & bit
+                                and BitBoard.alignment(position | bit))
+                    self.assertEqual(bool(threats & bit), expected)
+
+    def test_tactics(self):
+        random.seed(8)
+        for cols, turn in (('06060', 2), ('060606', 1)):
+            board = Board()
+            for col in cols:
+                board.push(int(col))
+            winners = [HeavySimulation(board).winner for _ in range(100)]
+            if turn == 1:
+                # player 1 takes win in col 0
+                self.assertEqual(set(winners), {1})
+            else:
+                # player 2 blocks col 0, player 1 no longer always wins
+                self.assertLess(winners.count(1), 100)
+
+
+class TestSimulator(unittest.TestCase):
+
+    def test_run(self):
+        rng = random.Random(9)
+        random.seed(9)
+        simulator = Simulator()
+        for _ in range(100):
+            board = Board()
+            for col in random_cols(rng)[:-1][:rng.randrange(30)]:
+                board.push(col)
+            before = list(board.values)
+            winner = simulator.run(board)
+            self.assertEqual(board.values, before)
+            values = simulator.values
+            for key in range(42):
+                if before[key]:
+                    self.assertEqual(values[key], before[key])
+            # cols filled from bottom, players alternate
+            for col in range(7):
+                rows = values[6*col:6*col+6]
+                self.assertEqual(rows, sorted(rows, key=lambda v: not v))
+            self.assertIn(values.count(1) - values.count(2), (0, 1))
+            if winner:
+                self.assertEqual(simulator.winner, winner)
+            else:
+                self.assertNotIn(0, values)
+
+    def test_tree(self):
+        random.seed(10)
+        tree = UpperConfidenceBoundTree()
+        simulator = tree.simulator
+        tree.explore(Board(), 200)
+        self.assertIs(tree.simulator, simulator)
+        self.assertEqual(tree.table[Board()][1], 200)
+
+
+class TestTournament(unittest.TestCase):
+
+    def test_entrant(self):
+        for text in ('random', 'iterative:6', 'lazysmp:6,2', 'idtime:0.5'):
+            self.assertEqual(entrant_label(parse_entrant(text)), text)
+        entrants = [('lazysmp', (2, 2)), ('random', ())]
+        self.assertRaises(ValueError, Tournament, entrants, 'results.jsonl',
+                          workers=2)
+        Tournament(entrants, 'results.jsonl', workers=1)
+
+    def test_openings(self):
+        self.assertEqual(opening_suite(1), ['0', '1', '2', '3'])
+        # 49 pairs, only 33 mirrors itself
+        self.assertEqual(len(opening_suite(2)), 25)
+
+    def test_elo(self):
+        estimate, low, high = elo(30, 20, 10)
+        self.assertLess(low, estimate)
+        self.assertLess(estimate, high)
+        self.assertAlmostEqual(estimate, -elo(10, 20, 30)[0])
+        self.assertEqual(elo(5, 5, 5)[0], 0)
+        self.assertEqual(sprt(60, 20, 20, 0, 50)[1], 'H1')
+        self.assertEqual(sprt(20, 20, 60, 0, 50)[1], 'H0')
+        self.assertIsNone(sprt(5, 5, 5, 0, 50)[1])
+
+    def test_run(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'results.jsonl')
+            entrants = [('iterative', (2,)), ('random', ())]
+            tournament = Tournament(entrants, path, openings=1, workers=1)
+            standings = tournament.run()
+            self.assertEqual(standings[0][:2], ('iterative:2', 8))
+            with open(path) as f:
+                self.assertEqual(len(f.readlines()), 9)
+            # resumed run plays no game, reads same results
+            resumed = Tournament(entrants, path, openings=1, workers=1)
+            self.assertEqual(resumed.run(), standings)
+            with open(path) as f:
+                self.assertEqual(len(f.readlines()), 9)
+            # killed run leaves partial line, its game is played again
+            with open(path, 'rb') as f:
+                data = f.read()
+            with open(path, 'wb') as f:
+                f.write(data[:-10])
+            resumed = Tournament(entrants, path, openings=1, workers=1)
+            self.assertEqual(resumed.run(), standings)
+            with open(path) as f:
+                lines = f.readlines()
+            self.assertEqual(len(lines), 9)
+            for line in lines:
+                json.loads(line)
+            other = Tournament(entrants, path, openings=2, workers=1)
+            self.assertRaises(ValueError, other.run)
+
+    def test_sprt(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'results.jsonl')
+            entrants = [('iterative', (3,)), ('random', ())]
+            tournament = Tournament(entrants, path, openings=2, rounds=2,
+                                    sprt=(0, 100, .05, .05), workers=1)
+            tournament.run()
+            self.assertEqual(tournament.decisions[(0, 1)], 'H1')
+            self.assertLess(sum(tournament.results[(0, 1)]), 112)
+
+
+class TestSearchStats(unittest.TestCase):
+
+    def test_iterative(self):
+        search = IterativeDeepeningTreeSearch(IterativeDeepeningTree())
+        tree = search.tree
+        table = tree.table
+        stats = search.enable_stats()
+        board = Board()
+        search.explore(board, (5,))
+        self.assertEqual(stats.iterations, 5)
+        self.assertGreater(stats.nodes, 0)
+        self.assertGreater(stats.hits, 0)
+        self.assertLessEqual(stats.hits, stats.probes)
+        self.assertLessEqual(stats.first_cutoffs, stats.cutoffs)
+        self.assertGreater(stats.summary()['effective branching factor'], 1)
+        search.disable_stats()
+        self.assertIs(tree.table, table)
+        self.assertNotIn('cutoff_test', vars(tree))
+        nodes = stats.nodes
+        search.explore(board, (6,))
+        self.assertEqual(stats.nodes, nodes)
+
+    def test_cutoffs(self):
+        # each beta cutoff stores lower bound of parent above depth 0
+        class CutoffTable(SymmetryTable):
+            cutoffs = 0
+            def __setitem__(self, board, item):
+                if item[1] is False and item[2]:
+                    CutoffTable.cutoffs += 1
+                super().__setitem__(board, item)
+        board = Board()
+        for col in (3, 3, 2):
+            board.push(col)
+        # windows of aspiration fail principal nodes high
+        for pvs, aspiration in ((False, None), (True, 1)):
+            CutoffTable.cutoffs = 0
+            tree = IterativeDeepeningTree(table=CutoffTable(), pvs=pvs,
+                                          aspiration=aspiration)
+            search = IterativeDeepeningTreeSearch(tree)
+            stats = search.enable_stats()
+            search.explore(board, (6,))
+            self.assertEqual(stats.cutoffs, CutoffTable.cutoffs)
+            self.assertEqual(stats.overwrites, 0)
+        tree = IterativeDeepeningTree(table=BoundedTable(1))
+        stats = IterativeDeepeningTreeSearch(tree).enable_stats()
+        tree.aspiration_explore(Board(), 6)
+        self.assertEqual(stats.overwrites, tree.table.table.overwrites)
+        self.assertGreater(stats.overwrites, 0)
+
+    def test_monte_carlo(self):
+        random.seed(11)
+        trees = (UpperConfidenceBoundTree(), RaveUpperConfidenceBoundTree(),
+                 PoolUpperConfidenceBoundTree())
+        for tree in trees:
+            search = MonteCarloTreeSearch(tree)
+            stats = search.enable_stats()
+            search.explore(Board(), (300,))
+            self.assertEqual(stats.playouts, 300)
+            summary = stats.summary()
+            self.assertGreater(summary['average depth'], 0)
+            self.assertGreater(summary['simulation seconds'], 0)
+            search.disable_stats()
+            self.assertNotIn('playout', vars(tree))
+            self.assertNotIn('back_propogate', vars(tree))
+
+    def test_add(self):
+        stats = SearchStats()
+        other = SearchStats()
+        other.nodes = 3
+        stats.add(other.counters())
+        stats.add(other.counters())
+        self.assertEqual(stats.nodes, 6)
+        self.assertEqual(pickle.loads(pickle.dumps(stats)).nodes, 6)
+
+
+class TestAnalysis(unittest.TestCase):
+
+    def test_parse(self):
+        self.assertEqual(parse_position('332\n').moves(), 3)
+        for line in ('33x', '0000000', '0101010', '01010101'):
+            self.assertRaises(ValueError, parse_position, line)
+
+    def test_stream(self):
+        lines = ['3322', 'bad', '', '06060'] * 3
+        for workers in (1, 2):
+            records = list(analyze_stream(iter(lines), 'iterative', (4,),
+                                          workers, window=3))
+            self.assertEqual([r['index'] for r in records],
+                             list(range(len(lines))))
+            for record in records[::4]:
+                # open two, player to move wins
+                self.assertIn(record['best'], (1, 4))
+                self.assertEqual(record['value'], 10000)
+                self.assertEqual(record['depth'], 4)
+            for record in records[1::4]:
+                self.assertIn('error', record)
+            for record in records[3::4]:
+                # block col 0
+                self.assertEqual(record['best'], 0)
+
+    def test_processes(self):
+        # players with pools of their own cannot run in pool workers
+        self.assertTrue(Spawn.starts_processes('lazysmp', (2, 2)))
+        self.assertFalse(Spawn.starts_processes('rootparallel', (10, 1)))
+        self.assertFalse(Spawn.starts_processes('iterative', (2,)))
+        with self.assertRaises(ValueError):
+            list(analyze_stream([''], 'rootparallel', (10, 2), 2))
+        with self.assertRaises(SystemExit):
+            analysis_main(['lazysmp:2,2', '--workers', '2'])
+        records = list(analyze_stream(['06060'], 'lazysmp', (2, 2), 1))
+        self.assertEqual(records[0]['best'], 0)
+
+    def test_monte_carlo(self):
+        analyst = Analyst('confidence', (200,), stats=True)
+        record = analyst.analyze(0, '332')
+        self.assertEqual(record['iterations'], 200)
+        self.assertTrue(0 <= record['value'] <= 1)
+        self.assertEqual(record['stats']['playouts'], 200)
+
+
+class TestRecords(unittest.TestCase):
+
+    def test_pack(self):
+        rng = random.Random(12)
+        for moves in range(43):
+            cols = [rng.randrange(7) for _ in range(moves)]
+            data = pack_cols(cols)
+            self.assertEqual(len(data), (moves + 1) // 2)
+            self.assertEqual(unpack_cols(data, moves), cols)
+
+    def test_write_read(self):
+        random.seed(13)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'games.c4gr')
+            boards = []
+            with GameWriter(path) as writer:
+                for _ in range(20):
+                    game = Game(Board(), Spawn.get_player('random'),
+                                Spawn.get_player('iterative', (1,)))
+                    game.play(writer)
+                    boards.append(game.board)
+            with GameWriter(path) as writer:
+                writer.write([3, 3], 0, writer.player_id('iterative'),
+                             writer.player_id('solver'))
+            with GameReader(path) as reader:
+                records = list(reader)
+                names = reader.names
+            self.assertEqual(names, {0: 'random', 1: 'iterative',
+                                     2: 'solver'})
+            self.assertEqual(len(records), 21)
+            for board, record in zip(boards, records):
+                self.assertEqual((record.player1, record.player2), (0, 1))
+                self.assertEqual(record.result, board.winner)
+                self.assertEqual(replay(record).played_keys,
+                                 board.played_keys)
+            self.assertEqual(records[-1], (0, 1, 2, [3, 3]))
+            # partial record of interrupted writer is skipped
+            with open(path, 'ab') as f:
+                f.write(bytes((9, 1)))
+            with GameReader(path) as reader:
+                self.assertEqual(len(list(reader)), 21)
+            # and truncated before appending
+            with GameWriter(path) as writer:
+                writer.write([4], 0)
+                self.assertRaises(ValueError, writer.player_id, 'x' * 253)
+                writer.player_id('x' * 252)
+            with GameReader(path) as reader:
+                records = list(reader)
+                self.assertEqual(reader.end, os.path.getsize(path))
+            self.assertEqual(records[-1], (0, 0, 0, [4]))
+            self.assertEqual(reader.names[3], 'x' * 252)
+            with open(path, 'wb') as f:
+                f.write(b'not records')
+            self.assertRaises(ValueError, GameReader, path)
+            open(path, 'wb').close()
+            with GameReader(path) as reader:
+                self.assertEqual(list(reader), [])
+            with GameWriter(path) as writer:
+                writer.write([3], 0)
+            with GameReader(path) as reader:
+                self.assertEqual(list(reader), [(0, 0, 0, [3])])
+
+
+class TestSelfPlay(unittest.TestCase):
+
+    def test_run(self):
+        for workers in (1, 2):
+            with tempfile.TemporaryDirectory() as directory:
+                # no random plies, same game each time, all but first
+                # game duplicates
+                self_play = SelfPlay([('iterative', (2,))], directory, 6,
+                                     workers, shards=3, queue_size=2,
+                                     random_plies=0)
+                counts = self_play.run()
+                self.assertEqual(counts['games'], 6)
+                self.assertLess(counts['written'], counts['positions'])
+                positions = []
+                for i in range(3):
+                    name = 'positions-{:03d}.jsonl'.format(i)
+                    with open(os.path.join(directory, name)) as f:
+                        for line in f:
+                            position = json.loads(line)
+                            self.assertEqual(
+                                SelfPlay.mix(position['key']) % 3, i)
+                            positions.append(position)
+            self.assertEqual(len(positions), counts['written'])
+            keys = [position['key'] for position in positions]
+            self.assertEqual(len(set(keys)), len(keys))
+            for position in positions:
+                board = parse_position(position['moves'])
+                self.assertEqual(board.canonical_value, position['key'])
+                self.assertIn(position['move'], board.open_keys)
+                self.assertIn(position['result'], (-1, 0, 1))
+
+    def test_seen(self):
+        self.assertRaises(ValueError, SelfPlay, [('rootparallel', (10, 2))],
+                          None, 0, workers=2)
+        self_play = SelfPlay([('random', ())], None, 0, max_keys=4)
+        self.assertFalse(self_play.seen(0))
+        self.assertTrue(self_play.seen(0))
+        keys = range(1, 100)
+        for key in keys:
+            self_play.seen(key)
+        # memory is fixed, evicted keys are written again
+        self.assertEqual(len(self_play.keys), 4)
+        self.assertFalse(all(self_play.seen(key) for key in keys))
+
+
+class TestTablebase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.path = os.path.join(cls.directory.name, 'endgame.c4tb')
+        cls.games = [c for c in random_games(200, seed=1)
+                     if len(c) > 32][:3]
+        build(cls.path, cls.games, 8, cut=10)
+        cls.tablebase = Tablebase(cls.path)
+
+    def boards(self):
+        """Return boards of games cut at 10 empty cells."""
+        return list(cut_games(self.games, 10))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tablebase.close()
+        cls.directory.cleanup()
+
+    def test_results(self):
+        solver = SolverTree()
+        rng = random.Random(0)
+        for board in self.boards():
+            self.assertIsNone(self.tablebase.probe(board))
+            while not board.is_terminal():
+                board.push(rng.choice(list(board.open_keys)))
+                if board.is_terminal():
+                    break
+                result = self.tablebase.probe(board)
+                if board.moves() < 34:
+                    self.assertIsNone(result)
+                    continue
+                score = solver.solve(*board.bitboards(), board.moves())
+                self.assertEqual(result, (score > 0) - (score < 0))
+
+    def test_file(self):
+        self.assertEqual(self.tablebase.empties, 8)
+        keys = list(self.tablebase.keys)
+        self.assertEqual(keys, sorted(set(keys)))
+        self.assertIsNone(self.tablebase.probe_key(keys[-1] + 1))
+        copy = pickle.loads(pickle.dumps(self.tablebase))
+        self.assertEqual(copy.get(keys[0]), self.tablebase.get(keys[0]))
+        copy.close()
+        with self.assertRaises(ValueError):
+            SortedFile(self.path)
+
+    def test_search(self):
+        for board in self.boards():
+            board.push(next(iter(board.open_keys)))
+            board.push(next(iter(board.open_keys)))
+            if board.is_terminal():
+                continue
+            tree = IterativeDeepeningTree(tablebase=self.tablebase)
+            value = tree.principal_explore(board, 1)
+            result = self.tablebase.probe(board)
+            self.assertEqual(value, 10000 * result)
+            simulator = Simulator()
+            winner = simulator.run(board, self.tablebase)
+            self.assertEqual(
+                winner, board.turn() if result > 0 else
+                board.other() if result else 0)
+            # probed before any random col
+            self.assertEqual(simulator.canonical_value(),
+                             board.canonical_value)
+
+    def test_root(self):
+        # root in tablebase has item without best col, from a search of
+        # earlier turn or its own probe
+        games = [c for c in random_games(2000, seed=5) if len(c) >= 38][:5]
+        path = os.path.join(self.directory.name, 'root.c4tb')
+        build(path, games, 8, cut=12)
+        tablebase = Tablebase(path)
+        self.addCleanup(tablebase.close)
+        for board in cut_games(games, 12):
+            player = Spawn.get_player('iterative', (4,),
+                                      tablebase=tablebase)
+            game = Game(board)
+            while not board.is_terminal():
+                col = player.move(game)
+                self.assertIn(col, board.open_keys)
+                result = tablebase.probe(board)
+                board.push(col)
+                if result is not None and not board.is_terminal():
+                    # best col keeps result
+                    self.assertEqual(tablebase.probe(board), -result)
+
+    def test_monte_carlo(self):
+        rng = random.Random(0)
+        for board in self.boards():
+            while not board.is_terminal() and board.moves() < 34:
+                board.push(rng.choice(list(board.open_keys)))
+            if board.is_terminal():
+                continue
+            result = self.tablebase.probe(board)
+            winner = (board.turn() if result > 0 else
+                      board.other() if result else 0)
+            for tree in (UpperConfidenceBoundTree(tablebase=self.tablebase),
+                         UpperConfidenceBoundTree(board_cls=BitBoard,
+                                                  tablebase=self.tablebase)):
+                self.assertEqual(tree.simulate(board), winner)
+            tree = UpperConfidenceBoundTree(playouts=4,
+                                            tablebase=self.tablebase)
+            counts = [0]*3
+            counts[winner] = 4
+            self.assertEqual(tree.simulate_counts(board), counts)
+        with self.assertRaises(ValueError):
+            Spawn.get_player('random', tablebase=self.tablebase)
+
+
+class TestOpeningBook(unittest.TestCase):
+
+    def test_positions(self):
+        self.assertEqual([len(book_positions(p)) for p in range(4)],
+                         [1, 5, 30, 151])
+        keys = [parse_position(line).canonical_value
+                for line in book_positions(3)]
+        self.assertEqual(len(set(keys)), len(keys))
+
+    def test_book(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'opening.c4ob')
+            counts = build_book(path, 1, 'iterative', (2,))
+            self.assertEqual(counts['positions'], 5)
+            with self.assertRaises(ValueError):
+                build_book(path, 0, 'confidence', (10,))
+            book = OpeningBook(path)
+            for col in range(7):
+                board = Board()
+                board.push(col)
+                mirror = Board()
+                mirror.push(6 - col)
+                best, value = book.lookup(board)
+                mirror_best, mirror_value = book.lookup(mirror)
+                self.assertEqual(mirror_value, value)
+                if col != 3:
+                    # board of center col is its own mirror
+                    self.assertEqual(mirror_best, 6 - best)
+                board.push(best)
+                self.assertIsNone(book.lookup(board))
+            self.assertEqual(book.summary()['hits'], 14)
+            for name in ('iterative', 'idtime', 'confidence', 'ucttime'):
+                player = Spawn.get_player(name, (10**6,), book=book)
+                self.assertEqual(player.move(Game()), book.lookup(Board())[0])
+            best, value = book.lookup(Board())
+            book.close()
+            # analysis answers boards in book by it, searches the rest
+            records = list(analyze_stream(['', '33'], 'iterative', (2,),
+                                          book=path))
+            self.assertEqual((records[0]['best'], records[0]['value']),
+                             (best, value))
+            self.assertIsNotNone(records[1]['value'])
+            # self-play and tournament players play col of book
+            self_play = SelfPlay([('iterative', (1,))], directory, 1,
+                                 random_plies=0, book=path)
+            self_play.run()
+            shard = SelfPlay.mix(Board().canonical_value) % 8
+            name = 'positions-{:03d}.jsonl'.format(shard)
+            with open(os.path.join(directory, name)) as f:
+                position = json.loads(f.readline())
+            self.assertEqual((position['moves'], position['move'],
+                              position['value']), ('', best, value))
+            results = os.path.join(directory, 'results.jsonl')
+            tournament = Tournament([('iterative', (1,)), ('random', ())],
+                                    results, openings=['3'], workers=1,
+                                    book=path)
+            tournament.run()
+            with open(results) as f:
+                self.assertEqual(json.loads(f.readline())['config']['book'],
+                                 path)
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_perft(self):
+        result = perft(3)
+        self.assertEqual(result['Board perft(3)'], 7**3)
+        self.assertEqual(result['BitBoard perft(3)'], 7**3)
+        self.assertGreater(result['BitBoard nodes/s'], 0)
+
+    def test_search(self):
+        result = search_speed(2)
+        self.assertGreater(result['nodes'], 0)
+        self.assertLessEqual(result['seconds to depth 1'],
+                             result['seconds to depth 2'])
+        self.assertGreater(uct_iterations(20)['iterations/s'], 0)
+
+    def test_check(self):
+        results = {'perft': {'nodes/s': 100.0, 'count': 5}}
+        self.assertEqual(check(results, {'perft': {'nodes/s': 50}}), [])
+        self.assertEqual(check(results, {'perft': {'count': {'min': 5,
+                                                             'max': 5}}}),
+                         [])
+        failures = check(results, {'perft': {'nodes/s': 200,
+                                             'count': {'max': 4}},
+                                   'solver': {'nodes/s': 1}})
+        self.assertEqual(failures, ['perft nodes/s: 100.0 below 200',
+                                    'perft count: 5 above 4',
+                                    'solver nodes/s: missing'])
+
+    def test_run(self):
+        names = ['perft', 'uct_iterations']
+        small = {'perft': lambda: perft(2),
+                 'uct_iterations': lambda: uct_iterations(20)}
+        with unittest.mock.patch.dict(benchmarks, small):
+            output = run(names, {'perft': {'BitBoard perft(2)': 50}},
+                         quiet=True)
+        output = json.loads(json.dumps(output))
+        self.assertEqual(sorted(output),
+                         ['environment', 'failures', 'results'])
+        self.assertEqual(sorted(output['results']), names)
+        self.assertEqual(output['results']['perft']['BitBoard perft(2)'],
+                         49)
+        self.assertIn('python', output['environment'])
+        self.assertIn('commit', output['environment'])
+        self.assertEqual(output['failures'],
+                         ['perft BitBoard perft(2): 49 below 50'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,392 @@
+"""
+Tournaments between Spawn players, played in a process pool. Entrants are
+player names with strategy args. Pairs play each opening of a suite twice,
+colors swapped. Results stream to a JSONL file, one game per line, and a run
+is resumed by starting it again with the same file. Pairs stop early once a
+sequential probability ratio test decides between two Elo hypotheses.
+    python tournament.py results.jsonl iterative:6 confidence:2000
+    python tournament.py results.jsonl pvsiterative:7 iterative:7 --gauntlet
+        --sprt 0 20 --openings 3 --rounds 50
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import numpy as np
+import os
+import queue
+import random
+import time
+
+from board import Board
+from game import Game
+from player import Spawn
+from stats import SearchStats
+
+
+def parse_entrant(text):
+    """Return entrant, tuple of name and strategy args, from text such as
+    'lazysmp:6,2'. Args are ints, else floats."""
+    name, _, args = text.partition(':')
+    strategy_args = []
+    for arg in filter(None, args.split(',')):
+        try:
+            strategy_args.append(int(arg))
+        except ValueError:
+            strategy_args.append(float(arg))
+    return name, tuple(strategy_args)
+
+def entrant_label(entrant):
+    """Inverse of parse_entrant."""
+    name, strategy_args = entrant
+    if not strategy_args:
+        return name
+    return name + ':' + ','.join(str(arg) for arg in strategy_args)
+
+def opening_suite(plies, board_cls=Board):
+    """Return sorted list of openings, cols played as str, of every position
+    at plies from empty board. Mirrors and transpositions appear once."""
+    openings = {}
+    def visit(board, cols):
+        if board.is_terminal():
+            return
+        if len(cols) == plies:
+            openings.setdefault(board.canonical_value, cols)
+            return
+        for col in list(board.open_keys):
+            board.push(col)
+            visit(board, cols + str(col))
+            board.pop()
+    visit(board_cls(), '')
+    return sorted(openings.values())
+
+def play_game(spec):
+    """Play game given by spec, dict from Tournament.schedule. Players are
+    new each game. Return record: spec with winner (0, 1, or 2), score of
+    first entrant of pair, plies and seconds, and if stats, counters of
+    SearchStats of each entrant."""
+    random.seed(spec['seed'])
+    np.random.seed(spec['seed'])
+    board = Board()
+    for col in spec['opening']:
+        board.push(int(col))
+    first, second = spec['colors']
+    book = None
+    if spec.get('book'):
+        # book imports this module
+        from book import OpeningBook
+        book = OpeningBook(spec['book'])
+    players = {i: Spawn.get_player(*spec['entrants'][i], book=book)
+               for i in (first, second)}
+    if spec['stats']:
+        for player in players.values():
+            player.search.enable_stats()
+    # first of colors moves next after opening
+    player1, player2 = players[first], players[second]
+    if board.turn() == 2:
+        player1, player2 = player2, player1
+    t0 = time.perf_counter()
+    game = Game(board, player1, player2)
+    try:
+        winner = game.play()
+    finally:
+        game.close()
+        if book is not None:
+            book.close()
+    record = {key: spec[key] for key in ('id', 'pair', 'colors', 'opening')}
+    record['winner'] = winner
+    if winner == 0:
+        record['score'] = .5
+    else:
+        winning_player = (player1, player2)[winner-1]
+        record['score'] = float(winning_player is players[spec['pair'][0]])
+    record['plies'] = board.moves()
+    record['seconds'] = time.perf_counter() - t0
+    if spec['stats']:
+        record['stats'] = {i: player.search.stats.counters()
+                           for i, player in players.items()}
+    return record
+
+def elo(wins, draws, losses, z=1.96):
+    """Return Elo difference of score and its confidence interval, tuple of
+    estimate, low and high, from game counts. Interval at z standard errors
+    of mean score. Perfect scores give infinite bounds."""
+    n = wins + draws + losses
+    if not n:
+        return 0.0, -math.inf, math.inf
+    score = (wins + draws / 2) / n
+    variance = (wins * (1 - score)**2 + draws * (.5 - score)**2
+                + losses * score**2) / n
+    error = z * math.sqrt(variance / n)
+    return (score_elo(score), score_elo(score - error),
+            score_elo(score + error))
+
+def score_elo(score):
+    """Return Elo difference of expected score."""
+    if score <= 0:
+        return -math.inf
+    if score >= 1:
+        return math.inf
+    return -400 * math.log10(1 / score - 1)
+
+def elo_score(elo_diff):
+    """Return expected score of Elo difference."""
+    return 1 / (1 + 10**(-elo_diff / 400))
+
+def sprt(wins, draws, losses, elo0, elo1, alpha=.05, beta=.05):
+    """Return log likelihood ratio of H1: elo = elo1 against H0: elo = elo0
+    and decision: 'H1', 'H0', or None to continue. Trinomial model,
+    normal approximation of score. Variance counts half a pseudo game of
+    each result, so that sweeps decide."""
+    n = wins + draws + losses
+    if not n:
+        return 0.0, None
+    score = (wins + draws / 2) / n
+    variance = ((wins + .5) * (1 - score)**2 + (draws + .5) * (.5 - score)**2
+                + (losses + .5) * score**2) / (n + 1.5)
+    score0, score1 = elo_score(elo0), elo_score(elo1)
+    llr = n * (score1 - score0) * (2*score - score0 - score1) / (2*variance)
+    if llr >= math.log((1 - beta) / alpha):
+        return llr, 'H1'
+    if llr <= math.log(beta / (1 - alpha)):
+        return llr, 'H0'
+    return llr, None
+
+
+class Tournament:
+    """
+    Round robin of entrants, or gauntlet of first entrant against the rest.
+    Each pair plays each opening once per round with both colors. Records of
+    games append to path. A run skips games already in path, after checking
+    path was written by same configuration.
+    """
+
+    def __init__(self, entrants, path, openings=2, rounds=1, gauntlet=False,
+                 sprt=None, workers=None, seed=0, stats=False, book=None):
+        """Entrants are tuples of name and strategy args, see parse_entrant.
+        Openings are list of cols played as str, or plies of opening_suite.
+        Sprt is None or tuple of elo0, elo1, alpha, beta, tested on each
+        pair. Workers default to cpu count, 1 plays in this process. Stats
+        records search stats of players in each game, see SearchStats. Book
+        is path of opening book consulted by all players, see OpeningBook.
+        Players starting processes play with 1 worker only, see
+        Spawn.starts_processes."""
+        for name, _ in entrants:
+            if name not in Spawn.players or name == 'user':
+                raise ValueError('unknown player: {}'.format(name))
+        self.entrants = [(name, tuple(args)) for name, args in entrants]
+        self.path = path
+        if isinstance(openings, int):
+            openings = opening_suite(openings)
+        self.openings = list(openings)
+        self.rounds = rounds
+        self.gauntlet = gauntlet
+        self.sprt = tuple(sprt) if sprt is not None else None
+        self.workers = workers or os.cpu_count()
+        for name, args in self.entrants:
+            if self.workers > 1 and Spawn.starts_processes(name, args):
+                raise ValueError('{} starts processes, play with 1 worker'
+                                 .format(entrant_label((name, args))))
+        self.seed = seed
+        if gauntlet:
+            self.pairs = [(0, j) for j in range(1, len(self.entrants))]
+        else:
+            self.pairs = [(i, j) for i in range(len(self.entrants))
+                          for j in range(i+1, len(self.entrants))]
+        # map pair to list of wins, draws, losses of first entrant
+        self.results = {pair: [0, 0, 0] for pair in self.pairs}
+        # map pair to sprt decision: 'H1', 'H0', or None
+        self.decisions = dict.fromkeys(self.pairs)
+        self.stats = stats
+        self.book = book
+        # SearchStats summed over games of each entrant
+        self.entrant_stats = [SearchStats() for _ in self.entrants]
+
+    def config(self):
+        config = {'entrants': [entrant_label(e) for e in self.entrants],
+                  'openings': self.openings, 'rounds': self.rounds,
+                  'gauntlet': self.gauntlet, 'sprt': self.sprt,
+                  'seed': self.seed}
+        # files of runs without book resume
+        if self.book is not None:
+            config['book'] = self.book
+        return config
+
+    def schedule(self):
+        """Return list of game specs, pairs interleaved so that an
+        interrupted run is balanced. Both colors of an opening share seed."""
+        specs = []
+        for _ in range(self.rounds):
+            for opening in self.openings:
+                for pair in self.pairs:
+                    seed = self.seed + len(specs)
+                    for colors in (pair, pair[::-1]):
+                        specs.append({'id': len(specs), 'pair': pair,
+                                      'colors': colors, 'opening': opening,
+                                      'seed': seed,
+                                      'entrants': self.entrants,
+                                      'stats': self.stats,
+                                      'book': self.book})
+        return specs
+
+    def resume(self):
+        """Read records of path, write config if new. Return set of ids
+        already played. Partial last line of interrupted run is truncated,
+        its game is played again."""
+        played = set()
+        line = b''
+        if os.path.exists(self.path):
+            with open(self.path, 'rb') as f:
+                line = f.readline()
+        if not line.endswith(b'\n'):
+            with open(self.path, 'w') as f:
+                f.write(json.dumps({'config': self.config()}) + '\n')
+            return played
+        end = len(line)
+        with open(self.path, 'rb') as f:
+            header = json.loads(f.readline())
+            if header.get('config') != json.loads(json.dumps(self.config())):
+                raise ValueError('{} has another configuration'.format(
+                    self.path))
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                end += len(line)
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # damaged line, its game is played again
+                    continue
+                record['pair'] = tuple(record['pair'])
+                played.add(record['id'])
+                self.add(record)
+        if end < os.path.getsize(self.path):
+            # next record starts on its own line
+            os.truncate(self.path, end)
+        return played
+
+    def add(self, record):
+        """Count record of game in results and update decision of pair."""
+        pair = record['pair']
+        counts = self.results[pair]
+        counts[(1.0, .5, 0.0).index(record['score'])] += 1
+        for i, counters in record.get('stats', {}).items():
+            self.entrant_stats[int(i)].add(counters)
+        if self.sprt is not None and self.decisions[pair] is None:
+            self.decisions[pair] = sprt(*counts, *self.sprt)[1]
+
+    def run(self):
+        """Play games not yet in path. Return standings."""
+        played = self.resume()
+        pending = [spec for spec in self.schedule()
+                   if spec['id'] not in played]
+        with open(self.path, 'a') as f:
+            for record in self.play(pending):
+                f.write(json.dumps(record) + '\n')
+                f.flush()
+        return self.standings()
+
+    def play(self, specs):
+        """Yield records of games of specs, as they finish. No new game of a
+        pair starts after its sprt decision."""
+        specs = iter(specs)
+        def next_spec():
+            for spec in specs:
+                if self.decisions[tuple(spec['pair'])] is None:
+                    return spec
+        if self.workers == 1:
+            for spec in iter(next_spec, None):
+                record = play_game(spec)
+                self.add(record)
+                yield record
+            return
+        finished = queue.Queue()
+        with multiprocessing.Pool(self.workers) as pool:
+            running = 0
+            while True:
+                # keep pool busy, few games ahead of decisions
+                while running < 2 * self.workers:
+                    spec = next_spec()
+                    if spec is None:
+                        break
+                    pool.apply_async(play_game, (spec,),
+                                     callback=finished.put,
+                                     error_callback=finished.put)
+                    running += 1
+                if not running:
+                    return
+                record = finished.get()
+                running -= 1
+                if isinstance(record, BaseException):
+                    raise record
+                self.add(record)
+                yield record
+
+    def standings(self):
+        """Return list of tuples: label, games, score, elo, low, high, sorted
+        by score. Elo of entrant is its performance against its opponents."""
+        counts = [[0, 0, 0] for _ in self.entrants]
+        for (i, j), (wins, draws, losses) in self.results.items():
+            for k, result in ((i, (wins, draws, losses)),
+                              (j, (losses, draws, wins))):
+                for c in range(3):
+                    counts[k][c] += result[c]
+        result = []
+        for entrant, (wins, draws, losses) in zip(self.entrants, counts):
+            result.append((entrant_label(entrant), wins + draws + losses,
+                           wins + draws / 2, *elo(wins, draws, losses)))
+        return sorted(result, key=lambda row: -row[2])
+
+    def report(self):
+        print('{:<24} {:>6} {:>7} {:>7} {:>15}'.format(
+            'player', 'games', 'score', 'elo', '95% interval'))
+        for label, games, score, estimate, low, high in self.standings():
+            print('{:<24} {:>6} {:>7.1f} {:>7.0f} {:>7.0f} {:>7.0f}'.format(
+                label, games, score, estimate, low, high))
+        for pair, counts in self.results.items():
+            label = ' vs '.join(entrant_label(self.entrants[i]) for i in pair)
+            line = '{:<40} +{} ={} -{}'.format(label, *counts)
+            if self.sprt is not None:
+                llr, decision = sprt(*counts, *self.sprt)
+                line += '  llr {:.2f} {}'.format(llr, decision or '')
+            print(line)
+        for entrant, stats in zip(self.entrants, self.entrant_stats):
+            if any(stats.counters().values()):
+                print('\n' + entrant_label(entrant))
+                print(stats)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('path', help='JSONL file of results, resumed')
+    parser.add_argument('entrants', nargs='+', type=parse_entrant,
+                        help='player name and strategy args, e.g. '
+                             'iterative:6, or lazysmp:6,2 with --workers 1')
+    parser.add_argument('--gauntlet', action='store_true',
+                        help='first entrant plays each other entrant')
+    parser.add_argument('--openings', type=int, default=2,
+                        help='plies of opening suite')
+    parser.add_argument('--rounds', type=int, default=1)
+    parser.add_argument('--sprt', type=float, nargs=2,
+                        metavar=('ELO0', 'ELO1'))
+    parser.add_argument('--alpha', type=float, default=.05)
+    parser.add_argument('--beta', type=float, default=.05)
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--stats', action='store_true',
+                        help='record and print search stats of players')
+    parser.add_argument('--book', help='opening book consulted by players, '
+                                       'see book.py')
+    args = parser.parse_args()
+    sprt_args = None
+    if args.sprt:
+        sprt_args = (*args.sprt, args.alpha, args.beta)
+    try:
+        tournament = Tournament(args.entrants, args.path, args.openings,
+                                args.rounds, args.gauntlet, sprt_args,
+                                args.workers, args.seed, args.stats,
+                                args.book)
+    except ValueError as error:
+        parser.error(str(error))
+    tournament.run()
+    tournament.report()
@@ -1,16 +1,28 @@
-from table import SymmetryTable
-from simulation import Simulation
+from table import SymmetryTable, NodePool
+from simulation import (Simulation, Simulator, BitSimulation,
+                        HeavySimulation, BatchSimulation)
 import random
 import time
+from array import array
 from math import log, sqrt
 
 class Tree:
 
-    def __init__(self):
+    def __init__(self, board_cls=None, table=None):
+        """Board class is used for search, e.g. BitBoard. None searches
+        given board. Table defaults to unbounded SymmetryTable."""
         self.table_cls = SymmetryTable
-        self.table = SymmetryTable()
+        self.table = SymmetryTable() if table is None else table
+        self.board_cls = board_cls
 
-from board import Board
+    def get_board(self, board):
+        """Return board as instance of board class. Boards share hash values,
+        so table entries are valid for either."""
+        if self.board_cls is None or type(board) is self.board_cls:
+            return board
+        return self.board_cls.from_board(board)
+
+from board import Board, BitBoard
 
 # class QLearningTable:
 #
@@ -44,9 +56,44 @@ from board import Board
 class IterativeDeepeningTree(Tree):
 
     # table: value, exact_flag, depth, best, e_val
+    # exact_flag is False for lower bound, upper for upper bound
+    upper = 2
+
+    def __init__(self, board_cls=None, table=None, ordering=None, pvs=False,
+                 aspiration=None, tablebase=None):
+        """Ordering is a MoveOrdering, None orders children by their
+        evaluation, pushing each and storing it in table. Pvs scouts all but
+        first child with null window. Aspiration is half width of window
+        around value of an earlier iteration, see aspiration_explore.
+        Tablebase gives exact values of late boards, see tablebase_test."""
+        super().__init__(board_cls, table)
+        self.ordering = ordering
+        self.pvs = pvs
+        self.aspiration = aspiration
+        self.tablebase = tablebase
+        # hash value and best col of root of last aspiration explore, kept
+        # apart from table, which may evict root
+        self.root = None
+
+    def aspiration_explore(self, board, depth, guess=None):
+        """Principal explore with window around guess, value of an earlier
+        iteration. Explore again with full window if value falls outside.
+        Return value. Best col of board is kept, see most_valuable."""
+        if self.aspiration is None or guess is None:
+            value = self.principal_explore(board, depth)
+        else:
+            alpha = guess - self.aspiration
+            beta = guess + self.aspiration
+            value = self.principal_explore(board, depth, alpha, beta)
+            if value <= alpha or value >= beta:
+                value = self.principal_explore(board, depth)
+        self.root = None
+        self.root = (board.hash_value, self.most_valuable(board)[0])
+        return value
 
     def principal_explore(self, board, depth, alpha=-10000, beta=10000):
-        result, item, symm = self.principal_cutoff_test(board, depth, beta)
+        result, item, symm = self.principal_cutoff_test(board, depth, beta,
+                                                        alpha)
         if result:
             return item[0]
 
@@ -54,8 +101,10 @@ class IterativeDeepeningTree(Tree):
         value = -10001
         best = None
         e_val = item[4] if item is not None else None
+        alpha_orig = alpha
 
-        if depth > 1:
+        # bounded tables may have replaced principal item
+        if depth > 1 and item is not None and item[3] is not None:
             principal = item[3] if not symm else board.symm_col(item[3])
             board.push(principal)
             child = -self.principal_explore(board, depth-1, -beta, -alpha)
@@ -65,7 +114,10 @@ class IterativeDeepeningTree(Tree):
             board.pop()
 
             if value >= beta:
-                self.table[board] = (value, False, depth, best, e_val)
+                if self.ordering is not None:
+                    self.ordering.cutoff(board, best, depth)
+                self.table[board] = (value, False, depth,
+                                     board.canonical_col(best), e_val)
                 return value
             alpha = max(value, alpha)
 
@@ -73,38 +125,53 @@ class IterativeDeepeningTree(Tree):
         else:
             open_keys = list(board.open_keys.keys())
 
-        open_keys.sort(key=lambda k: self.get_evaluation(board, k))
+        if self.ordering is not None:
+            open_keys = [k for k in self.ordering.order(board)
+                         if k in open_keys]
+        else:
+            open_keys.sort(key=lambda k: self.get_evaluation(board, k))
 
         for key in open_keys:
             board.push(key)
-            child = -self.explore(board, depth-1, -beta, -alpha)
+            child = self.child_explore(board, depth-1, alpha, beta,
+                                       best is not None)
             if value < child:
                 value = child
                 best = key
             board.pop()
 
             if value >= beta:
-                self.table[board] = (value, False, depth, best, e_val)
+                if self.ordering is not None:
+                    self.ordering.cutoff(board, best, depth)
+                self.table[board] = (value, False, depth,
+                                     board.canonical_col(best), e_val)
                 return value
             alpha = max(value, alpha)
 
-        self.table[board] = (value, True, depth, best, e_val)
+        exact_flag = True if value > alpha_orig else self.upper
+        self.table[board] = (value, exact_flag, depth,
+                             board.canonical_col(best), e_val)
         return value
 
-    def principal_cutoff_test(self, board, depth, beta):
+    def principal_cutoff_test(self, board, depth, beta, alpha=-10000):
         """End explore recursion if board is terminal, depth is reached, or
-        board is transposition or symmetric. Return boolean and item."""
+        board is transposition or symmetric, or in tablebase. Return boolean,
+        item and symmetry of item."""
         symmitem = self.table.get_symm_item(board)
         if symmitem is not None:
             symm, item = symmitem
         else:
             symm = item = None
-        result, item = self.table_test(board, depth, beta, item)
+        result, item = self.table_test(board, depth, beta, item, alpha)
         if result:
             return True, item, symm
         result, item = self.terminal_test(board, item)
         if result:
             return True, item, symm
+        if self.tablebase is not None:
+            result, item = self.tablebase_test(board, item)
+            if result:
+                return True, item, symm
         result, item = self.depth_test(board, depth, item)
         if result:
             return True, item, symm
@@ -115,7 +182,7 @@ class IterativeDeepeningTree(Tree):
         """Add children in depth first procedure. Bookkeep keys, board,
         hash incrementally during visit. Backtrack actions postvisit.
         Check transposition table during expansion."""
-        result, item = self.cutoff_test(board, depth, beta)
+        result, item = self.cutoff_test(board, depth, beta, alpha)
         if result:
             return item[0]
 
@@ -123,45 +190,74 @@ class IterativeDeepeningTree(Tree):
         value = -10001
         best = None
         e_val = item[4] if item is not None else None
+        alpha_orig = alpha
 
-        open_keys = sorted(board.open_keys.keys(),
-                           key=lambda k: self.get_evaluation(board, k))
+        if self.ordering is not None:
+            hash_move = item[3] if item is not None else None
+            if hash_move is not None:
+                hash_move = board.canonical_col(hash_move)
+            open_keys = self.ordering.order(board, hash_move)
+        else:
+            open_keys = sorted(board.open_keys.keys(),
+                               key=lambda k: self.get_evaluation(board, k))
         for key in open_keys:
             board.push(key)
-            child = -self.explore(board, depth-1, -beta, -alpha)
+            child = self.child_explore(board, depth-1, alpha, beta,
+                                       best is not None)
             if value < child:
                 value = child
                 best = key
             board.pop()
 
             if value >= beta:
-                self.table[board] = (value, False, depth, best, e_val)
+                if self.ordering is not None:
+                    self.ordering.cutoff(board, best, depth)
+                self.table[board] = (value, False, depth,
+                                     board.canonical_col(best), e_val)
                 return value
             alpha = max(value, alpha)
 
-        self.table[board] = (value, True, depth, best, e_val)
+        exact_flag = True if value > alpha_orig else self.upper
+        self.table[board] = (value, exact_flag, depth,
+                             board.canonical_col(best), e_val)
         return value
 
+    def child_explore(self, board, depth, alpha, beta, scout):
+        """Return value of pushed child from point of view of parent. If pvs
+        and scout, i.e. not first child, test with null window whether child
+        improves alpha, explore with full window only if so."""
+        if scout and self.pvs:
+            value = -self.explore(board, depth, -alpha-1, -alpha)
+            if not alpha < value < beta:
+                return value
+        return -self.explore(board, depth, -beta, -alpha)
 
-    def cutoff_test(self, board, depth, beta):
+    def cutoff_test(self, board, depth, beta, alpha=-10000):
         """End explore recursion if board is terminal, depth is reached, or
-        board is transposition or symmetric. Return boolean and item."""
+        board is transposition or symmetric, or in tablebase. Return boolean
+        and item."""
         item = self.table[board]
-        result, item = self.table_test(board, depth, beta, item)
+        result, item = self.table_test(board, depth, beta, item, alpha)
         if result:
             return True, item
         result, item = self.terminal_test(board, item)
         if result:
             return True, item
+        if self.tablebase is not None:
+            result, item = self.tablebase_test(board, item)
+            if result:
+                return True, item
         result, item = self.depth_test(board, depth, item)
         if result:
             return True, item
         return False, item
 
-    def table_test(self, board, depth, beta, item):
+    def table_test(self, board, depth, beta, item, alpha=-10000):
         if item is not None:
             value, exact_flag, prev_depth, _, _ = item
-            if prev_depth >= depth and (exact_flag or value >= beta):
+            if prev_depth >= depth and (
+                    exact_flag == self.upper and value <= alpha
+                    or exact_flag == 1 or not exact_flag and value >= beta):
                 return True, item
             else:
                 del self.table[board]
@@ -174,10 +270,22 @@ class IterativeDeepeningTree(Tree):
         self.table[board] = item
         return True, item
 
+    def tablebase_test(self, board, item):
+        """Store exact value of board in tablebase, as if terminal."""
+        result = self.tablebase.probe(board)
+        if result is None:
+            return False, item
+        item = (result * 10000, True, 42, None, None)
+        self.table[board] = item
+        return True, item
+
     def depth_test(self, board, depth, item):
         if depth:
             return False, item
-        e_val = item[4] if item is not None else board.evaluation()
+        if item is not None and item[4] is not None:
+            e_val = item[4]
+        else:
+            e_val = board.evaluation()
         self.table[board] = item = (e_val, False, depth, None, e_val)
         return True, item
 
@@ -200,9 +308,36 @@ class IterativeDeepeningTree(Tree):
 
 
     def most_valuable(self, board):
-        symm, item = self.table.get_symm_item(board)
-        best = item[3] if not symm else board.symm_col(item[3])
-        return [best]
+        """Return list of best col of board: col kept of root, else col of
+        its table item. Items of tablebase have none, then col of best
+        child, see child_value."""
+        if self.root is not None and self.root[0] == board.hash_value:
+            return [self.root[1]]
+        symmitem = self.table.get_symm_item(board)
+        if symmitem is not None and symmitem[1] is not None:
+            symm, item = symmitem
+            if item[3] is not None:
+                return [item[3] if not symm else board.symm_col(item[3])]
+        return [max(list(board.open_keys),
+                    key=lambda col: self.child_value(board, col))]
+
+    def child_value(self, board, col):
+        """Return value of col for player to move by child: utility if
+        terminal, else result of tablebase, else value of table item, else
+        evaluation."""
+        board.push(col)
+        if board.is_terminal():
+            value = self.get_utility(board)
+        else:
+            result = (None if self.tablebase is None
+                      else self.tablebase.probe(board))
+            if result is not None:
+                value = result * 10000
+            else:
+                item = self.table[board]
+                value = item[0] if item is not None else board.evaluation()
+        board.pop()
+        return -value
 
     def norm_value(self, board, value):
         """Return value linearly scaled from 0 to 100. From point of view of
@@ -210,179 +345,206 @@ class IterativeDeepeningTree(Tree):
         switch."""
         return (10000 - value) / 20000
 
-class TimeIterativeDeepeningTree(IterativeDeepeningTree):
-
-    def principal_explore(self, alarm, board, depth, alpha=-10000, beta=10000):
-        result, item, symm = self.principal_cutoff_test(alarm, board, depth, beta)
-        if result:
-            return item[0]
+class SearchStopped(Exception):
+    """Raised inside a search told to stop, unwinding its recursion."""
 
-        # set starting value below alpha cutoff, best key won't remain None
-        value = -10001
-        best = None
-        e_val = item[4] if item is not None else None
+class TimeIterativeDeepeningTree(IterativeDeepeningTree):
+    """
+    Iterative deepening tree stopped by hard deadline of its clock. Clock is
+    checked every check_nodes nodes, then SearchStopped unwinds the search
+    without popping board. Search keeps best key of last completed depth.
+    """
+
+    def __init__(self, board_cls=None, table=None, ordering=None, pvs=False,
+                 aspiration=None, check_nodes=256):
+        super().__init__(board_cls, table, ordering, pvs, aspiration)
+        self.clock = None
+        self.check_nodes = check_nodes
+        self.nodes = 0
+
+    def principal_cutoff_test(self, board, depth, beta, alpha=-10000):
+        self.alarm_test()
+        return super().principal_cutoff_test(board, depth, beta, alpha)
+
+    def cutoff_test(self, board, depth, beta, alpha=-10000):
+        self.alarm_test()
+        return super().cutoff_test(board, depth, beta, alpha)
+
+    def alarm_test(self):
+        """Count node, raise SearchStopped if clock hard deadline passed."""
+        self.nodes += 1
+        if (not self.nodes % self.check_nodes and self.clock is not None
+                and self.clock.hard_expired()):
+            raise SearchStopped
+
+class LazySMPTree(IterativeDeepeningTree):
+    """
+    Iterative deepening tree of one Lazy SMP process. Processes search same
+    root with one SharedTable and cooperate only through its entries. Noise
+    perturbs move order so helper processes diverge. Stop flag of table is
+    checked every 256 nodes.
+    """
+
+    def __init__(self, table, board_cls=None, noise=0):
+        super().__init__(board_cls, table)
+        self.noise = noise
+        self.nodes = 0
+
+    def principal_cutoff_test(self, board, depth, beta, alpha=-10000):
+        self.nodes += 1
+        return super().principal_cutoff_test(board, depth, beta, alpha)
+
+    def cutoff_test(self, board, depth, beta, alpha=-10000):
+        self.nodes += 1
+        if not self.nodes & 255 and self.table.stopped:
+            raise SearchStopped
+        return super().cutoff_test(board, depth, beta, alpha)
 
-        if depth > 1:
-            principal = item[3] if not symm else board.symm_col(item[3])
-            board.push(principal)
-            child = -self.principal_explore(alarm, board, depth-1, -beta, -alpha)
-            if value < child:
-                value = child
-                best = principal
-            board.pop()
+    def get_evaluation(self, board, key):
+        e_val = super().get_evaluation(board, key)
+        if self.noise:
+            return e_val + self.noise * random.random()
+        return e_val
 
-            if value >= beta:
-                self.table[board] = (value, False, depth, best, e_val)
-                return value
-            alpha = max(value, alpha)
+class MonteCarloTree(Tree):
 
-            open_keys = list(board.open_keys.difference((principal,)))
+    # table: value, sims, expanded, [unvisited keys], [children]
+    # children are items linked by col of canonical board, see expand
+
+    check_playouts = 16
+
+    def __init__(self, board_cls=None, playouts=1, heavy=False,
+                 tablebase=None):
+        """Playouts is number of random games simulated from each expanded
+        leaf. More than one are played together by BatchSimulation. Heavy
+        playouts follow tactics, see HeavySimulation. Light playouts on Board
+        reuse one Simulator owned by tree. Playouts reaching tablebase end
+        with its result."""
+        super().__init__(board_cls)
+        if heavy:
+            self.simulation_cls = HeavySimulation
+        elif board_cls is BitBoard:
+            self.simulation_cls = BitSimulation
         else:
-            open_keys = list(board.open_keys)
-
-        open_keys.sort(key=lambda k: self.get_evaluation(board, k))
-
-        for key in open_keys:
-            board.push(key)
-            child = -self.explore(board, depth-1, -beta, -alpha)
-            if value < child:
-                value = child
-                best = key
-            board.pop()
-
-            if value >= beta:
-                self.table[board] = (value, False, depth, best, e_val)
-                return value
-            alpha = max(value, alpha)
-
-        self.table[board] = (value, True, depth, best, e_val)
-        return value
-
-    def principal_cutoff_test(self, alarm, board, depth, beta):
-        """End explore recursion if board is terminal, depth is reached, or
-        board is transposition or symmetric. Return boolean and item."""
-        symmitem = self.table.get_symm_item(board)
-        if symmitem is not None:
-            symm, item = symmitem
+            self.simulation_cls = Simulation
+        if self.simulation_cls is Simulation:
+            self.simulator = Simulator()
         else:
-            symm = item = None
-        if self.alarm_test(alarm):
-            return True, item
-        result, item = self.table_test(board, depth, beta, item)
-        if result:
-            return True, item, symm
-        result, item = self.terminal_test(board, item)
-        if result:
-            return True, item, symm
-        result, item = self.depth_test(board, depth, item)
-        if result:
-            return True, item, symm
-        return False, item, symm
+            self.simulator = None
+        self.playouts = playouts
+        self.tablebase = tablebase
 
-    def explore(self, alarm, board, depth, alpha=-10000, beta=10000):
-        """Add children in depth first procedure. Bookkeep keys, board,
-        hash incrementally during visit. Backtrack actions postvisit.
-        Check transposition table during expansion."""
-        result, item = self.cutoff_test(alarm, board, depth, beta)
-        if result:
-            return item[0]
-
-        # set starting value below alpha cutoff, best key won't remain None
-        value = -10001
-        best = None
-        e_val = item[4] if item is not None else None
-
-        open_keys = sorted(board.open_keys,
-                           key=lambda k: self.get_evaluation(board, k))
-        for key in open_keys:
-            board.push(key)
-            child = -self.explore(alarm, board, depth-1, -beta, -alpha)
-            if value < child:
-                value = child
-                best = key
-            board.pop()
-
-            if value >= beta:
-                self.table[board] = (value, False, depth, best, e_val)
-                return value
-            alpha = max(value, alpha)
-
-        self.table[board] = (value, True, depth, best, e_val)
-        return value
-
-    def cutoff_test(self, alarm, board, depth, beta):
-        """End explore recursion if board is terminal, depth is reached, or
-        board is transposition or symmetric. Return boolean and item."""
-        item = self.table[board]
-        if self.alarm_test(alarm):
-            return True, item
-        result, item = self.table_test(board, depth, beta, item)
-        if result:
-            return True, item
-        result, item = self.terminal_test(board, item)
-        if result:
-            return True, item
-        result, item = self.depth_test(board, depth, item)
-        if result:
-            return True, item
-        return False, item
-
-    def alarm_test(self, alarm):
-        return time.time() > alarm
-
-class MonteCarloTree(Tree):
-
-    # table: value, sims, expanded, [unvisited keys]
-
-    def explore(self, board, iterations):
+    def explore(self, board, iterations, seconds=None):
+        """Run iterations of playouts from board. Stop early after seconds,
+        clock checked every check_playouts playouts."""
         if board not in self.table:
             self.add_child(board)
-        for _ in range(iterations):
+        if seconds is None:
+            for _ in range(iterations):
+                self.playout(board)
+            return
+        deadline = time.perf_counter() + seconds
+        check = self.check_playouts
+        for i in range(1, iterations+1):
             self.playout(board)
+            if not i % check and time.perf_counter() > deadline:
+                return
 
     def playout(self, board, depth=0):
         depth = self.select(board, depth)
         if board.is_terminal():
-            self.back_propogate(board, depth, board.winner)
+            if self.playouts > 1:
+                counts = [0]*3
+                counts[board.winner] = self.playouts
+                self.back_propogate_counts(board, depth, counts)
+            else:
+                self.back_propogate(board, depth, board.winner)
             return
         if not self.expand(board):
             return self.playout(board, depth)
-        winner = Simulation(board).winner
-        self.back_propogate(board, depth+1, winner)
+        if self.playouts > 1:
+            counts = self.simulate_counts(board)
+            self.back_propogate_counts(board, depth+1, counts)
+        else:
+            winner = self.simulate(board)
+            self.back_propogate(board, depth+1, winner)
+
+    def simulate(self, board):
+        """Return winner of one random game from board. Games reaching
+        tablebase end with its result."""
+        if self.simulator is not None:
+            return self.simulator.run(board, self.tablebase)
+        winner = self.tablebase_winner(board)
+        if winner is not None:
+            return winner
+        return self.simulation_cls(board).winner
+
+    def simulate_counts(self, board):
+        """Return list of draws, player 1 wins, player 2 wins of playouts
+        random games from board."""
+        winner = self.tablebase_winner(board)
+        if winner is not None:
+            counts = [0]*3
+            counts[winner] = self.playouts
+            return counts
+        return BatchSimulation(board, self.playouts).counts[0].tolist()
+
+    def tablebase_winner(self, board):
+        """Return winner of board by tablebase, None if not in it."""
+        if self.tablebase is None:
+            return None
+        result = self.tablebase.probe(board)
+        if result is None:
+            return None
+        return 0 if not result else board.turn() if result > 0 else (
+            board.other())
 
     def select(self, board, depth=0):
-        while self.table[board][2]:
-            key = self.bandit(board)
+        """Descend by bandit through expanded nodes, following child links
+        of items. Return depth of leaf."""
+        item = self.table[board]
+        while item[2]:
+            key = self.bandit(board, item)
+            item = item[4][board.canonical_col(key)]
             board.push(key)
             depth += 1
         return depth
 
-    def bandit(self, board):
+    def bandit(self, board, item):
         return random.choice(list(board.open_keys.keys()))
 
     def expand(self, board):
+        """Link children of board in table, until one is new. Leave board
+        pushed to new child and return True. Else mark board expanded."""
         result = False
         symm, item = self.table.get_symm_item(board)
         unvisited_keys = item[3]
+        children = item[4]
 
         while unvisited_keys:
-            key = unvisited_keys.pop()
-            if symm:
-                key = board.symm_col(key)
+            ckey = unvisited_keys.pop()
+            key = board.symm_col(ckey) if symm else ckey
             board.push(key)
-            if board not in self.table:
+            child = self.table[board]
+            if child is None:
                 result = True
                 break
+            # transposition or mirror of linked child
+            children[ckey] = child
             board.pop()
 
         if not unvisited_keys:
             item[2] = True
         if result:
-            self.add_child(board)
+            children[ckey] = self.add_child(board)
         return result
 
     def add_child(self, board):
-        self.table[board] = [0, 0, False, list(board.open_keys.keys())]
+        """Add item of board to table and return it."""
+        item = self.table[board] = [0, 0, False, [board.canonical_col(key)
+                                                  for key in board.open_keys],
+                                    [None]*7]
+        return item
 
     def back_propogate(self, board, depth, winner):
         """Increment win share sims count for ancestors up to explore root.
@@ -408,17 +570,71 @@ class MonteCarloTree(Tree):
             item[0] += 1
             item[1] += 1
 
+    def back_propogate_counts(self, board, depth, counts):
+        """Add win shares and sims of many games to ancestors up to explore
+        root. Counts are number of draws, player 1 wins, player 2 wins."""
+        sims = sum(counts)
+        draws = .5 * counts[0]
+        for _ in range(depth):
+            item = self.table[board]
+            item[0] += counts[board.other()] + draws
+            item[1] += sims
+            board.pop()
+        item = self.table[board]
+        item[0] += counts[board.other()] + draws
+        item[1] += sims
+
+    def prune(self, board):
+        """Keep entries of board and boards linked from it in table, free
+        all others, layers of fewer moves wholesale. Return number of
+        entries before and after."""
+        before = len(self.table)
+        moves = board.moves()
+        for i in range(moves):
+            self.table.clear_moves(i)
+        # map number of moves to ids of reached items
+        reached = [set() for _ in range(43)]
+        item = self.table[board]
+        if item is not None:
+            self.reach(item, moves, reached)
+        for i in range(moves, 43):
+            self.table.retain_items(i, reached[i])
+        return before, len(self.table)
+
+    def reach(self, item, moves, reached):
+        """Add ids of item of board of moves and of items linked from it by
+        children, see expand, to reached. Links are followed level by
+        level, no board is pushed."""
+        reached[moves].add(id(item))
+        level = [item]
+        while level and moves < 42:
+            moves += 1
+            ids = reached[moves]
+            children = []
+            for item in level:
+                for child in item[4]:
+                    if child is not None and id(child) not in ids:
+                        ids.add(id(child))
+                        children.append(child)
+            level = children
+
     def children_key_items(self, board):
         result = []
-        for key in board.open_keys:
+        # push may delete full col from open keys, iterate over copy
+        for key in list(board.open_keys):
             board.push(key)
             item = self.table[board]
-            result.append((key, item[0], item[1]))
+            # children unvisited until parent expanded
+            if item is not None:
+                result.append((key, item[0], item[1]))
             board.pop()
         return result
 
     def children_key_values(self, board):
-        key_items = self.children_key_items(board)
+        return self.items_key_values(self.children_key_items(board))
+
+    def items_key_values(self, key_items):
+        """Return key value pairs from key, wins, sims triples."""
         return [(key, wins/sims) for key, wins, sims in key_items]
 
     def most_valuable(self, board, children_key_values):
@@ -431,23 +647,34 @@ class MonteCarloTree(Tree):
 
 class UpperConfidenceBoundTree(MonteCarloTree):
 
-    def __init__(self, exploration_parameter=sqrt(2)):
-        super().__init__()
+    def __init__(self, exploration_parameter=sqrt(2), board_cls=None,
+                 playouts=1, heavy=False, tablebase=None):
+        super().__init__(board_cls, playouts, heavy, tablebase)
         self.exploration_parameter = exploration_parameter
 
-    def bandit(self, board):
-        parent_sims = self.table[board][1]
-        key_items = self.children_key_items(board)
-        return max(key_items,
-                   key=lambda keyitem:
-                   self.upper_confidence_bound1(*keyitem[1:], parent_sims))[0]
+    def bandit(self, board, item):
+        """Return open key of child of greatest upper confidence bound, from
+        stats of linked children."""
+        children = item[4]
+        c = self.exploration_parameter
+        log_parent = log(item[1])
+        symm = board.hash_value != board.canonical_value
+        best = None
+        best_value = -1
+        for key in board.open_keys:
+            child = children[6 - key if symm else key]
+            child_sims = child[1]
+            value = child[0] / child_sims + c * sqrt(log_parent / child_sims)
+            if value > best_value:
+                best_value = value
+                best = key
+        return best
 
     def upper_confidence_bound1(self, child_wins, child_sims, parent_sims):
         return (child_wins/child_sims + self.exploration_parameter *
                 sqrt(log(parent_sims)/child_sims))
 
-    def children_key_values(self, board):
-        key_items = self.children_key_items(board)
+    def items_key_values(self, key_items):
         return [(key, sims) for key, wins, sims in key_items]
 
     def most_valuable(self, board, children_key_values):
@@ -458,3 +685,433 @@ class UpperConfidenceBoundTree(MonteCarloTree):
     def norm_value(self, board, value):
         parent_sims = self.table[board][1]
         return 100*(value / parent_sims)
+
+class RaveUpperConfidenceBoundTree(UpperConfidenceBoundTree):
+    """
+    UCT with rapid action value estimates. Items also keep all moves as
+    first stats of each key of canonical board: playouts through board in
+    which player to move played key at any later move, and win shares of
+    player. Keys, not cols, as a col played later fills another key. Bandit
+    blends child value with stats of key of col, weight decaying as child
+    sims grow past equivalence.
+    """
+
+    # table: value, sims, expanded, [unvisited keys], [children],
+    #        [amaf win shares by key], [amaf sims by key]
+
+    def __init__(self, exploration_parameter=sqrt(2), board_cls=None,
+                 equivalence=100, tablebase=None):
+        """Playouts are single runs of Simulator, its values give keys
+        played."""
+        super().__init__(exploration_parameter, board_cls,
+                         tablebase=tablebase)
+        self.simulation_cls = Simulation
+        self.simulator = Simulator()
+        self.equivalence = equivalence
+
+    def add_child(self, board):
+        item = super().add_child(board)
+        item.extend(([0]*42, [0]*42))
+        return item
+
+    def playout(self, board, depth=0):
+        depth = self.select(board, depth)
+        # map player number to keys played in simulation
+        keys_played = [None, set(), set()]
+        if board.is_terminal():
+            winner = board.winner
+        elif not self.expand(board):
+            return self.playout(board, depth)
+        else:
+            depth += 1
+            winner = self.simulate(board)
+            values = self.simulator.values
+            for keys in board.open_keys.values():
+                for key in keys:
+                    if values[key]:
+                        keys_played[values[key]].add(key)
+        self.back_propogate_amaf(board, depth, winner, keys_played)
+
+    def back_propogate_amaf(self, board, depth, winner, keys_played):
+        """Back propagate winner as in back_propogate. Also add playout to
+        amaf stats of each ancestor, for keys played after it by player to
+        move, in tree and in simulation."""
+        for i in range(depth + 1):
+            item = self.table[board]
+            other = board.other()
+            item[0] += 1 if winner == other else .5 if not winner else 0
+            item[1] += 1
+            turn = 3 - other
+            share = 1 if winner == turn else .5 if not winner else 0
+            symm = board.hash_value != board.canonical_value
+            amaf_wins = item[5]
+            amaf_sims = item[6]
+            for key in keys_played[turn]:
+                if symm:
+                    # reflect key, same row
+                    key = 36 - key + 2 * (key % 6)
+                amaf_wins[key] += share
+                amaf_sims[key] += 1
+            if i < depth:
+                keys_played[other].add(board.last_key())
+                board.pop()
+
+    def bandit(self, board, item):
+        """Return open key of child of greatest upper confidence bound, on
+        child value blended with amaf value of key played at col."""
+        children, amaf_wins, amaf_sims = item[4:7]
+        c = self.exploration_parameter
+        k = self.equivalence
+        log_parent = log(item[1])
+        symm = board.hash_value != board.canonical_value
+        best = None
+        best_value = -1
+        open_keys = board.open_keys
+        for key in open_keys:
+            col = 6 - key if symm else key
+            child = children[col]
+            child_sims = child[1]
+            value = child[0] / child_sims
+            cell = 6 * col + open_keys[key][-1] % 6
+            if amaf_sims[cell]:
+                beta = sqrt(k / (3 * child_sims + k))
+                value += beta * (amaf_wins[cell] / amaf_sims[cell] - value)
+            value += c * sqrt(log_parent / child_sims)
+            if value > best_value:
+                best_value = value
+                best = key
+        return best
+
+class PoolMonteCarloTree(MonteCarloTree):
+    """
+    Monte Carlo tree with nodes in a NodePool. Parents link children, so
+    descent follows links, keeps path of node indices, and back propagation
+    updates columns along path without table lookups.
+    """
+
+    def __init__(self, board_cls=None, playouts=1, capacity=2**16,
+                 tablebase=None):
+        MonteCarloTree.__init__(self, board_cls, playouts,
+                                tablebase=tablebase)
+        self.table_cls = NodePool
+        self.table = NodePool(capacity)
+
+    def add_child(self, board):
+        return self.table.add(board)
+
+    def playout(self, board, depth=0):
+        pool = self.table
+        path = [pool.find(board)]
+        while True:
+            node = path[-1]
+            while pool.expanded[node]:
+                col = self.bandit(board, node)
+                node = pool.child(board, node, col)
+                board.push(col)
+                path.append(node)
+            if board.is_terminal():
+                break
+            child = self.expand(board, node)
+            if child >= 0:
+                path.append(child)
+                break
+        if board.is_terminal():
+            counts = [0]*3
+            counts[board.winner] = self.playouts
+        elif self.playouts > 1:
+            counts = self.simulate_counts(board)
+        else:
+            counts = [0]*3
+            counts[self.simulate(board)] = 1
+        self.back_propogate_path(board, path, counts)
+
+    def bandit(self, board, node):
+        return random.choice(list(board.open_keys))
+
+    def expand(self, board, node):
+        """Link unlinked children of node, until one is new to pool. Leave
+        board pushed to new child and return its index. Else mark node
+        expanded, return -1."""
+        pool = self.table
+        for col in list(board.open_keys):
+            if pool.child(board, node, col) != pool.unlinked:
+                continue
+            board.push(col)
+            child = pool.find(board)
+            if child < 0:
+                child = pool.add(board)
+                board.pop()
+                pool.link(board, node, col, child)
+                board.push(col)
+                return child
+            board.pop()
+            pool.link(board, node, col, child)
+        pool.expanded[node] = 1
+        return -1
+
+    def back_propogate_path(self, board, path, counts):
+        """Add win shares and sims of counts to nodes of path from explore
+        root to board, popping board back to root. Counts are number of
+        draws, player 1 wins, player 2 wins."""
+        wins = self.table.wins
+        sims_column = self.table.sims
+        sims = sum(counts)
+        draws = .5 * counts[0]
+        # pov of player to move into node
+        shares = (counts[2 - board.moves() % 2] + draws,
+                  counts[1 + board.moves() % 2] + draws)
+        for i, node in enumerate(reversed(path)):
+            wins[node] += shares[i % 2]
+            sims_column[node] += sims
+        for _ in range(len(path) - 1):
+            board.pop()
+
+    def prune(self, board):
+        """Keep node of board and nodes reachable from it in pool. Return
+        number of nodes before and after."""
+        before = len(self.table)
+        node = self.table.find(board)
+        if node < 0:
+            self.table = NodePool()
+        else:
+            self.table.retain(node)
+        return before, len(self.table)
+
+    def children_key_items(self, board):
+        pool = self.table
+        node = pool.find(board)
+        result = []
+        for key in sorted(board.open_keys):
+            child = pool.child(board, node, key)
+            if child >= 0:
+                result.append((key, pool.wins[child], pool.sims[child]))
+        return result
+
+class PoolUpperConfidenceBoundTree(PoolMonteCarloTree,
+                                   UpperConfidenceBoundTree):
+
+    def __init__(self, exploration_parameter=sqrt(2), board_cls=None,
+                 playouts=1, capacity=2**16, tablebase=None):
+        PoolMonteCarloTree.__init__(self, board_cls, playouts, capacity,
+                                    tablebase)
+        self.exploration_parameter = exploration_parameter
+
+    def bandit(self, board, node):
+        pool = self.table
+        wins = pool.wins
+        sims = pool.sims
+        children = pool.children
+        c = self.exploration_parameter
+        log_parent = log(sims[node])
+        symm = board.hash_value != board.canonical_value
+        best = None
+        best_value = -1
+        for col in board.open_keys:
+            child = children[7 * node + (6 - col if symm else col)]
+            child_sims = sims[child]
+            value = (wins[child] / child_sims
+                     + c * sqrt(log_parent / child_sims))
+            if value > best_value:
+                best_value = value
+                best = col
+        return best
+
+    def norm_value(self, board, value):
+        return 100 * value / self.table.sims[self.table.find(board)]
+
+class SolverTree(Tree):
+
+    # Solve positions exactly on bitboards as in BitBoard. Score of position
+    # is positive if current player wins, 22 less number of current player
+    # stones at win, e.g. 1 for win with last stone. Negative if opponent
+    # wins, 0 for draw.
+
+    # table: scores of children by col, None if col full
+
+    bottom_mask = BitBoard.bottom_mask
+    board_mask = BitBoard.board_mask
+    # center cols first, cutoffs tend to occur earlier
+    col_order = (3, 2, 4, 1, 5, 0, 6)
+    col_masks = [63 << 7*col for col in col_order]
+    min_score = -18
+    max_score = 18
+
+    def __init__(self, exact_children=False, max_bounds=4194301):
+        """Explore solves board, then finds children of equal score by null
+        window searches. Other children get upper bound of score, or exact
+        score if exact children. Bounds of bitboard keys are encoded upper
+        or lower bounds of score, in preallocated arrays of max bounds slots,
+        9 bytes each. Key modulo max bounds, a prime, is its slot, always
+        replaced. Bounds are exact, kept between searches."""
+        super().__init__()
+        self.exact_children = exact_children
+        self.keys = array('q', [0]) * max_bounds
+        self.bounds = array('b', [0]) * max_bounds
+        self.max_bounds = max_bounds
+        self.nodes = 0
+
+    def explore(self, board):
+        """Solve board and children of board. Store scores in table."""
+        if board in self.table:
+            return
+        scores = [None]*7
+        if board.is_terminal():
+            self.table[board] = scores
+            return
+        position, mask = board.bitboards()
+        moves = board.moves()
+        score = self.solve(position, mask, moves)
+        wins = self.winning_position(position, mask)
+        for col in board.open_keys:
+            move = (mask + self.bottom_mask) & (63 << 7*col)
+            if wins & move:
+                scores[col] = (43 - moves) // 2
+            elif moves == 41:
+                scores[col] = 0
+            elif self.exact_children:
+                scores[col] = -self.solve(position ^ mask, mask | move,
+                                          moves + 1)
+            else:
+                bound = -self.search(position ^ mask, mask | move, moves + 1,
+                                     -score, -score + 1)
+                scores[col] = score if bound >= score else bound
+        self.table[board] = [scores[board.canonical_col(col)]
+                             for col in range(7)]
+
+    def search(self, position, mask, moves, alpha, beta):
+        """Return negamax score of position, which may be won next move."""
+        if self.winning_position(position, mask) & self.possible(mask):
+            return (43 - moves) // 2
+        return self.negamax(position, mask, moves, alpha, beta)
+
+    def solve(self, position, mask, moves):
+        """Return score of position by null window searches, narrowing range
+        of score until exact."""
+        if self.winning_position(position, mask) & self.possible(mask):
+            return (43 - moves) // 2
+        low = -((42 - moves) // 2)
+        high = (43 - moves) // 2
+        while low < high:
+            med = low + (high - low) // 2
+            # search near 0 first, then near low or high
+            if med <= 0 and int(low / 2) < med:
+                med = int(low / 2)
+            elif med >= 0 and int(high / 2) > med:
+                med = int(high / 2)
+            score = self.negamax(position, mask, moves, med, med + 1)
+            if score <= med:
+                high = score
+            else:
+                low = score
+        return low
+
+    def negamax(self, position, mask, moves, alpha, beta):
+        """Return score of position if between alpha and beta, else bound
+        beyond them. Current player cannot win with next move."""
+        self.nodes += 1
+        moves_mask = self.non_losing_moves(position, mask)
+        if not moves_mask:
+            return -((42 - moves) // 2)
+        if moves >= 40:
+            return 0
+
+        low = -((40 - moves) // 2)
+        if alpha < low:
+            alpha = low
+            if alpha >= beta:
+                return alpha
+        high = (41 - moves) // 2
+
+        key = position + mask
+        # zero bound is an empty slot
+        slot = key % self.max_bounds
+        bound = self.bounds[slot] if self.keys[slot] == key else 0
+        if bound:
+            if bound > self.max_score - self.min_score + 1:
+                low = bound + 2*self.min_score - self.max_score - 2
+                if alpha < low:
+                    alpha = low
+                    if alpha >= beta:
+                        return alpha
+            else:
+                high = bound + self.min_score - 1
+        if beta > high:
+            beta = high
+            if alpha >= beta:
+                return beta
+
+        # sort by number of winning positions created, center first on ties
+        if moves_mask & (moves_mask - 1):
+            winning_position = self.winning_position
+            children = []
+            for col_mask in self.col_masks:
+                move = moves_mask & col_mask
+                if move:
+                    count = winning_position(position | move,
+                                             mask).bit_count()
+                    children.append((-count, len(children), move))
+            children.sort()
+            children = [move for _, _, move in children]
+        else:
+            children = (moves_mask,)
+
+        opponent = position ^ mask
+        for move in children:
+            score = -self.negamax(opponent, mask | move, moves + 1,
+                                  -beta, -alpha)
+            if score >= beta:
+                self.keys[slot] = key
+                self.bounds[slot] = (score + self.max_score
+                                     - 2*self.min_score + 2)
+                return score
+            if score > alpha:
+                alpha = score
+        self.keys[slot] = key
+        self.bounds[slot] = alpha - self.min_score + 1
+        return alpha
+
+    def possible(self, mask):
+        """Return bits of open keys playable next."""
+        return (mask + self.bottom_mask) & self.board_mask
+
+    def non_losing_moves(self, position, mask):
+        """Return bits of playable keys not losing next move. Return 0 if
+        every key loses."""
+        possible = self.possible(mask)
+        opponent_wins = self.winning_position(position ^ mask, mask)
+        forced = possible & opponent_wins
+        if forced:
+            # more than one forced key, cannot block both
+            if forced & (forced - 1):
+                return 0
+            possible = forced
+        # avoid key below opponent winning key
+        return possible & ~(opponent_wins >> 1)
+
+    winning_position = staticmethod(BitBoard.threats)
+
+    def children_key_values(self, board):
+        scores = self.table[board]
+        return [(col, scores[board.canonical_col(col)])
+                for col in sorted(board.open_keys)]
+
+    def most_valuable(self, board, children_key_values=None):
+        if children_key_values is None:
+            children_key_values = self.children_key_values(board)
+        max_value = max(value for _, value in children_key_values)
+        return [key for key, value in children_key_values
+                if value == max_value]
+
+    def norm_value(self, board, value):
+        """Return score scaled from 0 to 100, 50 for draw."""
+        return 50 + 50 * value / 21
+
+    def distance(self, board, score):
+        """Return number of moves from board to win or loss of given score,
+        None for draw."""
+        moves = board.moves()
+        if score > 0:
+            return 42 - 2*score + moves % 2 - moves + 1
+        if score < 0:
+            return 42 + 2*score + (moves + 1) % 2 - moves + 1
+        return None